@@ -5,6 +5,7 @@ import os
 from routes import auth_routes, semester_routes, class_routes, subject_routes, assignment_routes, solution_routes, submission_routes, grade_routes
 from models.database import supabase
 from config import get_config
+from utils import http_response
 
 # โหลดค่ากำหนด
 config = get_config()
@@ -27,6 +28,9 @@ app.register_blueprint(solution_routes.bp)
 app.register_blueprint(submission_routes.bp)
 app.register_blueprint(grade_routes.bp)
 
+# ใส่ ETag ตอบ 304 และบีบอัด response แบบ JSON ของทุก API
+http_response.init_app(app)
+
 # หน้าหลัก
 @app.route('/')
 def index():
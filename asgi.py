@@ -0,0 +1,24 @@
+# grading_assistant/asgi.py
+# โหมด ASGI: route ตรวจงานทำงานแบบ async ส่วน route อื่นทั้งหมดใช้ Flask app เดิมผ่าน WsgiToAsgi
+# รันด้วย: uvicorn asgi:application --host 0.0.0.0 --port 5000
+import contextlib
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from app import app as flask_app
+from routes import async_grading_routes
+from services.async_http_client import async_lmstudio_client
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    # ปิด connection ที่ค้างอยู่กับ LMStudio เมื่อหยุดการทำงาน
+    await async_lmstudio_client.aclose()
+
+application = Starlette(
+    routes=[
+        *async_grading_routes.routes,
+        Mount('/', app=WsgiToAsgi(flask_app))
+    ],
+    lifespan=lifespan
+)
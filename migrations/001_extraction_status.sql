@@ -0,0 +1,15 @@
+-- grading_assistant/migrations/001_extraction_status.sql
+-- สถานะการดึงข้อความจากไฟล์ของคำตอบและเฉลย (pending, done, failed)
+-- แถวเดิมมีข้อความอยู่แล้ว จึงใช้ค่าเริ่มต้นเป็น done
+
+ALTER TABLE submissions
+    ADD COLUMN IF NOT EXISTS extraction_status TEXT NOT NULL DEFAULT 'done',
+    ADD COLUMN IF NOT EXISTS extraction_error TEXT;
+
+ALTER TABLE solutions
+    ADD COLUMN IF NOT EXISTS extraction_status TEXT NOT NULL DEFAULT 'done',
+    ADD COLUMN IF NOT EXISTS extraction_error TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_submissions_pending_extracted
+    ON submissions (assignment_id, user_id)
+    WHERE status = 'pending' AND extraction_status = 'done';
@@ -0,0 +1,80 @@
+-- grading_assistant/migrations/002_grade_statistics.sql
+-- สถิติคะแนนตามงานหรือตามนักเรียน คำนวณในฐานข้อมูลและส่งกลับเป็น JSON ขนาดคงที่ในการเรียกครั้งเดียว
+-- เรียกผ่าน PostgREST: supabase.rpc('grade_statistics', {...})
+
+CREATE INDEX IF NOT EXISTS idx_submissions_user_assignment ON submissions (user_id, assignment_id);
+CREATE INDEX IF NOT EXISTS idx_submissions_user_student ON submissions (user_id, student_id);
+CREATE INDEX IF NOT EXISTS idx_grades_submission ON grades (submission_id);
+
+CREATE OR REPLACE FUNCTION grade_statistics(
+    p_user_id uuid,
+    p_assignment_id uuid DEFAULT NULL,
+    p_student_id text DEFAULT NULL,
+    p_buckets integer DEFAULT 10
+) RETURNS json
+LANGUAGE sql
+STABLE
+AS $$
+    WITH scoped AS (
+        SELECT s.id, s.status, a.total_score
+        FROM submissions s
+        JOIN assignments a ON a.id = s.assignment_id
+        WHERE s.user_id = p_user_id
+          AND (p_assignment_id IS NULL OR s.assignment_id = p_assignment_id)
+          AND (p_student_id IS NULL OR s.student_id = p_student_id)
+    ),
+    scores AS (
+        SELECT g.score, sc.total_score
+        FROM grades g
+        JOIN scoped sc ON sc.id = g.submission_id
+        WHERE sc.status IN ('graded', 'approved')
+    ),
+    counts AS (
+        SELECT count(*) AS total_submissions,
+               count(*) FILTER (WHERE status IN ('graded', 'approved')) AS graded_submissions,
+               count(*) FILTER (WHERE status = 'approved') AS approved_submissions
+        FROM scoped
+    ),
+    aggregates AS (
+        SELECT coalesce(avg(score), 0) AS avg_score,
+               coalesce(max(score), 0) AS max_score,
+               coalesce(min(score), 0) AS min_score,
+               coalesce(stddev_pop(score), 0) AS stddev_score,
+               percentile_cont(ARRAY[0.25, 0.5, 0.75, 0.9]) WITHIN GROUP (ORDER BY score) AS percentiles
+        FROM scores
+    ),
+    -- ช่วงของ histogram คิดเป็นร้อยละของคะแนนเต็ม เพื่อให้รวมงานที่คะแนนเต็มต่างกันได้
+    histogram AS (
+        SELECT greatest(least(width_bucket(score / total_score * 100, 0, 100, p_buckets), p_buckets), 1) AS bucket,
+               count(*) AS count
+        FROM scores
+        WHERE total_score > 0
+        GROUP BY 1
+    )
+    SELECT json_build_object(
+        'total_submissions', c.total_submissions,
+        'graded_submissions', c.graded_submissions,
+        'approved_submissions', c.approved_submissions,
+        'avg_score', a.avg_score,
+        'max_score', a.max_score,
+        'min_score', a.min_score,
+        'stddev_score', a.stddev_score,
+        'percentiles', json_build_object(
+            'p25', coalesce(a.percentiles[1], 0),
+            'p50', coalesce(a.percentiles[2], 0),
+            'p75', coalesce(a.percentiles[3], 0),
+            'p90', coalesce(a.percentiles[4], 0)
+        ),
+        'percentiles_approximate', false,
+        'histogram', (
+            SELECT json_agg(json_build_object(
+                       'from_percent', (b - 1) * 100.0 / p_buckets,
+                       'to_percent', b * 100.0 / p_buckets,
+                       'count', coalesce(h.count, 0)
+                   ) ORDER BY b)
+            FROM generate_series(1, p_buckets) AS b
+            LEFT JOIN histogram h ON h.bucket = b
+        )
+    )
+    FROM counts c, aggregates a;
+$$;
@@ -0,0 +1,282 @@
+-- grading_assistant/migrations/003_assignment_statistics.sql
+-- สถิติของแต่ละงานที่คำนวณไว้ล่วงหน้า และอัปเดตทีละส่วนด้วย trigger ทุกครั้งที่คะแนนหรือสถานะของงานที่ส่งเปลี่ยน
+-- นับเฉพาะคะแนนของงานที่ส่งที่มีสถานะ graded หรือ approved เหมือน RPC grade_statistics
+-- ทำให้ /api/grades/statistics?assignment_id=... อ่านข้อมูลเพียงแถวเดียว
+-- ถ้าค่าคลาดเคลื่อน ให้สร้างใหม่ด้วย SELECT rebuild_assignment_statistics(); หรือ python -m services.statistics_service --rebuild
+
+CREATE TABLE IF NOT EXISTS assignment_statistics (
+    assignment_id uuid PRIMARY KEY REFERENCES assignments (id) ON DELETE CASCADE,
+    user_id uuid NOT NULL,
+    total_score numeric NOT NULL DEFAULT 0,
+    pending_submissions integer NOT NULL DEFAULT 0,
+    graded_submissions integer NOT NULL DEFAULT 0,
+    approved_submissions integer NOT NULL DEFAULT 0,
+    score_count integer NOT NULL DEFAULT 0,
+    score_sum numeric NOT NULL DEFAULT 0,
+    score_sum_sq numeric NOT NULL DEFAULT 0,
+    score_min numeric,
+    score_max numeric,
+    -- จำนวนคะแนนในแต่ละช่วง 10% ของคะแนนเต็ม
+    histogram integer[] NOT NULL DEFAULT array_fill(0, ARRAY[10]),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_assignment_statistics_user ON assignment_statistics (user_id);
+
+-- ช่วงของ histogram (1-10) ของคะแนน หรือ NULL ถ้าคะแนนเต็มไม่ถูกต้อง
+CREATE OR REPLACE FUNCTION assignment_statistics_bucket(p_score numeric, p_total_score numeric)
+RETURNS integer
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE WHEN p_total_score > 0
+        THEN greatest(least(width_bucket(p_score / p_total_score * 100, 0, 100, 10), 10), 1)
+    END;
+$$;
+
+-- สร้างแถวสถิติของงานถ้ายังไม่มี
+CREATE OR REPLACE FUNCTION assignment_statistics_ensure(p_assignment_id uuid)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO assignment_statistics (assignment_id, user_id, total_score)
+    SELECT a.id, a.user_id, coalesce(a.total_score, 0)
+    FROM assignments a
+    WHERE a.id = p_assignment_id
+    ON CONFLICT (assignment_id) DO NOTHING;
+$$;
+
+-- สร้างสถิติใหม่ทั้งหมดจากข้อมูลจริง (ทุกงาน หรือเฉพาะงานที่ระบุ) และคืนจำนวนงานที่สร้างใหม่
+CREATE OR REPLACE FUNCTION rebuild_assignment_statistics(p_assignment_id uuid DEFAULT NULL)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    rebuilt integer;
+BEGIN
+    INSERT INTO assignment_statistics AS st (
+        assignment_id, user_id, total_score,
+        pending_submissions, graded_submissions, approved_submissions,
+        score_count, score_sum, score_sum_sq, score_min, score_max, histogram, updated_at
+    )
+    SELECT a.id, a.user_id, coalesce(a.total_score, 0),
+           coalesce(sub.pending, 0), coalesce(sub.graded, 0), coalesce(sub.approved, 0),
+           coalesce(gr.score_count, 0), coalesce(gr.score_sum, 0), coalesce(gr.score_sum_sq, 0),
+           gr.score_min, gr.score_max,
+           ARRAY(
+               SELECT count(g.score)::integer
+               FROM generate_series(1, 10) AS b
+               LEFT JOIN grades g
+                   ON g.submission_id IN (
+                       SELECT s.id FROM submissions s
+                       WHERE s.assignment_id = a.id AND s.status IN ('graded', 'approved')
+                   )
+                  AND assignment_statistics_bucket(g.score, a.total_score) = b
+               GROUP BY b
+               ORDER BY b
+           ),
+           now()
+    FROM assignments a
+    LEFT JOIN LATERAL (
+        SELECT count(*) FILTER (WHERE s.status = 'pending') AS pending,
+               count(*) FILTER (WHERE s.status = 'graded') AS graded,
+               count(*) FILTER (WHERE s.status = 'approved') AS approved
+        FROM submissions s
+        WHERE s.assignment_id = a.id
+    ) sub ON true
+    LEFT JOIN LATERAL (
+        SELECT count(g.score) AS score_count, sum(g.score) AS score_sum, sum(g.score * g.score) AS score_sum_sq,
+               min(g.score) AS score_min, max(g.score) AS score_max
+        FROM grades g
+        JOIN submissions s ON s.id = g.submission_id
+        WHERE s.assignment_id = a.id AND s.status IN ('graded', 'approved')
+    ) gr ON true
+    WHERE p_assignment_id IS NULL OR a.id = p_assignment_id
+    ON CONFLICT (assignment_id) DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        total_score = EXCLUDED.total_score,
+        pending_submissions = EXCLUDED.pending_submissions,
+        graded_submissions = EXCLUDED.graded_submissions,
+        approved_submissions = EXCLUDED.approved_submissions,
+        score_count = EXCLUDED.score_count,
+        score_sum = EXCLUDED.score_sum,
+        score_sum_sq = EXCLUDED.score_sum_sq,
+        score_min = EXCLUDED.score_min,
+        score_max = EXCLUDED.score_max,
+        histogram = EXCLUDED.histogram,
+        updated_at = EXCLUDED.updated_at;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$;
+
+-- เพิ่ม (p_sign = 1) หรือลบ (p_sign = -1) คะแนนหนึ่งรายการออกจากสถิติของงานที่ระบุ
+CREATE OR REPLACE FUNCTION assignment_statistics_apply_assignment_score(p_assignment_id uuid, p_score numeric, p_sign integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_bucket integer;
+    v_stats assignment_statistics%ROWTYPE;
+BEGIN
+    -- ข้ามเมื่องานถูกลบไปแล้ว (แถวสถิติของงานจะถูกลบตามด้วย cascade)
+    IF p_score IS NULL OR NOT EXISTS (SELECT 1 FROM assignments WHERE id = p_assignment_id) THEN
+        RETURN;
+    END IF;
+
+    PERFORM assignment_statistics_ensure(p_assignment_id);
+    SELECT * INTO v_stats FROM assignment_statistics WHERE assignment_id = p_assignment_id FOR UPDATE;
+    v_bucket := assignment_statistics_bucket(p_score, v_stats.total_score);
+
+    UPDATE assignment_statistics SET
+        score_count = score_count + p_sign,
+        score_sum = score_sum + p_sign * p_score,
+        score_sum_sq = score_sum_sq + p_sign * p_score * p_score,
+        score_min = CASE WHEN p_sign > 0 THEN least(score_min, p_score) ELSE score_min END,
+        score_max = CASE WHEN p_sign > 0 THEN greatest(score_max, p_score) ELSE score_max END,
+        histogram = CASE WHEN v_bucket IS NULL THEN histogram
+                         ELSE histogram[1:v_bucket - 1] || (histogram[v_bucket] + p_sign) || histogram[v_bucket + 1:10] END,
+        updated_at = now()
+    WHERE assignment_id = p_assignment_id;
+
+    -- ค่าต่ำสุดและสูงสุดลดทีละส่วนไม่ได้ จึงคำนวณใหม่เฉพาะเมื่อคะแนนที่ลบเป็นค่าขอบ
+    IF p_sign < 0 AND (p_score <= v_stats.score_min OR p_score >= v_stats.score_max) THEN
+        UPDATE assignment_statistics st SET (score_min, score_max) = (
+            SELECT min(g.score), max(g.score)
+            FROM grades g
+            JOIN submissions s ON s.id = g.submission_id
+            WHERE s.assignment_id = p_assignment_id AND s.status IN ('graded', 'approved')
+        )
+        WHERE st.assignment_id = p_assignment_id;
+    END IF;
+END;
+$$;
+
+-- เพิ่มหรือลบคะแนนหนึ่งรายการของงานที่ส่ง เฉพาะเมื่องานที่ส่งนั้นตรวจแล้ว (graded หรือ approved)
+-- คะแนนของงานที่ส่งที่ยังไม่ตรวจจะถูกนับเมื่อสถานะเปลี่ยนใน assignment_statistics_on_submission
+CREATE OR REPLACE FUNCTION assignment_statistics_apply_score(p_submission_id uuid, p_score numeric, p_sign integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_assignment_id uuid;
+BEGIN
+    SELECT s.assignment_id INTO v_assignment_id
+    FROM submissions s
+    WHERE s.id = p_submission_id AND s.status IN ('graded', 'approved');
+    IF v_assignment_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    PERFORM assignment_statistics_apply_assignment_score(v_assignment_id, p_score, p_sign);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION assignment_statistics_on_grade()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM assignment_statistics_apply_score(OLD.submission_id, OLD.score, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM assignment_statistics_apply_score(NEW.submission_id, NEW.score, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION assignment_statistics_on_submission()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_old_counted boolean;
+    v_new_counted boolean;
+    v_grade record;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE assignment_statistics SET
+            pending_submissions = pending_submissions - (OLD.status = 'pending')::integer,
+            graded_submissions = graded_submissions - (OLD.status = 'graded')::integer,
+            approved_submissions = approved_submissions - (OLD.status = 'approved')::integer,
+            updated_at = now()
+        WHERE assignment_id = OLD.assignment_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM assignment_statistics_ensure(NEW.assignment_id);
+        UPDATE assignment_statistics SET
+            pending_submissions = pending_submissions + (NEW.status = 'pending')::integer,
+            graded_submissions = graded_submissions + (NEW.status = 'graded')::integer,
+            approved_submissions = approved_submissions + (NEW.status = 'approved')::integer,
+            updated_at = now()
+        WHERE assignment_id = NEW.assignment_id;
+    END IF;
+
+    -- ย้ายคะแนนของงานที่ส่งเข้าหรือออกจากสถิติเมื่อสถานะหรืองานเปลี่ยน
+    -- (การลบงานที่ส่งไม่ต้องทำ เพราะคะแนนถูกลบไปแล้วใน assignment_statistics_before_submission_delete)
+    IF TG_OP = 'UPDATE' THEN
+        v_old_counted := OLD.status IN ('graded', 'approved');
+        v_new_counted := NEW.status IN ('graded', 'approved');
+        IF v_old_counted IS DISTINCT FROM v_new_counted OR OLD.assignment_id IS DISTINCT FROM NEW.assignment_id THEN
+            FOR v_grade IN SELECT g.score FROM grades g WHERE g.submission_id = NEW.id LOOP
+                IF v_old_counted THEN
+                    PERFORM assignment_statistics_apply_assignment_score(OLD.assignment_id, v_grade.score, -1);
+                END IF;
+                IF v_new_counted THEN
+                    PERFORM assignment_statistics_apply_assignment_score(NEW.assignment_id, v_grade.score, 1);
+                END IF;
+            END LOOP;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- ลบคะแนนของงานที่ส่งก่อนลบงานที่ส่ง เพื่อให้ trigger ของ grades ยังหางานของคะแนนนั้นได้
+-- (ถ้าปล่อยให้ cascade ลบคะแนนหลังจากลบงานที่ส่งแล้ว สถิติของคะแนนจะไม่ถูกลบออก)
+CREATE OR REPLACE FUNCTION assignment_statistics_before_submission_delete()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM grades WHERE submission_id = OLD.id;
+    RETURN OLD;
+END;
+$$;
+
+-- คะแนนเต็มที่เปลี่ยนทำให้ช่วงของ histogram เปลี่ยน จึงสร้างสถิติของงานนั้นใหม่
+CREATE OR REPLACE FUNCTION assignment_statistics_on_assignment()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM rebuild_assignment_statistics(NEW.id);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS grades_assignment_statistics ON grades;
+CREATE TRIGGER grades_assignment_statistics
+    AFTER INSERT OR DELETE OR UPDATE OF score, submission_id ON grades
+    FOR EACH ROW EXECUTE FUNCTION assignment_statistics_on_grade();
+
+DROP TRIGGER IF EXISTS submissions_assignment_statistics ON submissions;
+CREATE TRIGGER submissions_assignment_statistics
+    AFTER INSERT OR DELETE OR UPDATE OF status, assignment_id ON submissions
+    FOR EACH ROW EXECUTE FUNCTION assignment_statistics_on_submission();
+
+DROP TRIGGER IF EXISTS submissions_delete_grades_assignment_statistics ON submissions;
+CREATE TRIGGER submissions_delete_grades_assignment_statistics
+    BEFORE DELETE ON submissions
+    FOR EACH ROW EXECUTE FUNCTION assignment_statistics_before_submission_delete();
+
+DROP TRIGGER IF EXISTS assignments_assignment_statistics ON assignments;
+CREATE TRIGGER assignments_assignment_statistics
+    AFTER UPDATE OF total_score ON assignments
+    FOR EACH ROW WHEN (OLD.total_score IS DISTINCT FROM NEW.total_score)
+    EXECUTE FUNCTION assignment_statistics_on_assignment();
+
+SELECT rebuild_assignment_statistics();
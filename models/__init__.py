@@ -3,4 +3,4 @@
 โมดูลสำหรับโมเดลข้อมูลและการเชื่อมต่อกับฐานข้อมูล
 """
 # เปิดใช้งานการ import ทั้งหมดจากโมดูลนี้
-__all__ = ['database', 'vector_db']
\ No newline at end of file
+__all__ = ['database', 'vector_db', 'vector_backends']
\ No newline at end of file
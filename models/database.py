@@ -17,25 +17,46 @@ class SupabaseModel:
     """
     คลาสพื้นฐานสำหรับโมเดลที่ทำงานกับ Supabase
     """
+    # คอลัมน์ที่ใช้ในหน้ารายการ (ไม่รวมข้อความขนาดใหญ่ที่ใช้เฉพาะหน้ารายละเอียด)
+    LIST_COLUMNS = '*'
+    
     def __init__(self, table_name):
         self.table_name = table_name
         self.client = supabase
     
-    def get_all(self, user_id=None):
+    def _paginate(self, query, limit=None, after=None):
+        """แบ่งหน้าแบบ keyset โดยเรียงตาม id และเริ่มหลัง id ที่เป็น cursor"""
+        if limit or after:
+            query = query.order('id')
+        if after:
+            query = query.gt('id', after)
+        if limit:
+            query = query.limit(limit)
+        return query.execute()
+    
+    def get_all(self, user_id=None, columns='*', limit=None, after=None):
         """ดึงข้อมูลทั้งหมดของตาราง"""
-        query = self.client.table(self.table_name).select('*')
+        query = self.client.table(self.table_name).select(columns)
         if user_id:
             query = query.eq('user_id', user_id)
-        return query.execute()
+        return self._paginate(query, limit, after)
     
     def get_by_id(self, id):
         """ดึงข้อมูลตาม ID"""
         return self.client.table(self.table_name).select('*').eq('id', id).execute()
     
+    def get_by_ids(self, ids):
+        """ดึงข้อมูลหลายรายการตาม ID ในการเรียกครั้งเดียว"""
+        return self.client.table(self.table_name).select('*').in_('id', list(ids)).execute()
+    
     def create(self, data):
         """สร้างข้อมูลใหม่"""
         return self.client.table(self.table_name).insert(data).execute()
     
+    def create_many(self, rows):
+        """สร้างข้อมูลหลายรายการในการเรียกครั้งเดียว (ผลลัพธ์เรียงตามลำดับที่ส่ง)"""
+        return self.client.table(self.table_name).insert(list(rows)).execute()
+    
     def update(self, id, data):
         """อัปเดตข้อมูลตาม ID"""
         return self.client.table(self.table_name).update(data).eq('id', id).execute()
@@ -43,6 +64,50 @@ class SupabaseModel:
     def delete(self, id):
         """ลบข้อมูลตาม ID"""
         return self.client.table(self.table_name).delete().eq('id', id).execute()
+    
+    def get_owned(self, id, user_id, columns='*'):
+        """ดึงข้อมูลตาม ID เฉพาะของผู้ใช้ (ไม่พบหรือไม่ใช่ของผู้ใช้จะได้ผลลัพธ์ว่าง)"""
+        return self.client.table(self.table_name).select(columns).eq('id', id).eq('user_id', user_id).execute()
+    
+    def update_owned(self, id, user_id, data):
+        """อัปเดตข้อมูลตาม ID เฉพาะของผู้ใช้ในการเรียกครั้งเดียว และคืนแถวที่ถูกอัปเดต"""
+        return self.client.table(self.table_name).update(data).eq('id', id).eq('user_id', user_id).execute()
+    
+    def delete_owned(self, id, user_id):
+        """ลบข้อมูลตาม ID เฉพาะของผู้ใช้ในการเรียกครั้งเดียว และคืนแถวที่ถูกลบ"""
+        return self.client.table(self.table_name).delete().eq('id', id).eq('user_id', user_id).execute()
+    
+    def update_many(self, ids, data, user_id=None):
+        """อัปเดตข้อมูลหลายรายการตาม ID ด้วยค่าเดียวกันในการเรียกครั้งเดียว"""
+        query = self.client.table(self.table_name).update(data).in_('id', list(ids))
+        if user_id:
+            query = query.eq('user_id', user_id)
+        return query.execute()
+    
+    def upsert_many(self, rows, on_conflict='id'):
+        """สร้างหรืออัปเดตข้อมูลหลายรายการในการเรียกครั้งเดียว"""
+        return self.client.table(self.table_name).upsert(list(rows), on_conflict=on_conflict).execute()
+    
+    def delete_many(self, ids, user_id=None):
+        """ลบข้อมูลหลายรายการตาม ID ในการเรียกครั้งเดียว"""
+        query = self.client.table(self.table_name).delete().in_('id', list(ids))
+        if user_id:
+            query = query.eq('user_id', user_id)
+        return query.execute()
+    
+    def get_by(self, column, values, user_id=None, columns='*'):
+        """ดึงข้อมูลที่ค่าในคอลัมน์ตรงกับค่าใดค่าหนึ่งในรายการ"""
+        query = self.client.table(self.table_name).select(columns).in_(column, list(values))
+        if user_id:
+            query = query.eq('user_id', user_id)
+        return query.execute()
+    
+    def delete_by(self, column, values, user_id=None):
+        """ลบข้อมูลที่ค่าในคอลัมน์ตรงกับค่าใดค่าหนึ่งในรายการในการเรียกครั้งเดียว"""
+        query = self.client.table(self.table_name).delete().in_(column, list(values))
+        if user_id:
+            query = query.eq('user_id', user_id)
+        return query.execute()
 
 class SemesterModel(SupabaseModel):
     def __init__(self):
@@ -52,55 +117,94 @@ class SemesterModel(SupabaseModel):
         """ดึงข้อมูลเทอมพร้อมกับชั้นเรียนที่เกี่ยวข้อง"""
         query = self.client.from_('semesters').select('*, classes(*)').eq('user_id', user_id)
         return query.execute()
+    
+    def get_tree(self, user_id, with_statistics=True):
+        """
+        ดึงเทอม ชั้นเรียน วิชา และงานทั้งหมดของผู้ใช้ใน select แบบซ้อนครั้งเดียว
+        โดยแนบจำนวนงานที่ส่งของแต่ละงานจากตาราง assignment_statistics ถ้าระบุ with_statistics
+        """
+        assignment_columns = 'id, title, total_score, subject_id'
+        if with_statistics:
+            assignment_columns += ', assignment_statistics(pending_submissions, graded_submissions, approved_submissions)'
+        columns = f'*, classes(*, subjects(*, assignments({assignment_columns})))'
+        return self.client.table(self.table_name).select(columns).eq('user_id', user_id).order('id').execute()
 
 class ClassModel(SupabaseModel):
     def __init__(self):
         super().__init__('classes')
         
-    def get_by_semester(self, semester_id, user_id):
+    def get_by_semester(self, semester_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลชั้นเรียนตามเทอม"""
-        return self.client.table(self.table_name).select('*').eq('semester_id', semester_id).eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('semester_id', semester_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
 
 class SubjectModel(SupabaseModel):
     def __init__(self):
         super().__init__('subjects')
         
-    def get_by_class(self, class_id, user_id):
+    def get_by_class(self, class_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลวิชาตามชั้นเรียน"""
-        return self.client.table(self.table_name).select('*').eq('class_id', class_id).eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('class_id', class_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
 
 class AssignmentModel(SupabaseModel):
     def __init__(self):
         super().__init__('assignments')
         
-    def get_by_subject(self, subject_id, user_id):
+    def get_by_subject(self, subject_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลงานตามวิชา"""
-        return self.client.table(self.table_name).select('*').eq('subject_id', subject_id).eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('subject_id', subject_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
 
 class SolutionModel(SupabaseModel):
+    LIST_COLUMNS = 'id, file_path, file_name, content_type, file_size, vector_id, extraction_status, user_id, assignment_id'
+    
     def __init__(self):
         super().__init__('solutions')
         
-    def get_by_assignment(self, assignment_id, user_id):
+    def get_by_assignment(self, assignment_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลเฉลยตามงาน"""
-        return self.client.table(self.table_name).select('*').eq('assignment_id', assignment_id).eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('assignment_id', assignment_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
 
 class SubmissionModel(SupabaseModel):
+    LIST_COLUMNS = ('id, student_name, student_id, file_path, file_name, content_type, file_size, '
+                    'status, extraction_status, user_id, assignment_id')
+    
     def __init__(self):
         super().__init__('submissions')
         
-    def get_by_assignment(self, assignment_id, user_id):
+    def get_by_assignment(self, assignment_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลงานที่ส่งตามงาน"""
-        return self.client.table(self.table_name).select('*').eq('assignment_id', assignment_id).eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('assignment_id', assignment_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
         
-    def get_pending_submissions(self, user_id):
+    def get_pending_submissions(self, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลงานที่รอการตรวจ"""
-        return self.client.table(self.table_name).select('*').eq('status', 'pending').eq('user_id', user_id).execute()
+        query = self.client.table(self.table_name).select(columns).eq('status', 'pending').eq('user_id', user_id)
+        return self._paginate(query, limit, after)
+    
+    def get_pending_by_assignment(self, assignment_id, user_id):
+        """ดึงข้อมูลงานที่รอการตรวจตามงาน"""
+        return self.client.table(self.table_name).select('id, student_name, student_id').eq('assignment_id', assignment_id).eq('status', 'pending').eq('extraction_status', 'done').eq('user_id', user_id).execute()
 
 class GradeModel(SupabaseModel):
     def __init__(self):
         super().__init__('grades')
         
-    def get_by_submission(self, submission_id, user_id):
+    def get_by_submission(self, submission_id, user_id, columns='*', limit=None, after=None):
         """ดึงข้อมูลคะแนนตามงานที่ส่ง"""
-        return self.client.table(self.table_name).select('*').eq('submission_id', submission_id).eq('user_id', user_id).execute()
\ No newline at end of file
+        query = self.client.table(self.table_name).select(columns).eq('submission_id', submission_id).eq('user_id', user_id)
+        return self._paginate(query, limit, after)
+
+class AssignmentStatisticsModel(SupabaseModel):
+    def __init__(self):
+        super().__init__('assignment_statistics')
+
+    def get_by_assignment(self, assignment_id, user_id):
+        """ดึงสถิติที่คำนวณไว้ล่วงหน้าของงาน"""
+        return self.client.table(self.table_name).select('*').eq('assignment_id', assignment_id).eq('user_id', user_id).execute()
+
+    def rebuild(self, assignment_id=None):
+        """สร้างสถิติของงานใหม่จากข้อมูลจริง (ทุกงาน หรือเฉพาะงานที่ระบุ)"""
+        return self.client.rpc('rebuild_assignment_statistics', {"p_assignment_id": assignment_id}).execute()
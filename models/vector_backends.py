@@ -0,0 +1,393 @@
+# grading_assistant/models/vector_backends.py
+import os
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+class SearchHit:
+    """
+    ผลลัพธ์การค้นหาหนึ่งรายการ มีแอตทริบิวต์เหมือน ScoredPoint ของ Qdrant
+    """
+    __slots__ = ('id', 'score', 'payload')
+
+    def __init__(self, id, score, payload):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+    def __repr__(self):
+        return f"SearchHit(id={self.id!r}, score={self.score:.4f})"
+
+class VectorBackend:
+    """
+    อินเทอร์เฟซของที่เก็บ vector ที่ VectorDB ใช้งาน
+    """
+    def ensure_collection(self, collection_name, size, indexed_fields=()):
+        """สร้าง collection ถ้ายังไม่มี"""
+        raise NotImplementedError
+
+    def upsert(self, collection_name, points):
+        """บันทึกรายการ (vector_id, embedding, payload)"""
+        raise NotImplementedError
+
+    def search(self, collection_name, embedding, limit, filters=None):
+        """ค้นหา vector ที่ใกล้เคียงที่สุดแบบ cosine"""
+        raise NotImplementedError
+
+    def delete(self, collection_name, vector_ids):
+        """ลบ vector ตาม ID"""
+        raise NotImplementedError
+
+class QdrantBackend(VectorBackend):
+    """
+    ที่เก็บ vector บนเซิร์ฟเวอร์ Qdrant
+    """
+    def __init__(self, url, api_key=None):
+        # import เมื่อใช้ Qdrant เท่านั้น เพื่อให้ใช้ที่เก็บแบบ local ได้โดยไม่ต้องติดตั้ง qdrant-client
+        from qdrant_client import QdrantClient
+        from qdrant_client.http import models
+        self.models = models
+        self.client = QdrantClient(url=url, api_key=api_key)
+
+    def ensure_collection(self, collection_name, size, indexed_fields=()):
+        collections = self.client.get_collections().collections
+        collection_names = [collection.name for collection in collections]
+
+        if collection_name in collection_names:
+            # ตรวจสอบว่าขนาดของ vector ใน collection เดิมตรงกับโมเดลที่ใช้งาน
+            info = self.client.get_collection(collection_name=collection_name)
+            existing_size = getattr(info.config.params.vectors, 'size', None)
+            if existing_size is not None and existing_size != size:
+                raise ValueError(
+                    f"Qdrant collection {collection_name} has dimension {existing_size}, expected {size}"
+                )
+        else:
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=self.models.VectorParams(
+                    size=size,
+                    distance=self.models.Distance.COSINE
+                )
+            )
+
+        # สร้างดัชนีของ payload เพื่อให้การค้นหาแบบกรองไม่ต้องตรวจทั้ง collection
+        for field_name in indexed_fields:
+            try:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=self.models.PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                print(f"Error creating payload index {field_name}: {str(e)}")
+
+    def upsert(self, collection_name, points):
+        return self.client.upsert(
+            collection_name=collection_name,
+            points=[
+                self.models.PointStruct(
+                    id=vector_id,
+                    vector=embedding,
+                    payload=payload or {}
+                )
+                for vector_id, embedding, payload in points
+            ]
+        )
+
+    def search(self, collection_name, embedding, limit, filters=None):
+        return self.client.search(
+            collection_name=collection_name,
+            query_vector=embedding,
+            query_filter=self._build_filter(filters),
+            limit=limit
+        )
+
+    def delete(self, collection_name, vector_ids):
+        return self.client.delete(
+            collection_name=collection_name,
+            points_selector=self.models.PointIdsList(
+                points=list(vector_ids)
+            )
+        )
+
+    def _build_filter(self, filters):
+        """
+        สร้างเงื่อนไขการกรองของ Qdrant จาก dict ของค่าที่ต้องตรงกัน
+
+        Args:
+            filters (dict): ชื่อฟิลด์และค่าที่ต้องการ
+
+        Returns:
+            self.Filter: เงื่อนไขการกรอง หรือ None ถ้าไม่มีเงื่อนไข
+        """
+        if not filters:
+            return None
+
+        return self.models.Filter(
+            must=[
+                self.models.FieldCondition(key=key, match=self.models.MatchValue(value=value))
+                for key, value in filters.items()
+                if value is not None
+            ]
+        )
+
+class _LocalCollection:
+    """
+    collection หนึ่งของ LocalVectorBackend ประกอบด้วยเมทริกซ์ float32 แบบ memory-mapped
+    (vectors.f32) ที่เก็บ vector ที่ normalize แล้ว และ SQLite (points.db) ที่เก็บ ID และ payload
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory, size, indexed_fields):
+        self.directory = directory
+        self.size = size
+        self.indexed_fields = tuple(indexed_fields)
+        self.db_path = os.path.join(directory, "points.db")
+        self.matrix_path = os.path.join(directory, "vectors.f32")
+        self.lock = threading.RLock()
+        self.version = None
+
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS points (
+                    row INTEGER PRIMARY KEY,
+                    id TEXT UNIQUE NOT NULL,
+                    payload TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('size', ?)", (str(size),))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+            stored_size = int(conn.execute("SELECT value FROM meta WHERE key = 'size'").fetchone()[0])
+
+        if stored_size != size:
+            raise ValueError(
+                f"Local vector collection at {directory} has dimension {stored_size}, expected {size}"
+            )
+
+        self._reload()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _open_matrix(self, rows):
+        """เปิดไฟล์เมทริกซ์แบบ memory-mapped โดยขยายไฟล์ให้รองรับจำนวนแถวที่ต้องการ"""
+        capacity = max(self.INITIAL_CAPACITY, rows)
+        required = capacity * self.size * 4
+
+        if not os.path.exists(self.matrix_path) or os.path.getsize(self.matrix_path) < required:
+            # ขยายความจุเป็นสองเท่า เพื่อลดจำนวนครั้งที่ต้องขยายไฟล์
+            current = os.path.getsize(self.matrix_path) // (self.size * 4) if os.path.exists(self.matrix_path) else 0
+            while current < capacity:
+                current = max(current * 2, self.INITIAL_CAPACITY)
+            with open(self.matrix_path, "ab") as f:
+                f.truncate(current * self.size * 4)
+
+        capacity = os.path.getsize(self.matrix_path) // (self.size * 4)
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.size))
+
+    def _reload(self):
+        """โหลดข้อมูลของ collection จากดิสก์ เมื่อมีการเปลี่ยนแปลงจาก process อื่น"""
+        with self._connect() as conn:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            if version == self.version:
+                return
+            rows = conn.execute("SELECT row, id, payload FROM points WHERE deleted = 0").fetchall()
+            max_row = conn.execute("SELECT COALESCE(MAX(row), 0) FROM points").fetchone()[0]
+
+        self.ids = {}
+        self.payloads = {}
+        self.index = {field: defaultdict(set) for field in self.indexed_fields}
+        for row, vector_id, payload in rows:
+            self._add_to_memory(row, vector_id, json.loads(payload))
+
+        self._open_matrix(max_row + 1)
+        self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+        self.alive[list(self.payloads)] = True
+        self.version = version
+
+    def _add_to_memory(self, row, vector_id, payload):
+        self.ids[row] = vector_id
+        self.payloads[row] = payload
+        for field in self.indexed_fields:
+            if field in payload:
+                self.index[field][payload[field]].add(row)
+
+    def _remove_from_memory(self, row):
+        payload = self.payloads.pop(row, None)
+        self.ids.pop(row, None)
+        if payload is None:
+            return
+        for field in self.indexed_fields:
+            if field in payload:
+                self.index[field][payload[field]].discard(row)
+        if row < len(self.alive):
+            self.alive[row] = False
+
+    def upsert(self, points):
+        vectors = np.asarray([embedding for _, embedding, _ in points], dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.size:
+            raise ValueError(f"Expected vectors of dimension {self.size}")
+
+        # normalize ไว้ก่อน เพื่อให้ cosine similarity เป็นเพียงผลคูณภายใน
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        vectors = vectors / norms
+
+        with self.lock:
+            self._reload()
+            assigned = []
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for vector_id, _, payload in points:
+                    payload_json = json.dumps(payload or {}, ensure_ascii=False)
+                    existing = conn.execute("SELECT row FROM points WHERE id = ?", (str(vector_id),)).fetchone()
+                    if existing:
+                        row = existing[0]
+                        conn.execute("UPDATE points SET payload = ?, deleted = 0 WHERE row = ?", (payload_json, row))
+                    else:
+                        row = conn.execute(
+                            "INSERT INTO points (id, payload) VALUES (?, ?)",
+                            (str(vector_id), payload_json)
+                        ).lastrowid
+                    assigned.append((row, str(vector_id), payload or {}))
+
+                max_row = max(row for row, _, _ in assigned)
+                if max_row >= self.matrix.shape[0]:
+                    self.matrix.flush()
+                    self._open_matrix(max_row + 1)
+                    alive = np.zeros(self.matrix.shape[0], dtype=bool)
+                    alive[:len(self.alive)] = self.alive
+                    self.alive = alive
+
+                for (row, _, _), vector in zip(assigned, vectors):
+                    self.matrix[row] = vector
+                self.matrix.flush()
+
+                version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]) + 1
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(version),))
+                conn.execute("COMMIT")
+
+            for row, vector_id, payload in assigned:
+                self._remove_from_memory(row)
+                self._add_to_memory(row, vector_id, payload)
+                self.alive[row] = True
+            self.version = str(version)
+
+    def delete(self, vector_ids):
+        with self.lock:
+            self._reload()
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = []
+                for vector_id in vector_ids:
+                    found = conn.execute("SELECT row FROM points WHERE id = ?", (str(vector_id),)).fetchone()
+                    if found:
+                        rows.append(found[0])
+                        conn.execute("UPDATE points SET deleted = 1 WHERE row = ?", (found[0],))
+                version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]) + 1
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(version),))
+                conn.execute("COMMIT")
+
+            for row in rows:
+                self._remove_from_memory(row)
+            self.version = str(version)
+
+    def search(self, embedding, limit, filters=None):
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        with self.lock:
+            self._reload()
+            candidates = self._candidate_rows(filters)
+
+            if candidates is None:
+                # ไม่มีเงื่อนไข คำนวณกับทุกแถวที่ยังไม่ถูกลบในการคูณเมทริกซ์ครั้งเดียว
+                count = len(self.alive)
+                scores = self.matrix[:count] @ query
+                scores[~self.alive[:count]] = -np.inf
+                rows = np.arange(count)
+            else:
+                if not candidates:
+                    return []
+                rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                scores = self.matrix[rows] @ query
+
+            k = min(limit, len(rows))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                SearchHit(self.ids[int(rows[i])], float(scores[i]), dict(self.payloads[int(rows[i])]))
+                for i in top
+                if np.isfinite(scores[i])
+            ]
+
+    def _candidate_rows(self, filters):
+        """หาแถวที่ตรงกับเงื่อนไข โดยใช้ดัชนีของ payload ก่อน แล้วตรวจฟิลด์ที่ไม่มีดัชนีภายหลัง"""
+        filters = {key: value for key, value in (filters or {}).items() if value is not None}
+        if not filters:
+            return None
+
+        candidates = None
+        for key, value in filters.items():
+            if key in self.index:
+                matched = self.index[key].get(value, set())
+                candidates = set(matched) if candidates is None else candidates & matched
+
+        if candidates is None:
+            candidates = set(self.payloads)
+
+        unindexed = {key: value for key, value in filters.items() if key not in self.index}
+        if unindexed:
+            candidates = {
+                row for row in candidates
+                if all(self.payloads[row].get(key) == value for key, value in unindexed.items())
+            }
+
+        return candidates
+
+class LocalVectorBackend(VectorBackend):
+    """
+    ที่เก็บ vector ภายใน process สำหรับการทดสอบและการใช้งานแบบออฟไลน์
+    ค้นหาแบบ exact cosine top-k ด้วยการคูณเมทริกซ์ของ NumPy
+    """
+    def __init__(self, path):
+        self.path = path
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def ensure_collection(self, collection_name, size, indexed_fields=()):
+        with self.lock:
+            if collection_name not in self.collections:
+                self.collections[collection_name] = _LocalCollection(
+                    os.path.join(self.path, collection_name), size, indexed_fields
+                )
+
+    def upsert(self, collection_name, points):
+        if points:
+            self.collections[collection_name].upsert(points)
+        return {"status": "completed", "count": len(points)}
+
+    def search(self, collection_name, embedding, limit, filters=None):
+        return self.collections[collection_name].search(embedding, limit, filters)
+
+    def delete(self, collection_name, vector_ids):
+        self.collections[collection_name].delete(vector_ids)
+        return {"status": "completed"}
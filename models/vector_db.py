@@ -1,7 +1,7 @@
 # grading_assistant/models/vector_db.py
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
+import re
+from models.vector_backends import QdrantBackend, LocalVectorBackend
 from dotenv import load_dotenv
 
 # โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
@@ -11,28 +11,61 @@ load_dotenv()
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "solution_embeddings"
+# ฟิลด์ใน payload ที่สร้างดัชนีไว้สำหรับการกรองผลการค้นหา
+INDEXED_PAYLOAD_FIELDS = ("assignment_id", "user_id", "type")
+
+# ที่เก็บ vector ที่ใช้งาน: "qdrant" หรือ "local"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "./data/vectors")
+
+def create_backend(name=VECTOR_BACKEND):
+    """
+    สร้างที่เก็บ vector ตามค่ากำหนด
+    
+    Args:
+        name (str, optional): ชื่อของที่เก็บ vector ("qdrant" หรือ "local")
+        
+    Returns:
+        VectorBackend: ที่เก็บ vector
+    """
+    if name == "local":
+        return LocalVectorBackend(LOCAL_VECTOR_PATH)
+    if name == "qdrant":
+        return QdrantBackend(QDRANT_URL, QDRANT_API_KEY)
+    raise ValueError(f"Unknown vector backend: {name}")
+
+def collection_name_for(model_name, dimension):
+    """
+    สร้างชื่อ collection สำหรับโมเดลและขนาดของ embedding
+    
+    Args:
+        model_name (str): ชื่อโมเดล embedding
+        dimension (int): ขนาดของ embedding
+        
+    Returns:
+        str: ชื่อ collection
+    """
+    slug = re.sub(r"[^a-z0-9]+", "_", model_name.lower()).strip("_")
+    return f"{COLLECTION_NAME}_{slug}_{dimension}"
 
 class VectorDB:
     """
-    คลาสสำหรับจัดการ Vector Database (Qdrant)
+    คลาสสำหรับจัดการ Vector Database (Qdrant หรือที่เก็บภายใน process)
+    แต่ละโมเดลและขนาดของ embedding ใช้ collection แยกกัน
     """
-    def __init__(self):
-        self.client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    def __init__(self, dimension, model_name, backend=None):
+        self.dimension = dimension
+        self.collection_name = collection_name_for(model_name, dimension)
+        self.backend = backend or create_backend()
         self._ensure_collection_exists()
     
     def _ensure_collection_exists(self):
-        """ตรวจสอบว่า collection มีอยู่หรือไม่ ถ้าไม่มีให้สร้าง"""
-        collections = self.client.get_collections().collections
-        collection_names = [collection.name for collection in collections]
-        
-        if COLLECTION_NAME not in collection_names:
-            self.client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=models.VectorParams(
-                    size=1536,  # ขนาด vector สำหรับ embedding model
-                    distance=models.Distance.COSINE
-                )
-            )
+        """ตรวจสอบว่า collection มีอยู่และขนาดของ vector ตรงกัน ถ้าไม่มีให้สร้าง"""
+        self.backend.ensure_collection(
+            self.collection_name,
+            self.dimension,
+            INDEXED_PAYLOAD_FIELDS
+        )
     
     def store_embedding(self, vector_id, embedding, metadata=None):
         """
@@ -49,33 +82,33 @@ class VectorDB:
         if metadata is None:
             metadata = {}
             
-        return self.client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=[
-                models.PointStruct(
-                    id=vector_id,
-                    vector=embedding,
-                    payload=metadata
-                )
-            ]
-        )
+        return self.backend.upsert(self.collection_name, [(vector_id, embedding, metadata)])
     
-    def search_similar(self, embedding, limit=5):
+    def store_embeddings(self, points):
+        """
+        บันทึก embeddings หลายรายการลงใน vector database ในการเรียกครั้งเดียว
+        
+        Args:
+            points (list): รายการ tuple (vector_id, embedding, metadata)
+        
+        Returns:
+            dict: ผลการบันทึก
+        """
+        return self.backend.upsert(self.collection_name, points)
+    
+    def search_similar(self, embedding, limit=5, filters=None):
         """
         ค้นหา vectors ที่คล้ายกับ embedding ที่ให้มา
         
         Args:
             embedding (list): vector embedding ที่ต้องการค้นหา
             limit (int, optional): จำนวนผลลัพธ์สูงสุดที่ต้องการ
+            filters (dict, optional): เงื่อนไขของ payload เช่น {"assignment_id": ..., "type": "solution"}
             
         Returns:
-            list: รายการผลลัพธ์ที่คล้ายกัน
+            list: รายการผลลัพธ์ที่คล้ายกัน (มีแอตทริบิวต์ id, score และ payload)
         """
-        return self.client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=embedding,
-            limit=limit
-        )
+        return self.backend.search(self.collection_name, embedding, limit, filters)
     
     def delete_embedding(self, vector_id):
         """
@@ -87,9 +120,16 @@ class VectorDB:
         Returns:
             dict: ผลการลบ
         """
-        return self.client.delete(
-            collection_name=COLLECTION_NAME,
-            points_selector=models.PointIdsList(
-                points=[vector_id]
-            )
-        )
\ No newline at end of file
+        return self.backend.delete(self.collection_name, [vector_id])
+    
+    def delete_embeddings(self, vector_ids):
+        """
+        ลบ embeddings หลายรายการในการเรียกครั้งเดียว
+        
+        Args:
+            vector_ids (list): รายการ ID ของ vector ที่ต้องการลบ
+            
+        Returns:
+            dict: ผลการลบ
+        """
+        return self.backend.delete(self.collection_name, list(vector_ids))
@@ -4,4 +4,5 @@
 """
 # เปิดใช้งานการ import ทั้งหมดจากโมดูลนี้
 __all__ = ['auth_routes', 'semester_routes', 'class_routes', 'subject_routes', 
-           'assignment_routes', 'solution_routes', 'submission_routes', 'grade_routes']
\ No newline at end of file
+           'assignment_routes', 'solution_routes', 'submission_routes', 'grade_routes',
+           'async_grading_routes']
\ No newline at end of file
@@ -1,15 +1,23 @@
 # grading_assistant/routes/assignment_routes.py
 from flask import Blueprint, request, jsonify, g
-from models.database import AssignmentModel, SubjectModel
+from models.database import AssignmentModel, SubjectModel, SubmissionModel, SolutionModel, GradeModel
 from services.auth_service import login_required
 from services.storage_service import StorageService
+from services.embedding_service import EmbeddingService
+from services.batch_grading_service import BatchGradingService
 from models.database import supabase
+from utils.helpers import get_pagination_args, paginated_response
 import uuid
 
 bp = Blueprint('assignments', __name__, url_prefix='/api/assignments')
 assignment_model = AssignmentModel()
 subject_model = SubjectModel()
+submission_model = SubmissionModel()
+solution_model = SolutionModel()
+grade_model = GradeModel()
 storage_service = StorageService(supabase)
+embedding_service = EmbeddingService()
+batch_grading_service = BatchGradingService()
 
 @bp.route('/', methods=['GET'])
 @login_required
@@ -17,14 +25,16 @@ def get_assignments():
     """
     ดึงข้อมูลงานทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     subject_id = request.args.get('subject_id')
     
     if subject_id:
-        result = assignment_model.get_by_subject(subject_id, g.user_id)
+        result = assignment_model.get_by_subject(subject_id, g.user_id, columns=assignment_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = assignment_model.get_all(g.user_id)
+        result = assignment_model.get_all(g.user_id, columns=assignment_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<assignment_id>', methods=['GET'])
 @login_required
@@ -32,7 +42,7 @@ def get_assignment(assignment_id):
     """
     ดึงข้อมูลงานตาม ID
     """
-    result = assignment_model.get_by_id(assignment_id)
+    result = assignment_model.get_owned(assignment_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
     return jsonify(result.data[0])
@@ -53,13 +63,10 @@ def create_assignment():
         return jsonify({"error": "กรุณากรอกชื่องานและรหัสวิชา"}), 400
     
     # ตรวจสอบว่าวิชานี้เป็นของผู้ใช้หรือไม่
-    subject_result = subject_model.get_by_id(data['subject_id'])
+    subject_result = subject_model.get_owned(data['subject_id'], g.user_id, columns='id')
     if not subject_result.data:
         return jsonify({"error": "ไม่พบวิชาที่ต้องการ"}), 404
     
-    if subject_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์สร้างงานในวิชานี้"}), 403
-    
     # สร้างโฟลเดอร์สำหรับเก็บไฟล์งาน
     folder_name = f"assignments/{uuid.uuid4()}"
     folder_result = storage_service.create_folder(folder_name)
@@ -91,13 +98,11 @@ def update_assignment(assignment_id):
     if not data:
         return jsonify({"error": "ข้อมูลไม่ถูกต้อง"}), 400
     
-    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    result = assignment_model.get_by_id(assignment_id)
-    if not result.data:
-        return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์แก้ไขงานนี้"}), 403
+    # ถ้ามีการย้ายงาน ตรวจสอบว่าวิชาปลายทางเป็นของผู้ใช้หรือไม่
+    if 'subject_id' in data:
+        subject_result = subject_model.get_owned(data['subject_id'], g.user_id, columns='id')
+        if not subject_result.data:
+            return jsonify({"error": "ไม่พบวิชาที่ต้องการ"}), 404
     
     # แปลงคะแนนเป็นตัวเลข
     if 'total_score' in data:
@@ -106,7 +111,10 @@ def update_assignment(assignment_id):
         except ValueError:
             data['total_score'] = 0
     
-    result = assignment_model.update(assignment_id, data)
+    # อัปเดตเฉพาะงานของผู้ใช้ ถ้าไม่มีแถวที่ถูกอัปเดตแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = assignment_model.update_owned(assignment_id, g.user_id, data)
+    if not result.data:
+        return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
     return jsonify(result.data[0])
 
 @bp.route('/<assignment_id>', methods=['DELETE'])
@@ -115,20 +123,61 @@ def delete_assignment(assignment_id):
     """
     ลบงาน
     """
+    # ดึงเฉพาะข้อมูลที่ต้องใช้ลบของงานที่ส่งและเฉลยทั้งหมดของงานนี้
+    # ทุกคำสั่งกรองด้วย user_id จึงไม่กระทบข้อมูลของผู้ใช้อื่นแม้งานจะไม่ใช่ของผู้ใช้
+    submissions = submission_model.get_by('assignment_id', [assignment_id], g.user_id, columns='id, file_path').data
+    solutions = solution_model.get_by('assignment_id', [assignment_id], g.user_id, columns='id, file_path, vector_id').data
+    
+    # ลบคะแนน งานที่ส่ง และเฉลยของงานนี้ โดยลบแต่ละตารางในการเรียกครั้งเดียว
+    if submissions:
+        grade_model.delete_by('submission_id', [submission['id'] for submission in submissions], g.user_id)
+        submission_model.delete_by('assignment_id', [assignment_id], g.user_id)
+    if solutions:
+        solution_model.delete_by('assignment_id', [assignment_id], g.user_id)
+        embedding_service.delete_embeddings([solution['vector_id'] for solution in solutions if solution.get('vector_id')])
+    
+    # ลบไฟล์งานที่ส่งและไฟล์เฉลยทั้งหมดใน Storage
+    storage_service.delete_files([row.get('file_path') for row in submissions + solutions])
+    
+    result = assignment_model.delete_owned(assignment_id, g.user_id)
+    if not result.data:
+        return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
+    return jsonify({"message": "ลบงานสำเร็จ"})
+
+@bp.route('/<assignment_id>/grade-all', methods=['POST'])
+@login_required
+def grade_all_submissions(assignment_id):
+    """
+    ตรวจงานที่ส่งทั้งหมดที่รอการตรวจของงานนี้แบบกลุ่ม
+    """
     # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    result = assignment_model.get_by_id(assignment_id)
+    result = assignment_model.get_owned(assignment_id, g.user_id, columns='id')
     if not result.data:
         return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
     
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบงานนี้"}), 403
+    # เลือกวิธีการตรวจ
+    use_rag = request.args.get('use_rag', 'true').lower() == 'true'
+    
+    # เลือกว่าจะส่งเข้าคิวถาวรให้ grading worker หรือตรวจใน process นี้
+    queue_param = request.args.get('queue')
+    if queue_param is None:
+        job = batch_grading_service.start_job(assignment_id, g.user_id, use_rag)
+    else:
+        job = batch_grading_service.start_job(assignment_id, g.user_id, use_rag,
+                                              durable=queue_param.lower() == 'true')
+    if "error" in job:
+        return jsonify(job), 409
     
-    # ลบโฟลเดอร์ที่เก็บไฟล์งาน (หากมี)
-    folder_path = result.data[0].get('folder_path')
-    if folder_path:
-        # หมายเหตุ: การลบโฟลเดอร์ใน Supabase จะต้องลบไฟล์ทั้งหมดในโฟลเดอร์ก่อน
-        # ตรงนี้ควรมีการลบไฟล์ทั้งหมดในโฟลเดอร์ แต่เพื่อความเรียบง่ายจะไม่ทำในตัวอย่างนี้
-        pass
+    return jsonify(job), 202
+
+@bp.route('/<assignment_id>/grade-all/<job_id>', methods=['GET'])
+@login_required
+def get_grade_all_job(assignment_id, job_id):
+    """
+    ดึงความคืบหน้าของการตรวจงานแบบกลุ่ม
+    """
+    job = batch_grading_service.get_job(job_id, g.user_id)
+    if not job or job['assignment_id'] != assignment_id:
+        return jsonify({"error": "ไม่พบงานตรวจที่ต้องการ"}), 404
     
-    assignment_model.delete(assignment_id)
-    return jsonify({"message": "ลบงานสำเร็จ"})
\ No newline at end of file
+    return jsonify(job)
\ No newline at end of file
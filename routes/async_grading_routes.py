@@ -0,0 +1,113 @@
+# grading_assistant/routes/async_grading_routes.py
+# route ตรวจงานแบบ async สำหรับโหมด ASGI (ดู asgi.py)
+# ทำงานเหมือน route ตรวจงานใน submission_routes แต่รอ LLM ใน event loop แทนการใช้ thread ต่อคำขอ
+import asyncio
+from functools import wraps
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from services.auth_service import authenticate_header
+from services.batch_grading_service import GRADING_USE_QUEUE
+from routes.submission_routes import submission_model, grading_service, grading_job_queue
+from utils.helpers import format_sse
+
+def async_login_required(f):
+    """ตรวจสอบ JWT token เหมือน login_required และเก็บ user_id ไว้ใน request.state"""
+    @wraps(f)
+    async def decorated_function(request):
+        payload, error = authenticate_header(request.headers.get('Authorization'))
+        if error:
+            return JSONResponse({"error": error}, status_code=401)
+
+        request.state.user_id = payload["user_id"]
+        request.state.user_email = payload["email"]
+        request.state.user_role = payload["role"]
+        return await f(request)
+
+    return decorated_function
+
+async def _get_gradable_submission(request):
+    """
+    ดึงงานที่ส่งของผู้ใช้และตรวจสอบว่าพร้อมตรวจหรือไม่
+
+    Returns:
+        tuple: (ข้อมูลงานที่ส่ง, None) หรือ (None, response ข้อผิดพลาด)
+    """
+    submission_id = request.path_params['submission_id']
+    result = await asyncio.to_thread(
+        submission_model.get_owned, submission_id, request.state.user_id,
+        'id, status, extraction_status, assignment_id'
+    )
+    if not result.data:
+        return None, JSONResponse({"error": "ไม่พบงานที่นักเรียนส่ง"}, status_code=404)
+
+    submission = result.data[0]
+    if submission['status'] != 'pending':
+        return None, JSONResponse({"error": "งานนี้ถูกตรวจแล้ว"}, status_code=400)
+
+    # ตรวจได้เมื่อดึงข้อความจากไฟล์เสร็จแล้วเท่านั้น
+    if submission.get('extraction_status', 'done') != 'done':
+        return None, JSONResponse({"error": "ยังดึงข้อความจากไฟล์ไม่เสร็จ", "extraction_status": submission['extraction_status']},
+                                  status_code=409)
+
+    return submission, None
+
+@async_login_required
+async def grade_submission(request):
+    """
+    ตรวจงานที่นักเรียนส่ง
+    """
+    submission, error_response = await _get_gradable_submission(request)
+    if error_response:
+        return error_response
+
+    use_rag = request.query_params.get('use_rag', 'true').lower() == 'true'
+
+    # ส่งเข้าคิวถาวรให้ grading worker ตรวจ โดยไม่ต้องรอผลจาก LLM ใน request นี้
+    use_queue = request.query_params.get('queue', str(GRADING_USE_QUEUE)).lower() == 'true'
+    if use_queue:
+        job = await asyncio.to_thread(grading_job_queue.enqueue, submission['id'], request.state.user_id, use_rag,
+                                      assignment_id=submission['assignment_id'])
+        return JSONResponse(job, status_code=202)
+
+    # ข้ามแคชผลการตรวจเพื่อบังคับให้ LLM ตรวจใหม่
+    use_cache = request.query_params.get('no_cache', 'false').lower() != 'true'
+
+    if use_rag:
+        grading_result = await grading_service.grade_with_rag_async(submission['id'], use_cache)
+    else:
+        grading_result = await grading_service.grade_submission_with_llm_async(submission['id'], use_cache)
+
+    if "error" in grading_result:
+        return JSONResponse(grading_result, status_code=500)
+
+    return JSONResponse(grading_result)
+
+@async_login_required
+async def grade_submission_stream(request):
+    """
+    ตรวจงานที่นักเรียนส่งและส่งข้อความจาก LLM กลับแบบ Server-Sent Events
+    """
+    submission, error_response = await _get_gradable_submission(request)
+    if error_response:
+        return error_response
+
+    use_rag = request.query_params.get('use_rag', 'true').lower() == 'true'
+    use_cache = request.query_params.get('no_cache', 'false').lower() != 'true'
+
+    async def generate():
+        async for event, data in grading_service.grade_submission_stream_async(submission['id'], use_rag, use_cache):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+routes = [
+    Route('/api/submissions/{submission_id}/grade', grade_submission, methods=['POST']),
+    Route('/api/submissions/{submission_id}/grade/stream', grade_submission_stream, methods=['POST']),
+]
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, jsonify, g
 from models.database import ClassModel, SemesterModel
 from services.auth_service import login_required
+from utils.helpers import get_pagination_args, paginated_response
 
 bp = Blueprint('classes', __name__, url_prefix='/api/classes')
 class_model = ClassModel()
@@ -13,14 +14,16 @@ def get_classes():
     """
     ดึงข้อมูลชั้นเรียนทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     semester_id = request.args.get('semester_id')
     
     if semester_id:
-        result = class_model.get_by_semester(semester_id, g.user_id)
+        result = class_model.get_by_semester(semester_id, g.user_id, columns=class_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = class_model.get_all(g.user_id)
+        result = class_model.get_all(g.user_id, columns=class_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<class_id>', methods=['GET'])
 @login_required
@@ -28,7 +31,7 @@ def get_class(class_id):
     """
     ดึงข้อมูลชั้นเรียนตาม ID
     """
-    result = class_model.get_by_id(class_id)
+    result = class_model.get_owned(class_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
     return jsonify(result.data[0])
@@ -48,13 +51,10 @@ def create_class():
         return jsonify({"error": "กรุณากรอกชื่อชั้นเรียนและเทอมเรียน"}), 400
     
     # ตรวจสอบว่าเทอมนี้เป็นของผู้ใช้หรือไม่
-    semester_result = semester_model.get_by_id(data['semester_id'])
+    semester_result = semester_model.get_owned(data['semester_id'], g.user_id, columns='id')
     if not semester_result.data:
         return jsonify({"error": "ไม่พบเทอมเรียน"}), 404
     
-    if semester_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์สร้างชั้นเรียนในเทอมนี้"}), 403
-    
     # เพิ่ม user_id ลงในข้อมูล
     data['user_id'] = g.user_id
     
@@ -71,24 +71,16 @@ def update_class(class_id):
     if not data:
         return jsonify({"error": "ข้อมูลไม่ถูกต้อง"}), 400
     
-    # ตรวจสอบว่าชั้นเรียนนี้เป็นของผู้ใช้หรือไม่
-    result = class_model.get_by_id(class_id)
-    if not result.data:
-        return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์แก้ไขชั้นเรียนนี้"}), 403
-    
-    # ถ้ามีการเปลี่ยนเทอม ตรวจสอบว่าเทอมใหม่เป็นของผู้ใช้หรือไม่
-    if 'semester_id' in data and data['semester_id'] != result.data[0]['semester_id']:
-        semester_result = semester_model.get_by_id(data['semester_id'])
+    # ถ้ามีการย้ายชั้นเรียน ตรวจสอบว่าเทอมเรียนปลายทางเป็นของผู้ใช้หรือไม่
+    if 'semester_id' in data:
+        semester_result = semester_model.get_owned(data['semester_id'], g.user_id, columns='id')
         if not semester_result.data:
             return jsonify({"error": "ไม่พบเทอมเรียน"}), 404
-        
-        if semester_result.data[0]['user_id'] != g.user_id:
-            return jsonify({"error": "ไม่มีสิทธิ์ย้ายชั้นเรียนไปยังเทอมนี้"}), 403
     
-    result = class_model.update(class_id, data)
+    # อัปเดตเฉพาะชั้นเรียนของผู้ใช้ ถ้าไม่มีแถวที่ถูกอัปเดตแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = class_model.update_owned(class_id, g.user_id, data)
+    if not result.data:
+        return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
     return jsonify(result.data[0])
 
 @bp.route('/<class_id>', methods=['DELETE'])
@@ -97,13 +89,8 @@ def delete_class(class_id):
     """
     ลบชั้นเรียน
     """
-    # ตรวจสอบว่าชั้นเรียนนี้เป็นของผู้ใช้หรือไม่
-    result = class_model.get_by_id(class_id)
+    # ลบเฉพาะชั้นเรียนของผู้ใช้ ถ้าไม่มีแถวที่ถูกลบแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = class_model.delete_owned(class_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบชั้นเรียนนี้"}), 403
-    
-    class_model.delete(class_id)
     return jsonify({"message": "ลบชั้นเรียนสำเร็จ"})
\ No newline at end of file
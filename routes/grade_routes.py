@@ -2,10 +2,13 @@
 from flask import Blueprint, request, jsonify, g
 from models.database import GradeModel, SubmissionModel
 from services.auth_service import login_required
+from services.statistics_service import StatisticsService
+from utils.helpers import get_pagination_args, paginated_response
 
 bp = Blueprint('grades', __name__, url_prefix='/api/grades')
 grade_model = GradeModel()
 submission_model = SubmissionModel()
+statistics_service = StatisticsService()
 
 @bp.route('/', methods=['GET'])
 @login_required
@@ -13,14 +16,16 @@ def get_grades():
     """
     ดึงข้อมูลคะแนนทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     submission_id = request.args.get('submission_id')
     
     if submission_id:
-        result = grade_model.get_by_submission(submission_id, g.user_id)
+        result = grade_model.get_by_submission(submission_id, g.user_id, columns=grade_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = grade_model.get_all(g.user_id)
+        result = grade_model.get_all(g.user_id, columns=grade_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<grade_id>', methods=['GET'])
 @login_required
@@ -28,7 +33,7 @@ def get_grade(grade_id):
     """
     ดึงข้อมูลคะแนนตาม ID
     """
-    result = grade_model.get_by_id(grade_id)
+    result = grade_model.get_owned(grade_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบคะแนนที่ต้องการ"}), 404
     return jsonify(result.data[0])
@@ -47,14 +52,6 @@ def create_grade():
     if 'submission_id' not in data or 'score' not in data:
         return jsonify({"error": "กรุณากรอกรหัสการส่งงานและคะแนน"}), 400
     
-    # ตรวจสอบว่างานที่ส่งนี้เป็นของผู้ใช้หรือไม่
-    submission_result = submission_model.get_by_id(data['submission_id'])
-    if not submission_result.data:
-        return jsonify({"error": "ไม่พบงานที่ส่ง"}), 404
-    
-    if submission_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ให้คะแนนงานนี้"}), 403
-    
     # เพิ่ม user_id ลงในข้อมูล
     data['user_id'] = g.user_id
     
@@ -67,11 +64,16 @@ def create_grade():
     # ถ้ามีการอนุมัติ ตั้งค่าให้เป็น True
     data['approved'] = data.get('approved', True)
     
+    # ตรวจสอบว่างานที่ส่งเป็นของผู้ใช้ก่อนบันทึกคะแนน
+    submission_result = submission_model.get_owned(data['submission_id'], g.user_id, columns='id')
+    if not submission_result.data:
+        return jsonify({"error": "ไม่พบงานที่ส่ง"}), 404
+    
+    # บันทึกคะแนนก่อนเปลี่ยนสถานะ เพื่อไม่ให้งานที่ส่งถูกแสดงว่าตรวจแล้วโดยไม่มีคะแนนถ้าบันทึกไม่สำเร็จ
     result = grade_model.create(data)
     
-    # อัปเดตสถานะการส่งงาน
     status = "approved" if data['approved'] else "graded"
-    submission_model.update(data['submission_id'], {"status": status})
+    submission_model.update_owned(data['submission_id'], g.user_id, {"status": status})
     
     return jsonify(result.data[0]), 201
 
@@ -85,14 +87,6 @@ def update_grade(grade_id):
     if not data:
         return jsonify({"error": "ข้อมูลไม่ถูกต้อง"}), 400
     
-    # ตรวจสอบว่าคะแนนนี้เป็นของผู้ใช้หรือไม่
-    result = grade_model.get_by_id(grade_id)
-    if not result.data:
-        return jsonify({"error": "ไม่พบคะแนนที่ต้องการ"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์แก้ไขคะแนนนี้"}), 403
-    
     # แปลงคะแนนเป็นตัวเลข
     if 'score' in data:
         try:
@@ -100,12 +94,15 @@ def update_grade(grade_id):
         except ValueError:
             data['score'] = 0
     
-    result = grade_model.update(grade_id, data)
+    # อัปเดตเฉพาะคะแนนของผู้ใช้ ถ้าไม่มีแถวที่ถูกอัปเดตแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = grade_model.update_owned(grade_id, g.user_id, data)
+    if not result.data:
+        return jsonify({"error": "ไม่พบคะแนนที่ต้องการ"}), 404
     
     # ถ้ามีการอนุมัติคะแนน ให้อัปเดตสถานะของการส่งงานเป็น 'approved'
     if data.get('approved') == True:
         submission_id = result.data[0]['submission_id']
-        submission_model.update(submission_id, {"status": "approved"})
+        submission_model.update_owned(submission_id, g.user_id, {"status": "approved"})
     
     return jsonify(result.data[0])
 
@@ -115,23 +112,38 @@ def delete_grade(grade_id):
     """
     ลบคะแนน
     """
-    # ตรวจสอบว่าคะแนนนี้เป็นของผู้ใช้หรือไม่
-    result = grade_model.get_by_id(grade_id)
+    # ลบเฉพาะคะแนนของผู้ใช้ ถ้าไม่มีแถวที่ถูกลบแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = grade_model.delete_owned(grade_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบคะแนนที่ต้องการ"}), 404
     
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบคะแนนนี้"}), 403
-    
-    # ดึงข้อมูลการส่งงานที่เกี่ยวข้อง
+    # อัปเดตสถานะของการส่งงานที่เกี่ยวข้องกลับเป็น 'pending'
     submission_id = result.data[0]['submission_id']
+    submission_model.update_owned(submission_id, g.user_id, {"status": "pending"})
     
-    grade_model.delete(grade_id)
+    return jsonify({"message": "ลบคะแนนสำเร็จ"})
+
+@bp.route('/approve', methods=['POST'])
+@login_required
+def approve_grades():
+    """
+    อนุมัติคะแนนหลายรายการในครั้งเดียว
+    """
+    data = request.json
+    if not data or not data.get('grade_ids'):
+        return jsonify({"error": "กรุณาระบุรายการคะแนนที่ต้องการอนุมัติ"}), 400
     
-    # อัปเดตสถานะของการส่งงานกลับเป็น 'pending'
-    submission_model.update(submission_id, {"status": "pending"})
+    # อัปเดตเฉพาะคะแนนของผู้ใช้ และอัปเดตสถานะของงานที่ส่งทั้งหมดในการเรียกครั้งเดียว
+    result = grade_model.update_many(data['grade_ids'], {"approved": True}, g.user_id)
     
-    return jsonify({"message": "ลบคะแนนสำเร็จ"})
+    submission_ids = list({grade['submission_id'] for grade in result.data})
+    if submission_ids:
+        submission_model.update_many(submission_ids, {"status": "approved"}, g.user_id)
+    
+    return jsonify({
+        "approved": len(result.data),
+        "grade_ids": [grade['id'] for grade in result.data]
+    })
 
 @bp.route('/statistics', methods=['GET'])
 @login_required
@@ -145,55 +157,6 @@ def get_grade_statistics():
     if not assignment_id and not student_id:
         return jsonify({"error": "กรุณาระบุรหัสงานหรือรหัสนักเรียน"}), 400
     
-    # ข้อมูลสำหรับส่งกลับ
-    statistics = {
-        "avg_score": 0,
-        "max_score": 0,
-        "min_score": 0,
-        "total_submissions": 0,
-        "graded_submissions": 0,
-        "approved_submissions": 0
-    }
-    
-    # ดึงข้อมูลการส่งงานตามงานหรือตามนักเรียน
-    submissions_query = submission_model.client.table("submissions").select("*").eq("user_id", g.user_id)
-    
-    if assignment_id:
-        submissions_query = submissions_query.eq("assignment_id", assignment_id)
-    
-    submissions_result = submissions_query.execute()
-    
-    if not submissions_result.data:
-        return jsonify(statistics)
-    
-    # จำนวนการส่งงานทั้งหมด
-    statistics["total_submissions"] = len(submissions_result.data)
-    
-    # จำนวนการส่งงานที่ตรวจแล้ว
-    graded_submissions = [s for s in submissions_result.data if s["status"] in ["graded", "approved"]]
-    statistics["graded_submissions"] = len(graded_submissions)
-    
-    # จำนวนการส่งงานที่อนุมัติแล้ว
-    approved_submissions = [s for s in submissions_result.data if s["status"] == "approved"]
-    statistics["approved_submissions"] = len(approved_submissions)
-    
-    # ดึงข้อมูลคะแนนของการส่งงานที่ตรวจแล้ว
-    submission_ids = [s["id"] for s in graded_submissions]
-    
-    if not submission_ids:
-        return jsonify(statistics)
-    
-    grades_result = grade_model.client.table("grades").select("*").in_("submission_id", submission_ids).execute()
-    
-    if not grades_result.data:
-        return jsonify(statistics)
-    
-    # คำนวณสถิติคะแนน
-    scores = [g["score"] for g in grades_result.data]
-    
-    if scores:
-        statistics["avg_score"] = sum(scores) / len(scores)
-        statistics["max_score"] = max(scores)
-        statistics["min_score"] = min(scores)
-    
-    return jsonify(statistics)
\ No newline at end of file
+    # คำนวณในฐานข้อมูลในการเรียกครั้งเดียว ขนาดของผลลัพธ์จึงไม่ขึ้นกับจำนวนนักเรียน
+    statistics = statistics_service.get_grade_statistics(g.user_id, assignment_id, student_id)
+    return jsonify(statistics)
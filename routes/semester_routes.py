@@ -1,10 +1,12 @@
 # grading_assistant/routes/semester_routes.py
 from flask import Blueprint, request, jsonify, g
-from models.database import SemesterModel
+from models.database import SemesterModel, SubmissionModel
 from services.auth_service import login_required
+from utils.helpers import get_pagination_args, paginated_response
 
 bp = Blueprint('semesters', __name__, url_prefix='/api/semesters')
 semester_model = SemesterModel()
+submission_model = SubmissionModel()
 
 @bp.route('/', methods=['GET'])
 @login_required
@@ -12,8 +14,63 @@ def get_semesters():
     """
     ดึงข้อมูลเทอมเรียนทั้งหมดของผู้ใช้
     """
-    result = semester_model.get_all(g.user_id)
-    return jsonify(result.data)
+    limit, after = get_pagination_args(request.args)
+    
+    result = semester_model.get_all(g.user_id, columns=semester_model.LIST_COLUMNS, limit=limit, after=after)
+    return paginated_response(result.data, limit)
+
+@bp.route('/tree', methods=['GET'])
+@login_required
+def get_semester_tree():
+    """
+    ดึงเทอม ชั้นเรียน วิชา และงานทั้งหมดพร้อมจำนวนงานที่ส่งของแต่ละงานในการเรียกครั้งเดียว
+    สำหรับแสดงโครงสร้างในหน้าแผงควบคุม
+    """
+    try:
+        semesters = semester_model.get_tree(g.user_id).data
+        counts = None
+    except Exception as e:
+        # ยังไม่ได้ติดตั้งตาราง assignment_statistics จึงนับจากงานที่ส่งแทน
+        print(f"assignment_statistics is not available, counting submissions: {str(e)}")
+        semesters = semester_model.get_tree(g.user_id, with_statistics=False).data
+        counts = _count_submissions(g.user_id)
+    
+    for semester in semesters:
+        for class_ in semester.get('classes') or []:
+            for subject in class_.get('subjects') or []:
+                for assignment in subject.get('assignments') or []:
+                    _attach_submission_counts(assignment, counts)
+    
+    return jsonify(semesters)
+
+def _count_submissions(user_id):
+    """นับงานที่ส่งตามสถานะของทุกงานของผู้ใช้ โดยดึงเฉพาะคอลัมน์ที่ใช้นับ"""
+    counts = {}
+    for submission in submission_model.get_all(user_id, columns='assignment_id, status').data:
+        statuses = counts.setdefault(submission['assignment_id'], {})
+        statuses[submission['status']] = statuses.get(submission['status'], 0) + 1
+    return counts
+
+def _attach_submission_counts(assignment, counts=None):
+    """เพิ่มจำนวนงานที่ส่ง งานที่ตรวจแล้ว และงานที่อนุมัติแล้วให้กับงาน"""
+    if counts is None:
+        statistics = assignment.pop('assignment_statistics', None)
+        # PostgREST คืนความสัมพันธ์แบบหนึ่งต่อหนึ่งเป็น object หรือ list ขึ้นกับเวอร์ชัน
+        if isinstance(statistics, list):
+            statistics = statistics[0] if statistics else None
+        statistics = statistics or {}
+        pending = statistics.get('pending_submissions', 0)
+        graded = statistics.get('graded_submissions', 0)
+        approved = statistics.get('approved_submissions', 0)
+    else:
+        statuses = counts.get(assignment['id'], {})
+        pending = statuses.get('pending', 0)
+        graded = statuses.get('graded', 0)
+        approved = statuses.get('approved', 0)
+    
+    assignment['submission_count'] = pending + graded + approved
+    assignment['graded_count'] = graded + approved
+    assignment['approved_count'] = approved
 
 @bp.route('/<semester_id>', methods=['GET'])
 @login_required
@@ -21,7 +78,7 @@ def get_semester(semester_id):
     """
     ดึงข้อมูลเทอมเรียนตาม ID
     """
-    result = semester_model.get_by_id(semester_id)
+    result = semester_model.get_owned(semester_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบเทอมเรียน"}), 404
     return jsonify(result.data[0])
@@ -56,15 +113,10 @@ def update_semester(semester_id):
     if not data:
         return jsonify({"error": "ข้อมูลไม่ถูกต้อง"}), 400
     
-    # ตรวจสอบว่าเทอมนี้เป็นของผู้ใช้หรือไม่
-    result = semester_model.get_by_id(semester_id)
+    # อัปเดตเฉพาะเทอมของผู้ใช้ ถ้าไม่มีแถวที่ถูกอัปเดตแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = semester_model.update_owned(semester_id, g.user_id, data)
     if not result.data:
         return jsonify({"error": "ไม่พบเทอมเรียน"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์แก้ไขเทอมเรียนนี้"}), 403
-    
-    result = semester_model.update(semester_id, data)
     return jsonify(result.data[0])
 
 @bp.route('/<semester_id>', methods=['DELETE'])
@@ -73,15 +125,10 @@ def delete_semester(semester_id):
     """
     ลบเทอมเรียน
     """
-    # ตรวจสอบว่าเทอมนี้เป็นของผู้ใช้หรือไม่
-    result = semester_model.get_by_id(semester_id)
+    # ลบเฉพาะเทอมของผู้ใช้ ถ้าไม่มีแถวที่ถูกลบแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = semester_model.delete_owned(semester_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบเทอมเรียน"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบเทอมเรียนนี้"}), 403
-    
-    semester_model.delete(semester_id)
     return jsonify({"message": "ลบเทอมเรียนสำเร็จ"})
 
 @bp.route('/with-classes', methods=['GET'])
@@ -3,8 +3,10 @@ from flask import Blueprint, request, jsonify, g
 from models.database import SolutionModel, AssignmentModel
 from services.auth_service import login_required
 from services.storage_service import StorageService
-from services.embedding_service import EmbeddingService
+from services.embedding_service import EmbeddingService, EmbeddingError
+from services.extraction_pipeline import extraction_pipeline
 from models.database import supabase
+from utils.helpers import get_pagination_args, paginated_response
 
 bp = Blueprint('solutions', __name__, url_prefix='/api/solutions')
 solution_model = SolutionModel()
@@ -18,14 +20,16 @@ def get_solutions():
     """
     ดึงข้อมูลเฉลยทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     assignment_id = request.args.get('assignment_id')
     
     if assignment_id:
-        result = solution_model.get_by_assignment(assignment_id, g.user_id)
+        result = solution_model.get_by_assignment(assignment_id, g.user_id, columns=solution_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = solution_model.get_all(g.user_id)
+        result = solution_model.get_all(g.user_id, columns=solution_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<solution_id>', methods=['GET'])
 @login_required
@@ -33,7 +37,7 @@ def get_solution(solution_id):
     """
     ดึงข้อมูลเฉลยตาม ID
     """
-    result = solution_model.get_by_id(solution_id)
+    result = solution_model.get_owned(solution_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบเฉลย"}), 404
     return jsonify(result.data[0])
@@ -50,13 +54,10 @@ def create_solution():
         return jsonify({"error": "กรุณาระบุงานที่ต้องการอัปโหลดเฉลย"}), 400
     
     # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    assignment_result = assignment_model.get_by_id(assignment_id)
+    assignment_result = assignment_model.get_owned(assignment_id, g.user_id, columns='id, folder_path')
     if not assignment_result.data:
         return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
     
-    if assignment_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์อัปโหลดเฉลยในงานนี้"}), 403
-    
     # ตรวจสอบว่ามีไฟล์หรือไม่
     if 'file' not in request.files:
         return jsonify({"error": "ไม่พบไฟล์"}), 400
@@ -65,16 +66,20 @@ def create_solution():
     if file.filename == '':
         return jsonify({"error": "ไม่ได้เลือกไฟล์"}), 400
     
-    # อัปโหลดไฟล์
+    if not storage_service.allowed_file(file.filename):
+        return jsonify({"error": "ไฟล์ไม่ถูกต้องหรือนามสกุลไม่ได้รับอนุญาต"}), 400
+    
+    # อ่านไฟล์ครั้งเดียว แล้วใช้ข้อมูลเดียวกันทั้งอัปโหลดและดึงข้อความ
+    file_data = file.read()
     folder_path = assignment_result.data[0].get('folder_path', 'solutions')
-    upload_result = storage_service.upload_file(file, f"{folder_path}/solutions", g.user_id)
+    upload_result = storage_service.upload_bytes(file_data, file.filename, file.content_type,
+                                                 f"{folder_path}/solutions", g.user_id)
     
     if "error" in upload_result:
         return jsonify(upload_result), 500
     
-    # ดึงข้อความจากไฟล์
-    file_data = storage_service.download_file(upload_result['path'])
-    content_text = storage_service.extract_text_from_file(file_data, upload_result['type'])
+    # ใช้ข้อความจากแคชถ้าไฟล์เดียวกันเคยถูกดึงข้อความแล้ว
+    content_text = extraction_pipeline.lookup(file_data, upload_result['type'])
     
     # สร้างข้อมูลเฉลย
     solution_data = {
@@ -83,6 +88,7 @@ def create_solution():
         "content_type": upload_result['type'],
         "file_size": upload_result['size'],
         "content_text": content_text,
+        "extraction_status": "done" if content_text is not None else "pending",
         "user_id": g.user_id,
         "assignment_id": assignment_id
     }
@@ -90,22 +96,33 @@ def create_solution():
     # บันทึกเฉลยลงฐานข้อมูล
     result = solution_model.create(solution_data)
     solution_id = result.data[0]['id']
-    
-    # สร้างและบันทึก embedding ของเฉลย
-    if content_text:
-        vector_id = embedding_service.store_solution_embedding(
-            solution_id,
-            content_text,
-            {
-                "assignment_id": assignment_id,
-                "file_name": upload_result['name']
-            }
-        )
-        
-        # อัปเดต vector_id ในฐานข้อมูล
-        solution_model.update(solution_id, {"vector_id": vector_id})
-    
-    return jsonify(result.data[0]), 201
+    user_id = g.user_id
+    
+    def store_embedding(content_text):
+        # ถ้าสร้าง embedding ไม่ได้ เฉลยยังใช้ตรวจแบบปกติได้ แต่จะไม่ถูกค้นหาด้วย RAG
+        try:
+            vector_id = embedding_service.store_solution_embedding(
+                solution_id,
+                content_text,
+                {
+                    "assignment_id": assignment_id,
+                    "user_id": user_id,
+                    "file_name": upload_result['name']
+                }
+            )
+            
+            # อัปเดต vector_id ในฐานข้อมูล
+            solution_model.update(solution_id, {"vector_id": vector_id})
+        except EmbeddingError as e:
+            print(f"Error creating solution embedding: {str(e)}")
+    
+    # ดึงข้อความ (ถ้าไม่พบในแคช) และสร้าง embedding ของเฉลยในเบื้องหลัง
+    extraction_pipeline.submit(solution_model, solution_id, file_data, upload_result['type'],
+                               on_complete=store_embedding, content_text=content_text)
+    
+    response = dict(result.data[0])
+    response["extraction_cache"] = "hit" if content_text is not None else "miss"
+    return jsonify(response), 201
 
 @bp.route('/<solution_id>', methods=['DELETE'])
 @login_required
@@ -113,14 +130,11 @@ def delete_solution(solution_id):
     """
     ลบเฉลย
     """
-    # ตรวจสอบว่าเฉลยนี้เป็นของผู้ใช้หรือไม่
-    result = solution_model.get_by_id(solution_id)
+    # ลบเฉพาะเฉลยของผู้ใช้ และใช้แถวที่ถูกลบเพื่อลบไฟล์และ embedding ต่อ
+    result = solution_model.delete_owned(solution_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบเฉลย"}), 404
     
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบเฉลยนี้"}), 403
-    
     # ลบไฟล์ที่เก็บไว้ (ถ้ามี)
     file_path = result.data[0].get('file_path')
     if file_path:
@@ -129,7 +143,6 @@ def delete_solution(solution_id):
     # ลบ vector embedding (ถ้ามี)
     vector_id = result.data[0].get('vector_id')
     if vector_id:
-        embedding_service.vector_db.delete_embedding(vector_id)
+        embedding_service.delete_embedding(vector_id)
     
-    solution_model.delete(solution_id)
     return jsonify({"message": "ลบเฉลยสำเร็จ"})
\ No newline at end of file
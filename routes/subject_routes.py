@@ -2,6 +2,7 @@
 from flask import Blueprint, request, jsonify, g
 from models.database import SubjectModel, ClassModel
 from services.auth_service import login_required
+from utils.helpers import get_pagination_args, paginated_response
 
 bp = Blueprint('subjects', __name__, url_prefix='/api/subjects')
 subject_model = SubjectModel()
@@ -13,14 +14,16 @@ def get_subjects():
     """
     ดึงข้อมูลวิชาทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     class_id = request.args.get('class_id')
     
     if class_id:
-        result = subject_model.get_by_class(class_id, g.user_id)
+        result = subject_model.get_by_class(class_id, g.user_id, columns=subject_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = subject_model.get_all(g.user_id)
+        result = subject_model.get_all(g.user_id, columns=subject_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<subject_id>', methods=['GET'])
 @login_required
@@ -28,7 +31,7 @@ def get_subject(subject_id):
     """
     ดึงข้อมูลวิชาตาม ID
     """
-    result = subject_model.get_by_id(subject_id)
+    result = subject_model.get_owned(subject_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบวิชา"}), 404
     return jsonify(result.data[0])
@@ -48,13 +51,10 @@ def create_subject():
         return jsonify({"error": "กรุณากรอกชื่อวิชาและชั้นเรียน"}), 400
     
     # ตรวจสอบว่าชั้นเรียนนี้เป็นของผู้ใช้หรือไม่
-    class_result = class_model.get_by_id(data['class_id'])
+    class_result = class_model.get_owned(data['class_id'], g.user_id, columns='id')
     if not class_result.data:
         return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
     
-    if class_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์สร้างวิชาในชั้นเรียนนี้"}), 403
-    
     # เพิ่ม user_id ลงในข้อมูล
     data['user_id'] = g.user_id
     
@@ -71,24 +71,16 @@ def update_subject(subject_id):
     if not data:
         return jsonify({"error": "ข้อมูลไม่ถูกต้อง"}), 400
     
-    # ตรวจสอบว่าวิชานี้เป็นของผู้ใช้หรือไม่
-    result = subject_model.get_by_id(subject_id)
-    if not result.data:
-        return jsonify({"error": "ไม่พบวิชา"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์แก้ไขวิชานี้"}), 403
-    
-    # ถ้ามีการเปลี่ยนชั้นเรียน ตรวจสอบว่าชั้นเรียนใหม่เป็นของผู้ใช้หรือไม่
-    if 'class_id' in data and data['class_id'] != result.data[0]['class_id']:
-        class_result = class_model.get_by_id(data['class_id'])
+    # ถ้ามีการย้ายวิชา ตรวจสอบว่าชั้นเรียนปลายทางเป็นของผู้ใช้หรือไม่
+    if 'class_id' in data:
+        class_result = class_model.get_owned(data['class_id'], g.user_id, columns='id')
         if not class_result.data:
             return jsonify({"error": "ไม่พบชั้นเรียน"}), 404
-        
-        if class_result.data[0]['user_id'] != g.user_id:
-            return jsonify({"error": "ไม่มีสิทธิ์ย้ายวิชาไปยังชั้นเรียนนี้"}), 403
     
-    result = subject_model.update(subject_id, data)
+    # อัปเดตเฉพาะวิชาของผู้ใช้ ถ้าไม่มีแถวที่ถูกอัปเดตแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = subject_model.update_owned(subject_id, g.user_id, data)
+    if not result.data:
+        return jsonify({"error": "ไม่พบวิชา"}), 404
     return jsonify(result.data[0])
 
 @bp.route('/<subject_id>', methods=['DELETE'])
@@ -97,13 +89,8 @@ def delete_subject(subject_id):
     """
     ลบวิชา
     """
-    # ตรวจสอบว่าวิชานี้เป็นของผู้ใช้หรือไม่
-    result = subject_model.get_by_id(subject_id)
+    # ลบเฉพาะวิชาของผู้ใช้ ถ้าไม่มีแถวที่ถูกลบแสดงว่าไม่พบหรือไม่ใช่ของผู้ใช้
+    result = subject_model.delete_owned(subject_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบวิชา"}), 404
-    
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบวิชานี้"}), 403
-    
-    subject_model.delete(subject_id)
     return jsonify({"message": "ลบวิชาสำเร็จ"})
\ No newline at end of file
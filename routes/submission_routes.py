@@ -1,16 +1,27 @@
 # grading_assistant/routes/submission_routes.py
-from flask import Blueprint, request, jsonify, g
-from models.database import SubmissionModel, AssignmentModel
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
+from models.database import SubmissionModel, AssignmentModel, GradeModel
 from services.auth_service import login_required
 from services.storage_service import StorageService
 from services.grading_service import GradingService
+from services.job_queue import GradingJobQueue
+from services.batch_grading_service import GRADING_USE_QUEUE
+from services.extraction_pipeline import extraction_pipeline
+from services.bulk_upload_service import BulkUploadService
 from models.database import supabase
+from utils.helpers import format_sse, get_pagination_args, paginated_response, get_id_list
 
 bp = Blueprint('submissions', __name__, url_prefix='/api/submissions')
 submission_model = SubmissionModel()
 assignment_model = AssignmentModel()
+grade_model = GradeModel()
 storage_service = StorageService(supabase)
 grading_service = GradingService()
+grading_job_queue = GradingJobQueue()
+bulk_upload_service = BulkUploadService(storage_service)
+
+# จำนวนงานที่ส่งสูงสุดต่อการรีเซ็ตหรือลบหนึ่งครั้ง
+BULK_ACTION_MAX_IDS = 200
 
 @bp.route('/', methods=['GET'])
 @login_required
@@ -18,17 +29,19 @@ def get_submissions():
     """
     ดึงข้อมูลงานที่นักเรียนส่งทั้งหมดของผู้ใช้
     """
+    limit, after = get_pagination_args(request.args)
+    
     assignment_id = request.args.get('assignment_id')
     status = request.args.get('status')
     
     if assignment_id:
-        result = submission_model.get_by_assignment(assignment_id, g.user_id)
+        result = submission_model.get_by_assignment(assignment_id, g.user_id, columns=submission_model.LIST_COLUMNS, limit=limit, after=after)
     elif status == 'pending':
-        result = submission_model.get_pending_submissions(g.user_id)
+        result = submission_model.get_pending_submissions(g.user_id, columns=submission_model.LIST_COLUMNS, limit=limit, after=after)
     else:
-        result = submission_model.get_all(g.user_id)
+        result = submission_model.get_all(g.user_id, columns=submission_model.LIST_COLUMNS, limit=limit, after=after)
         
-    return jsonify(result.data)
+    return paginated_response(result.data, limit)
 
 @bp.route('/<submission_id>', methods=['GET'])
 @login_required
@@ -36,7 +49,7 @@ def get_submission(submission_id):
     """
     ดึงข้อมูลงานที่นักเรียนส่งตาม ID
     """
-    result = submission_model.get_by_id(submission_id)
+    result = submission_model.get_owned(submission_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบงานที่นักเรียนส่ง"}), 404
     return jsonify(result.data[0])
@@ -55,13 +68,10 @@ def create_submission():
         return jsonify({"error": "กรุณากรอกข้อมูลให้ครบถ้วน"}), 400
     
     # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    assignment_result = assignment_model.get_by_id(assignment_id)
+    assignment_result = assignment_model.get_owned(assignment_id, g.user_id, columns='id, folder_path')
     if not assignment_result.data:
         return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
     
-    if assignment_result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์อัปโหลดงานในงานนี้"}), 403
-    
     # ตรวจสอบว่ามีไฟล์หรือไม่
     if 'file' not in request.files:
         return jsonify({"error": "ไม่พบไฟล์"}), 400
@@ -70,16 +80,20 @@ def create_submission():
     if file.filename == '':
         return jsonify({"error": "ไม่ได้เลือกไฟล์"}), 400
     
-    # อัปโหลดไฟล์
+    if not storage_service.allowed_file(file.filename):
+        return jsonify({"error": "ไฟล์ไม่ถูกต้องหรือนามสกุลไม่ได้รับอนุญาต"}), 400
+    
+    # อ่านไฟล์ครั้งเดียว แล้วใช้ข้อมูลเดียวกันทั้งอัปโหลดและดึงข้อความ
+    file_data = file.read()
     folder_path = assignment_result.data[0].get('folder_path', 'submissions')
-    upload_result = storage_service.upload_file(file, f"{folder_path}/submissions", g.user_id)
+    upload_result = storage_service.upload_bytes(file_data, file.filename, file.content_type,
+                                                 f"{folder_path}/submissions", g.user_id)
     
     if "error" in upload_result:
         return jsonify(upload_result), 500
     
-    # ดึงข้อความจากไฟล์
-    file_data = storage_service.download_file(upload_result['path'])
-    content_text = storage_service.extract_text_from_file(file_data, upload_result['type'])
+    # ใช้ข้อความจากแคชถ้าไฟล์เดียวกันเคยถูกดึงข้อความแล้ว
+    content_text = extraction_pipeline.lookup(file_data, upload_result['type'])
     
     # สร้างข้อมูลการส่งงาน
     submission_data = {
@@ -90,13 +104,99 @@ def create_submission():
         "content_type": upload_result['type'],
         "file_size": upload_result['size'],
         "content_text": content_text,
+        "extraction_status": "done" if content_text is not None else "pending",
         "status": "pending",
         "user_id": g.user_id,
         "assignment_id": assignment_id
     }
     
     result = submission_model.create(submission_data)
-    return jsonify(result.data[0]), 201
+    
+    # ดึงข้อความในเบื้องหลัง โดย extraction_status จะเปลี่ยนเป็น done เมื่อข้อความพร้อม
+    if content_text is None:
+        extraction_pipeline.submit(submission_model, result.data[0]['id'], file_data, upload_result['type'])
+    
+    response = dict(result.data[0])
+    response["extraction_cache"] = "hit" if content_text is not None else "miss"
+    return jsonify(response), 201
+
+@bp.route('/bulk', methods=['POST'])
+@login_required
+def bulk_create_submissions():
+    """
+    อัปโหลดงานที่นักเรียนส่งหลายไฟล์ในครั้งเดียว จากไฟล์ ZIP (archive) หรือหลายไฟล์ (files)
+    โดยจับคู่ไฟล์กับนักเรียนจากไฟล์ CSV (mapping) หรือรูปแบบชื่อไฟล์ (pattern)
+    """
+    assignment_id = request.form.get('assignment_id')
+    if not assignment_id:
+        return jsonify({"error": "กรุณาระบุงานที่ต้องการอัปโหลด"}), 400
+    
+    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
+    assignment_result = assignment_model.get_owned(assignment_id, g.user_id, columns='id, folder_path')
+    if not assignment_result.data:
+        return jsonify({"error": "ไม่พบงานที่ต้องการ"}), 404
+    
+    archive = request.files.get('archive')
+    files = request.files.getlist('files')
+    if (archive is None or archive.filename == '') and not any(file.filename for file in files):
+        return jsonify({"error": "ไม่พบไฟล์"}), 400
+    
+    report = bulk_upload_service.upload(
+        assignment_result.data[0],
+        g.user_id,
+        archive=archive if archive is not None and archive.filename else None,
+        files=files,
+        mapping_file=request.files.get('mapping'),
+        pattern=request.form.get('pattern')
+    )
+    
+    if "error" in report:
+        return jsonify(report), 400
+    
+    return jsonify(report), 201 if report['created'] else 400
+
+@bp.route('/reset', methods=['POST'])
+@login_required
+def reset_submissions():
+    """
+    ลบคะแนนและเปลี่ยนสถานะของงานที่ส่งหลายรายการกลับเป็น pending เพื่อตรวจใหม่
+    """
+    submission_ids = get_id_list(request.json, 'submission_ids', BULK_ACTION_MAX_IDS)
+    if submission_ids is None:
+        return jsonify({"error": f"กรุณาระบุรายการ ID ของงานที่ส่ง (ไม่เกิน {BULK_ACTION_MAX_IDS} รายการ)"}), 400
+    
+    grade_model.delete_by('submission_id', submission_ids, g.user_id)
+    result = submission_model.update_many(submission_ids, {"status": "pending"}, g.user_id)
+    
+    return jsonify({
+        "reset": len(result.data),
+        "submission_ids": [submission['id'] for submission in result.data]
+    })
+
+@bp.route('/bulk-delete', methods=['POST'])
+@login_required
+def bulk_delete_submissions():
+    """
+    ลบงานที่ส่งหลายรายการพร้อมคะแนนและไฟล์ในครั้งเดียว
+    """
+    submission_ids = get_id_list(request.json, 'submission_ids', BULK_ACTION_MAX_IDS)
+    if submission_ids is None:
+        return jsonify({"error": f"กรุณาระบุรายการ ID ของงานที่ส่ง (ไม่เกิน {BULK_ACTION_MAX_IDS} รายการ)"}), 400
+    
+    # ดึงเฉพาะงานที่ส่งของผู้ใช้ เพื่อไม่ให้ลบข้อมูลของผู้อื่น
+    submissions = submission_model.get_by('id', submission_ids, g.user_id, columns='id, file_path').data
+    if not submissions:
+        return jsonify({"error": "ไม่พบงานที่ส่ง"}), 404
+    
+    submission_ids = [submission['id'] for submission in submissions]
+    grade_model.delete_by('submission_id', submission_ids, g.user_id)
+    submission_model.delete_many(submission_ids, g.user_id)
+    storage_service.delete_files([submission['file_path'] for submission in submissions])
+    
+    return jsonify({
+        "deleted": len(submission_ids),
+        "submission_ids": submission_ids
+    })
 
 @bp.route('/<submission_id>/grade', methods=['POST'])
 @login_required
@@ -104,51 +204,108 @@ def grade_submission(submission_id):
     """
     ตรวจงานที่นักเรียนส่ง
     """
-    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    result = submission_model.get_by_id(submission_id)
+    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่ โดยดึงเฉพาะคอลัมน์ที่ใช้ตรวจสอบ
+    result = submission_model.get_owned(submission_id, g.user_id, columns='id, status, extraction_status, assignment_id')
     if not result.data:
         return jsonify({"error": "ไม่พบงานที่นักเรียนส่ง"}), 404
     
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ตรวจงานนี้"}), 403
-    
     # ตรวจสอบสถานะ
     if result.data[0]['status'] != 'pending':
         return jsonify({"error": "งานนี้ถูกตรวจแล้ว"}), 400
     
+    # ตรวจได้เมื่อดึงข้อความจากไฟล์เสร็จแล้วเท่านั้น
+    if result.data[0].get('extraction_status', 'done') != 'done':
+        return jsonify({"error": "ยังดึงข้อความจากไฟล์ไม่เสร็จ", "extraction_status": result.data[0]['extraction_status']}), 409
+    
     # เลือกวิธีการตรวจ
     use_rag = request.args.get('use_rag', 'true').lower() == 'true'
     
+    # ส่งเข้าคิวถาวรให้ grading worker ตรวจ โดยไม่ต้องรอผลจาก LLM ใน request นี้
+    use_queue = request.args.get('queue', str(GRADING_USE_QUEUE)).lower() == 'true'
+    if use_queue:
+        job = grading_job_queue.enqueue(submission_id, g.user_id, use_rag,
+                                        assignment_id=result.data[0]['assignment_id'])
+        return jsonify(job), 202
+    
+    # ข้ามแคชผลการตรวจเพื่อบังคับให้ LLM ตรวจใหม่
+    use_cache = request.args.get('no_cache', 'false').lower() != 'true'
+    
     if use_rag:
         # ตรวจโดยใช้ RAG
-        grading_result = grading_service.grade_with_rag(submission_id)
+        grading_result = grading_service.grade_with_rag(submission_id, use_cache)
     else:
         # ตรวจโดยใช้ LLM โดยตรง
-        grading_result = grading_service.grade_submission_with_llm(submission_id)
+        grading_result = grading_service.grade_submission_with_llm(submission_id, use_cache)
     
     if "error" in grading_result:
         return jsonify(grading_result), 500
     
     return jsonify(grading_result)
 
+@bp.route('/<submission_id>/grade/stream', methods=['POST'])
+@login_required
+def grade_submission_stream(submission_id):
+    """
+    ตรวจงานที่นักเรียนส่งและส่งข้อความจาก LLM กลับแบบ Server-Sent Events
+    """
+    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่ โดยดึงเฉพาะคอลัมน์ที่ใช้ตรวจสอบ
+    result = submission_model.get_owned(submission_id, g.user_id, columns='id, status, extraction_status, assignment_id')
+    if not result.data:
+        return jsonify({"error": "ไม่พบงานที่นักเรียนส่ง"}), 404
+    
+    # ตรวจสอบสถานะ
+    if result.data[0]['status'] != 'pending':
+        return jsonify({"error": "งานนี้ถูกตรวจแล้ว"}), 400
+    
+    # ตรวจได้เมื่อดึงข้อความจากไฟล์เสร็จแล้วเท่านั้น
+    if result.data[0].get('extraction_status', 'done') != 'done':
+        return jsonify({"error": "ยังดึงข้อความจากไฟล์ไม่เสร็จ", "extraction_status": result.data[0]['extraction_status']}), 409
+    
+    use_rag = request.args.get('use_rag', 'true').lower() == 'true'
+    use_cache = request.args.get('no_cache', 'false').lower() != 'true'
+    
+    def generate():
+        for event, data in grading_service.grade_submission_stream(submission_id, use_rag, use_cache):
+            yield format_sse(event, data)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_grading_job(job_id):
+    """
+    ดึงสถานะงานตรวจในคิว
+    """
+    job = grading_job_queue.get(job_id)
+    if not job or job['user_id'] != g.user_id:
+        return jsonify({"error": "ไม่พบงานตรวจที่ต้องการ"}), 404
+    
+    return jsonify(job)
+
 @bp.route('/<submission_id>', methods=['DELETE'])
 @login_required
 def delete_submission(submission_id):
     """
     ลบงานที่นักเรียนส่ง
     """
-    # ตรวจสอบว่างานนี้เป็นของผู้ใช้หรือไม่
-    result = submission_model.get_by_id(submission_id)
+    # ลบคะแนนก่อน เพื่อให้สถิติของงานที่คำนวณไว้ล่วงหน้าลบคะแนนนี้ออกด้วย (เหมือน bulk_delete_submissions)
+    grade_model.delete_by('submission_id', [submission_id], g.user_id)
+    
+    # ลบเฉพาะงานของผู้ใช้ และใช้แถวที่ถูกลบเพื่อลบไฟล์ต่อ
+    result = submission_model.delete_owned(submission_id, g.user_id)
     if not result.data:
         return jsonify({"error": "ไม่พบงานที่นักเรียนส่ง"}), 404
     
-    if result.data[0]['user_id'] != g.user_id:
-        return jsonify({"error": "ไม่มีสิทธิ์ลบงานนี้"}), 403
-    
     # ลบไฟล์ที่เก็บไว้ (ถ้ามี)
     file_path = result.data[0].get('file_path')
     if file_path:
         storage_service.delete_file(file_path)
     
-    submission_model.delete(submission_id)
     return jsonify({"message": "ลบงานที่นักเรียนส่งสำเร็จ"})
\ No newline at end of file
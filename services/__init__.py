@@ -3,4 +3,8 @@
 โมดูลสำหรับเซอร์วิสต่างๆ
 """
 # เปิดใช้งานการ import ทั้งหมดจากโมดูลนี้
-__all__ = ['auth_service', 'storage_service', 'llm_service', 'embedding_service', 'grading_service']
\ No newline at end of file
+__all__ = ['auth_service', 'storage_service', 'llm_service', 'embedding_service', 'grading_service',
+           'batch_grading_service', 'job_queue', 'grading_worker',
+           'http_client', 'async_http_client', 'embedding_cache', 'grading_cache',
+           'extraction_pipeline', 'ocr_service', 'extraction_cache', 'bulk_upload_service',
+           'statistics_service', 'context_packer']
\ No newline at end of file
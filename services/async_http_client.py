@@ -0,0 +1,109 @@
+# grading_assistant/services/async_http_client.py
+import asyncio
+import contextlib
+import httpx
+from services.http_client import (
+    _Counters, LMSTUDIO_POOL_SIZE, LMSTUDIO_CONNECT_TIMEOUT, LMSTUDIO_READ_TIMEOUT,
+    LMSTUDIO_MAX_RETRIES, LMSTUDIO_RETRY_BACKOFF
+)
+
+# สถานะที่ถือว่าเป็นข้อผิดพลาดชั่วคราวและลองใหม่ได้ (เหมือน PooledHTTPClient)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+class AsyncPooledHTTPClient:
+    """
+    HTTP client แบบ async ที่ใช้ connection pool ร่วมกัน สำหรับโหมด ASGI
+    คำขอที่รอ connection ว่างจะรอใน event loop โดยไม่ใช้ thread จึงรองรับคำขอค้างพร้อมกันได้จำนวนมาก
+    """
+    def __init__(self, pool_size=LMSTUDIO_POOL_SIZE, connect_timeout=LMSTUDIO_CONNECT_TIMEOUT,
+                 read_timeout=LMSTUDIO_READ_TIMEOUT, max_retries=LMSTUDIO_MAX_RETRIES,
+                 retry_backoff=LMSTUDIO_RETRY_BACKOFF):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # ไม่จำกัดเวลารอ connection ว่างใน pool เพราะคำขอที่เกินขนาด pool ต้องรอคิว LMStudio อยู่แล้ว
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=None)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.counters = _Counters()
+        self._client = None
+
+    @property
+    def client(self):
+        """httpx.AsyncClient ที่สร้างเมื่อใช้งานครั้งแรกภายใน event loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def post(self, url, **kwargs):
+        """
+        ส่งคำขอ POST และลองใหม่เมื่อเชื่อมต่อไม่ได้หรือได้สถานะข้อผิดพลาดชั่วคราว
+
+        Args:
+            url (str): URL ปลายทาง
+            **kwargs: อาร์กิวเมนต์เพิ่มเติมของ httpx
+
+        Returns:
+            httpx.Response: การตอบกลับ
+        """
+        self.counters.increment('requests')
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(url, **kwargs)
+            except httpx.ConnectError:
+                # ไม่ลองใหม่เมื่ออ่านข้อมูลค้าง เพราะ LLM อาจประมวลผลคำขอเดิมอยู่
+                if attempt == self.max_retries:
+                    self.counters.increment('errors')
+                    raise
+            except httpx.HTTPError:
+                self.counters.increment('errors')
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+
+            self.counters.increment('retries')
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url, **kwargs):
+        """
+        ส่งคำขอ POST แบบ streaming
+
+        Args:
+            url (str): URL ปลายทาง
+            **kwargs: อาร์กิวเมนต์เพิ่มเติมของ httpx
+
+        Yields:
+            httpx.Response: การตอบกลับที่อ่าน body ทีละส่วนได้
+        """
+        self.counters.increment('requests')
+        try:
+            async with self.client.stream("POST", url, **kwargs) as response:
+                yield response
+        except httpx.HTTPError:
+            self.counters.increment('errors')
+            raise
+
+    def pool_stats(self):
+        """
+        ดึงสถิติของ connection pool
+
+        Returns:
+            dict: จำนวนคำขอ ข้อผิดพลาด และการลองใหม่
+        """
+        stats = self.counters.snapshot()
+        stats.update({
+            "pool_size": self.pool_size,
+            "connect_timeout": self.timeout.connect,
+            "read_timeout": self.timeout.read
+        })
+        return stats
+
+    async def aclose(self):
+        """ปิด connection ทั้งหมดเมื่อหยุดการทำงาน"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# client ที่ใช้ร่วมกันสำหรับทุกการเรียก LMStudio ในโหมด ASGI
+async_lmstudio_client = AsyncPooledHTTPClient()
@@ -129,28 +129,41 @@ class AuthService:
         except Exception as e:
             return {"error": f"เกิดข้อผิดพลาดในการออกจากระบบ: {str(e)}"}
 
+def authenticate_header(auth_header):
+    """
+    ตรวจสอบ JWT token จาก header Authorization ใช้ร่วมกันทั้ง Flask และ route แบบ async
+    
+    Args:
+        auth_header (str): ค่าของ header Authorization
+        
+    Returns:
+        tuple: (ข้อมูลใน token, None) ถ้าถูกต้อง หรือ (None, ข้อความข้อผิดพลาด)
+    """
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, "ไม่มีการยืนยันตัวตน"
+    
+    token = auth_header.split(' ')[1]
+    
+    try:
+        # ตรวจสอบ JWT token
+        return jwt.decode(token, JWT_SECRET, algorithms=["HS256"]), None
+    except jwt.ExpiredSignatureError:
+        return None, "หมดเวลาการเข้าสู่ระบบ"
+    except jwt.InvalidTokenError:
+        return None, "Token ไม่ถูกต้อง"
+
 # Decorator สำหรับการตรวจสอบการยืนยันตัวตน
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "ไม่มีการยืนยันตัวตน"}), 401
+        payload, error = authenticate_header(request.headers.get('Authorization'))
+        if error:
+            return jsonify({"error": error}), 401
         
-        token = auth_header.split(' ')[1]
-        
-        try:
-            # ตรวจสอบ JWT token
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            g.user_id = payload["user_id"]
-            g.user_email = payload["email"]
-            g.user_role = payload["role"]
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "หมดเวลาการเข้าสู่ระบบ"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Token ไม่ถูกต้อง"}), 401
+        g.user_id = payload["user_id"]
+        g.user_email = payload["email"]
+        g.user_role = payload["role"]
         
         return f(*args, **kwargs)
     
-    return decorated_function
\ No newline at end of file
+    return decorated_function
@@ -0,0 +1,253 @@
+# grading_assistant/services/batch_grading_service.py
+import os
+import uuid
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from services.grading_service import GradingService
+from services.job_queue import GradingJobQueue
+from models.database import SubmissionModel
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# จำนวน worker สูงสุดที่ใช้ตรวจงานพร้อมกัน
+GRADING_MAX_WORKERS = int(os.getenv("GRADING_MAX_WORKERS", "4"))
+# จำนวนงานตรวจที่เสร็จแล้วที่เก็บสถานะไว้ในหน่วยความจำ
+GRADING_JOB_HISTORY = int(os.getenv("GRADING_JOB_HISTORY", "100"))
+# ส่งงานตรวจเข้าคิวถาวรแทนการตรวจใน process ของเว็บเป็นค่าเริ่มต้นหรือไม่
+GRADING_USE_QUEUE = os.getenv("GRADING_USE_QUEUE", "False") == "True"
+
+class BatchGradingService:
+    """
+    คลาสสำหรับตรวจงานที่ส่งทั้งหมดของงานหนึ่งๆ แบบกลุ่มผ่าน worker pool ที่จำกัดขนาด
+    """
+    def __init__(self, grading_service=None, max_workers=GRADING_MAX_WORKERS, job_queue=None):
+        self.grading_service = grading_service or GradingService()
+        self.submission_model = SubmissionModel()
+        self.job_queue = job_queue or GradingJobQueue()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grading")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        # ใช้แยกจาก self.lock เพื่อไม่ให้การเริ่มงานตรวจขวางการอัปเดตความคืบหน้าระหว่างรอฐานข้อมูล
+        self.start_lock = threading.Lock()
+
+    def start_job(self, assignment_id, user_id, use_rag=True, durable=GRADING_USE_QUEUE):
+        """
+        สร้างงานตรวจแบบกลุ่มสำหรับงานที่ส่งทุกชิ้นที่มีสถานะ pending
+
+        Args:
+            assignment_id (str): ID ของงาน
+            user_id (str): ID ของผู้ใช้
+            use_rag (bool, optional): ใช้การตรวจแบบ RAG หรือไม่
+            durable (bool, optional): ส่งงานเข้าคิวถาวรให้ grading worker ตรวจแทนการตรวจใน process นี้
+
+        Returns:
+            dict: ข้อมูลงานตรวจ หรือข้อความข้อผิดพลาดถ้ามีงานตรวจของงานนี้กำลังทำอยู่
+        """
+        # ตรวจสอบงานตรวจที่กำลังทำอยู่และลงทะเบียนงานใหม่ภายใต้ lock เดียวกัน
+        # เพื่อไม่ให้คำขอที่มาพร้อมกันสร้างงานตรวจของงานเดียวกันซ้ำ
+        with self.start_lock:
+            with self.lock:
+                for job in self.jobs.values():
+                    if job['assignment_id'] == assignment_id and job['status'] in ('queued', 'running'):
+                        return {"error": "งานนี้กำลังถูกตรวจอยู่", "job_id": job['id']}
+
+            # งานตรวจแบบกลุ่มในคิวถาวรยังทำงานต่อได้หลัง process เริ่มใหม่ จึงต้องตรวจสอบจากคิวด้วย
+            active_batch_id = self.job_queue.get_active_batch(assignment_id)
+            if active_batch_id:
+                return {"error": "งานนี้กำลังถูกตรวจอยู่", "job_id": active_batch_id}
+
+            submissions = self.submission_model.get_pending_by_assignment(assignment_id, user_id).data
+
+            job_id = str(uuid.uuid4())
+
+            if durable:
+                # ใช้ job_id เป็น batch_id ของงานในคิว เพื่อให้ติดตามความคืบหน้าได้แม้ process เริ่มใหม่
+                for submission in submissions:
+                    self.job_queue.enqueue(submission['id'], user_id, use_rag,
+                                           assignment_id=assignment_id, batch_id=job_id)
+                return self._snapshot_from_queue(job_id, user_id, assignment_id,
+                                                 "rag" if use_rag else "llm", submissions)
+
+            job = {
+                "id": job_id,
+                "assignment_id": assignment_id,
+                "user_id": user_id,
+                "method": "rag" if use_rag else "llm",
+                "status": "queued" if submissions else "completed",
+                "created_at": self._now(),
+                "finished_at": None if submissions else self._now(),
+                "total": len(submissions),
+                "completed": 0,
+                "failed": 0,
+                "items": [
+                    {
+                        "submission_id": submission['id'],
+                        "student_id": submission.get('student_id'),
+                        "student_name": submission.get('student_name'),
+                        "status": "queued",
+                        "grade_id": None,
+                        "score": None,
+                        "error": None
+                    }
+                    for submission in submissions
+                ]
+            }
+
+            with self.lock:
+                self._prune_jobs()
+                self.jobs[job_id] = job
+
+            # ส่งงานแต่ละชิ้นเข้า worker pool
+            for index in range(len(job['items'])):
+                self.executor.submit(self._grade_item, job_id, index, use_rag)
+
+        return self.get_job(job_id, user_id)
+
+    def get_job(self, job_id, user_id):
+        """
+        ดึงสถานะของงานตรวจแบบกลุ่ม
+
+        Args:
+            job_id (str): ID ของงานตรวจ
+            user_id (str): ID ของผู้ใช้
+
+        Returns:
+            dict: สำเนาข้อมูลงานตรวจ หรือ None ถ้าไม่พบ
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                if job['user_id'] != user_id:
+                    return None
+                snapshot = {key: value for key, value in job.items() if key != 'items'}
+                snapshot['items'] = [item.copy() for item in job['items']]
+                return snapshot
+
+        # งานที่ไม่อยู่ในหน่วยความจำอาจเป็นงานที่ส่งเข้าคิวถาวร
+        return self._snapshot_from_queue(job_id, user_id)
+
+    def _snapshot_from_queue(self, job_id, user_id, assignment_id=None, method=None, submissions=None):
+        """
+        สร้างข้อมูลสถานะของงานตรวจแบบกลุ่มจากงานในคิวถาวร
+
+        Args:
+            job_id (str): ID ของงานตรวจ (batch_id ในคิว)
+            user_id (str): ID ของผู้ใช้
+            assignment_id (str, optional): ID ของงาน ใช้เมื่อยังไม่มีงานในคิว
+            method (str, optional): วิธีการตรวจ ใช้เมื่อยังไม่มีงานในคิว
+            submissions (list, optional): ข้อมูลงานที่ส่ง ใช้เติมชื่อและรหัสนักเรียน
+
+        Returns:
+            dict: ข้อมูลงานตรวจ หรือ None ถ้าไม่พบ
+        """
+        queued_jobs = self.job_queue.get_by_batch(job_id)
+        if not queued_jobs and assignment_id is None:
+            return None
+        if any(queued['user_id'] != user_id for queued in queued_jobs):
+            return None
+
+        students = {submission['id']: submission for submission in (submissions or [])}
+        item_status = {'queued': 'queued', 'leased': 'running', 'done': 'graded', 'failed': 'failed'}
+
+        items = []
+        for queued in queued_jobs:
+            student = students.get(queued['submission_id'], {})
+            result = queued.get('result') or {}
+            items.append({
+                "submission_id": queued['submission_id'],
+                "student_id": student.get('student_id'),
+                "student_name": student.get('student_name'),
+                "status": item_status.get(queued['status'], queued['status']),
+                "queue_job_id": queued['id'],
+                "attempts": queued['attempts'],
+                "grade_id": result.get('grade_id'),
+                "score": result.get('score'),
+                "error": queued['last_error'] if queued['status'] == 'failed' else None
+            })
+
+        completed = sum(1 for item in items if item['status'] == 'graded')
+        failed = sum(1 for item in items if item['status'] == 'failed')
+        finished = completed + failed == len(items)
+
+        if finished:
+            status = 'completed'
+        elif any(item['status'] != 'queued' for item in items):
+            status = 'running'
+        else:
+            status = 'queued'
+
+        return {
+            "id": job_id,
+            "assignment_id": queued_jobs[0]['assignment_id'] if queued_jobs else assignment_id,
+            "user_id": user_id,
+            "method": method or ("rag" if queued_jobs[0]['use_rag'] else "llm"),
+            "durable": True,
+            "status": status,
+            "created_at": self._format_timestamp(queued_jobs[0]['created_at']) if queued_jobs else self._now(),
+            "finished_at": self._format_timestamp(max(q['updated_at'] for q in queued_jobs)) if queued_jobs and finished else None,
+            "total": len(items),
+            "completed": completed,
+            "failed": failed,
+            "items": items
+        }
+
+    def _grade_item(self, job_id, index, use_rag):
+        """
+        ตรวจงานที่ส่งหนึ่งชิ้นภายใน worker และอัปเดตความคืบหน้า
+
+        Args:
+            job_id (str): ID ของงานตรวจ
+            index (int): ลำดับของงานที่ส่งในงานตรวจ
+            use_rag (bool): ใช้การตรวจแบบ RAG หรือไม่
+        """
+        with self.lock:
+            job = self.jobs[job_id]
+            item = job['items'][index]
+            job['status'] = 'running'
+            item['status'] = 'running'
+
+        try:
+            if use_rag:
+                result = self.grading_service.grade_with_rag(item['submission_id'])
+            else:
+                result = self.grading_service.grade_submission_with_llm(item['submission_id'])
+        except Exception as e:
+            print(f"Exception in batch grading: {str(e)}")
+            result = {"error": f"เกิดข้อผิดพลาดในการตรวจงาน: {str(e)}"}
+
+        with self.lock:
+            if "error" in result:
+                item['status'] = 'failed'
+                item['error'] = result['error']
+                job['failed'] += 1
+            else:
+                item['status'] = 'graded'
+                item['grade_id'] = result.get('grade_id')
+                item['score'] = result.get('score')
+                job['completed'] += 1
+
+            if job['completed'] + job['failed'] == job['total']:
+                job['status'] = 'completed'
+                job['finished_at'] = self._now()
+
+    def _prune_jobs(self):
+        """ลบงานตรวจที่เสร็จแล้วที่เก่าที่สุดเมื่อเกินจำนวนที่กำหนด"""
+        finished = [job for job in self.jobs.values() if job['status'] == 'completed']
+        excess = len(finished) - GRADING_JOB_HISTORY + 1
+        if excess > 0:
+            finished.sort(key=lambda job: job['finished_at'])
+            for job in finished[:excess]:
+                del self.jobs[job['id']]
+
+    @staticmethod
+    def _now():
+        """เวลาปัจจุบันในรูปแบบ ISO"""
+        return datetime.now(timezone.utc).isoformat()
+
+    @staticmethod
+    def _format_timestamp(timestamp):
+        """แปลง Unix timestamp เป็นรูปแบบ ISO"""
+        return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
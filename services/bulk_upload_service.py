@@ -0,0 +1,292 @@
+# grading_assistant/services/bulk_upload_service.py
+import os
+import io
+import re
+import csv
+import zlib
+import zipfile
+import tempfile
+import mimetypes
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from services.extraction_pipeline import extraction_pipeline
+from models.database import SubmissionModel
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# จำนวนไฟล์ที่อัปโหลดไปยัง storage พร้อมกัน
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "8"))
+# จำนวนไฟล์สูงสุดต่อการอัปโหลดหนึ่งครั้ง
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "200"))
+# ขนาดสูงสุดของแต่ละไฟล์ใน ZIP หลังแตกไฟล์
+BULK_UPLOAD_MAX_FILE_MB = int(os.getenv("BULK_UPLOAD_MAX_FILE_MB", "16"))
+# ขนาดรวมสูงสุดของทุกไฟล์ใน ZIP หลังแตกไฟล์
+BULK_UPLOAD_MAX_TOTAL_MB = int(os.getenv("BULK_UPLOAD_MAX_TOTAL_MB", "256"))
+# โฟลเดอร์ที่เก็บไฟล์ชั่วคราวระหว่างรอดึงข้อความ (ค่าเริ่มต้นคือโฟลเดอร์ชั่วคราวของระบบ)
+BULK_UPLOAD_SPOOL_DIR = os.getenv("BULK_UPLOAD_SPOOL_DIR") or None
+# รูปแบบชื่อไฟล์ค่าเริ่มต้น เช่น 6401234_สมชาย ใจดี.pdf
+DEFAULT_FILENAME_PATTERN = r"^(?P<student_id>[^_\s]+)[_\s-]+(?P<student_name>.+)$"
+
+class BulkUploadError(Exception):
+    """ข้อผิดพลาดของไฟล์ที่อัปโหลดทั้งชุด เช่น ZIP มีจำนวนไฟล์หรือขนาดรวมเกินกำหนด"""
+
+class BulkUploadService:
+    """
+    คลาสสำหรับอัปโหลดงานที่นักเรียนส่งหลายไฟล์ในครั้งเดียว จากไฟล์ ZIP หรือหลายไฟล์
+    """
+    def __init__(self, storage_service, max_workers=BULK_UPLOAD_WORKERS):
+        self.storage_service = storage_service
+        self.submission_model = SubmissionModel()
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-upload")
+
+    def parse_mapping(self, mapping_file):
+        """
+        อ่านไฟล์ CSV ที่จับคู่ชื่อไฟล์กับนักเรียน (คอลัมน์ filename, student_id, student_name)
+
+        Args:
+            mapping_file (FileStorage): ไฟล์ CSV
+
+        Returns:
+            dict: ชื่อไฟล์ -> (student_id, student_name)
+        """
+        mapping = {}
+        reader = csv.DictReader(io.TextIOWrapper(mapping_file.stream, encoding="utf-8-sig"))
+        for row in reader:
+            filename = (row.get("filename") or "").strip()
+            student_id = (row.get("student_id") or "").strip()
+            if filename and student_id:
+                mapping[os.path.basename(filename)] = (student_id, (row.get("student_name") or "").strip())
+        return mapping
+
+    def iter_files(self, archive=None, files=()):
+        """
+        อ่านไฟล์จาก ZIP ทีละรายการโดยไม่แตกไฟล์ลงดิสก์ และไฟล์ที่อัปโหลดมาโดยตรง
+
+        Args:
+            archive (FileStorage, optional): ไฟล์ ZIP
+            files (list, optional): รายการไฟล์ที่อัปโหลด
+
+        Yields:
+            tuple: (ชื่อไฟล์, ข้อมูลไฟล์, ข้อความข้อผิดพลาด) โดยข้อมูลไฟล์เป็น None ถ้าอ่านไฟล์ไม่ได้
+
+        Raises:
+            BulkUploadError: ถ้า ZIP มีจำนวนไฟล์หรือขนาดรวมหลังแตกไฟล์เกินกำหนด
+        """
+        max_bytes = BULK_UPLOAD_MAX_FILE_MB * 1024 * 1024
+        max_total_bytes = BULK_UPLOAD_MAX_TOTAL_MB * 1024 * 1024
+
+        if archive is not None:
+            with zipfile.ZipFile(archive.stream) as zf:
+                # ข้ามโฟลเดอร์และไฟล์ระบบ เช่น __MACOSX และไฟล์ที่ขึ้นต้นด้วยจุด
+                entries = [
+                    info for info in zf.infolist()
+                    if not info.is_dir() and not os.path.basename(info.filename).startswith(".")
+                    and os.path.basename(info.filename) and not info.filename.startswith("__MACOSX/")
+                ]
+
+                # ตรวจจำนวนไฟล์และขนาดรวมจากส่วนหัวของ ZIP ก่อนอ่านข้อมูลจริง
+                if len(entries) > BULK_UPLOAD_MAX_FILES:
+                    raise BulkUploadError(f"ไฟล์ ZIP มีไฟล์เกินจำนวนสูงสุด {BULK_UPLOAD_MAX_FILES} ไฟล์")
+                if sum(info.file_size for info in entries) > max_total_bytes:
+                    raise BulkUploadError(f"ไฟล์ใน ZIP มีขนาดรวมเกิน {BULK_UPLOAD_MAX_TOTAL_MB} MB")
+
+                total_bytes = 0
+                for info in entries:
+                    filename = os.path.basename(info.filename)
+                    if info.file_size > max_bytes:
+                        yield filename, None, f"ไฟล์มีขนาดเกิน {BULK_UPLOAD_MAX_FILE_MB} MB"
+                        continue
+                    # อ่านไม่เกินขนาดที่กำหนด เพราะขนาดในส่วนหัวของ ZIP อาจไม่ตรงกับข้อมูลจริง
+                    # ไฟล์ที่เข้ารหัส ใช้วิธีบีบอัดที่ไม่รองรับ หรือข้อมูลเสีย ให้เป็นข้อผิดพลาดของไฟล์นั้นเท่านั้น
+                    try:
+                        with zf.open(info) as entry:
+                            file_data = entry.read(max_bytes + 1)
+                    except (RuntimeError, NotImplementedError, zlib.error, zipfile.BadZipFile, EOFError) as e:
+                        yield filename, None, f"อ่านไฟล์ใน ZIP ไม่ได้: {str(e)}"
+                        continue
+
+                    if len(file_data) > max_bytes:
+                        yield filename, None, f"ไฟล์มีขนาดเกิน {BULK_UPLOAD_MAX_FILE_MB} MB"
+                        continue
+
+                    # ขนาดจริงอาจมากกว่าที่ระบุในส่วนหัว จึงหยุดอ่านเมื่อขนาดรวมที่อ่านได้เกินกำหนด
+                    total_bytes += len(file_data)
+                    if total_bytes > max_total_bytes:
+                        raise BulkUploadError(f"ไฟล์ใน ZIP มีขนาดรวมเกิน {BULK_UPLOAD_MAX_TOTAL_MB} MB")
+                    yield filename, file_data, None
+
+        for file in files:
+            if file and file.filename:
+                yield os.path.basename(file.filename), file.read(), None
+
+    def resolve_student(self, filename, mapping, pattern):
+        """
+        หารหัสและชื่อนักเรียนของไฟล์จาก CSV หรือจากรูปแบบชื่อไฟล์
+
+        Args:
+            filename (str): ชื่อไฟล์
+            mapping (dict): ชื่อไฟล์ -> (student_id, student_name) จาก CSV
+            pattern (re.Pattern): รูปแบบชื่อไฟล์ที่มีกลุ่ม student_id และ student_name
+
+        Returns:
+            tuple: (student_id, student_name) หรือ None ถ้าหาไม่ได้
+        """
+        if filename in mapping:
+            return mapping[filename]
+
+        stem = filename.rsplit(".", 1)[0]
+        match = pattern.match(stem)
+        if not match:
+            return None
+
+        groups = match.groupdict()
+        student_id = (groups.get("student_id") or "").strip()
+        student_name = (groups.get("student_name") or "").strip().replace("_", " ")
+        return (student_id, student_name or student_id) if student_id else None
+
+    def upload(self, assignment, user_id, archive=None, files=(), mapping_file=None, pattern=None):
+        """
+        อัปโหลดงานหลายไฟล์พร้อมกัน บันทึกทุกรายการในการ insert ครั้งเดียว แล้วส่งไปดึงข้อความในเบื้องหลัง
+
+        Args:
+            assignment (dict): ข้อมูลงาน
+            user_id (str): ID ของผู้ใช้
+            archive (FileStorage, optional): ไฟล์ ZIP
+            files (list, optional): รายการไฟล์ที่อัปโหลด
+            mapping_file (FileStorage, optional): ไฟล์ CSV ที่จับคู่ชื่อไฟล์กับนักเรียน
+            pattern (str, optional): regular expression ของชื่อไฟล์ที่มีกลุ่ม student_id และ student_name
+
+        Returns:
+            dict: สรุปผลและผลลัพธ์ของแต่ละไฟล์ หรือข้อความข้อผิดพลาด
+        """
+        try:
+            mapping = self.parse_mapping(mapping_file) if mapping_file else {}
+            filename_pattern = re.compile(pattern or DEFAULT_FILENAME_PATTERN)
+        except (csv.Error, UnicodeDecodeError, re.error) as e:
+            return {"error": f"ข้อมูลการจับคู่นักเรียนไม่ถูกต้อง: {str(e)}"}
+
+        folder_path = f"{assignment.get('folder_path', 'submissions')}/submissions"
+        report = []
+        uploads = []
+        in_flight = deque()
+
+        def collect(entry):
+            item, file_data, future = entry
+            upload_result = future.result()
+            if "error" in upload_result:
+                item.update({"status": "error", "error": upload_result['error']})
+                return
+
+            # ไม่เก็บข้อมูลไฟล์ไว้ในหน่วยความจำจนครบทุกไฟล์ ไฟล์ที่ไม่มีข้อความในแคช
+            # จะถูกเขียนลงไฟล์ชั่วคราวเพื่อดึงข้อความภายหลังโดยไม่ต้องดาวน์โหลดจาก storage ใหม่
+            content_text = extraction_pipeline.lookup(file_data, upload_result['type'])
+            spool_path = self._spool(file_data) if content_text is None else None
+            uploads.append((item, content_text, upload_result, spool_path))
+
+        try:
+            for filename, file_data, read_error in self.iter_files(archive, files):
+                item = {"file_name": filename}
+                report.append(item)
+
+                if len(report) > BULK_UPLOAD_MAX_FILES:
+                    item.update({"status": "error", "error": f"เกินจำนวนไฟล์สูงสุด {BULK_UPLOAD_MAX_FILES} ไฟล์"})
+                    break
+
+                if read_error:
+                    item.update({"status": "error", "error": read_error})
+                    continue
+
+                if not self.storage_service.allowed_file(filename):
+                    item.update({"status": "error", "error": "ไฟล์ไม่ถูกต้องหรือนามสกุลไม่ได้รับอนุญาต"})
+                    continue
+
+                student = self.resolve_student(filename, mapping, filename_pattern)
+                if student is None:
+                    item.update({"status": "error", "error": "ไม่พบข้อมูลนักเรียนของไฟล์นี้"})
+                    continue
+                item["student_id"], item["student_name"] = student
+
+                content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                future = self.executor.submit(self.storage_service.upload_bytes, file_data, filename,
+                                              content_type, folder_path, user_id)
+                in_flight.append((item, file_data, future))
+
+                # จำกัดจำนวนไฟล์ที่ค้างอยู่ในหน่วยความจำระหว่างรออัปโหลด
+                while len(in_flight) >= self.max_workers * 2:
+                    collect(in_flight.popleft())
+        except zipfile.BadZipFile:
+            error = "ไฟล์ ZIP ไม่ถูกต้อง"
+        except BulkUploadError as e:
+            error = str(e)
+        else:
+            error = None
+
+        while in_flight:
+            collect(in_flight.popleft())
+
+        if error:
+            self._delete_uploads(uploads)
+            return {"error": error}
+
+        rows = []
+        for item, content_text, upload_result, _ in uploads:
+            item["extraction_cache"] = "hit" if content_text is not None else "miss"
+            rows.append({
+                "student_name": item['student_name'],
+                "student_id": item['student_id'],
+                "file_path": upload_result['path'],
+                "file_name": upload_result['name'],
+                "content_type": upload_result['type'],
+                "file_size": upload_result['size'],
+                "content_text": content_text,
+                "extraction_status": "done" if content_text is not None else "pending",
+                "status": "pending",
+                "user_id": user_id,
+                "assignment_id": assignment['id']
+            })
+
+        if rows:
+            try:
+                created = self.submission_model.create_many(rows).data
+            except Exception as e:
+                self._delete_uploads(uploads)
+                return {"error": f"เกิดข้อผิดพลาดในการบันทึกงานที่ส่ง: {str(e)}"}
+
+            for (item, _, upload_result, spool_path), row in zip(uploads, created):
+                item.update({"status": "created", "submission_id": row['id']})
+                if spool_path is not None:
+                    extraction_pipeline.submit(self.submission_model, row['id'], None, upload_result['type'],
+                                               load_file=functools.partial(self._read_spool, spool_path))
+
+        created_count = sum(1 for item in report if item.get("status") == "created")
+        return {
+            "created": created_count,
+            "failed": len(report) - created_count,
+            "files": report
+        }
+
+    def _spool(self, file_data):
+        """เขียนข้อมูลไฟล์ลงไฟล์ชั่วคราวเพื่อรอดึงข้อความ และคืนพาธของไฟล์"""
+        fd, spool_path = tempfile.mkstemp(prefix="bulk-upload-", dir=BULK_UPLOAD_SPOOL_DIR)
+        with os.fdopen(fd, "wb") as spool:
+            spool.write(file_data)
+        return spool_path
+
+    def _read_spool(self, spool_path):
+        """อ่านข้อมูลไฟล์จากไฟล์ชั่วคราวเมื่อถึงคิวดึงข้อความ แล้วลบไฟล์ชั่วคราวทิ้ง"""
+        try:
+            with open(spool_path, "rb") as spool:
+                return spool.read()
+        finally:
+            os.remove(spool_path)
+
+    def _delete_uploads(self, uploads):
+        """ลบไฟล์ที่อัปโหลดแล้วและไฟล์ชั่วคราว เพื่อไม่ให้มีไฟล์ที่ไม่มีข้อมูลในฐานข้อมูล"""
+        for _, _, upload_result, spool_path in uploads:
+            self.storage_service.delete_file(upload_result['path'])
+            if spool_path is not None:
+                os.remove(spool_path)
@@ -0,0 +1,147 @@
+# grading_assistant/services/context_packer.py
+import os
+import re
+import math
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# จำนวน token สูงสุดของเฉลยที่ใส่ใน prompt (ทั้งเฉลยที่ค้นหาด้วย RAG และเฉลยของงานที่ใช้แทน)
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2048"))
+
+# ค่าประมาณจำนวนตัวอักษรต่อ token: ข้อความภาษาอังกฤษราว 4 ตัวอักษรต่อ token
+# ส่วนภาษาไทยและอักษรอื่นที่ไม่ใช่ ASCII ถูกแบ่งเป็น token ที่สั้นกว่ามาก
+ASCII_CHARS_PER_TOKEN = 4.0
+NON_ASCII_CHARS_PER_TOKEN = 1.5
+
+# ความยาวขั้นต่ำของส่วนที่ซ้อนกันระหว่างชิ้นข้อความที่จะตัดออก (ตัวอักษร)
+MIN_OVERLAP_CHARS = 40
+# ความยาวของท้ายชิ้นข้อความก่อนหน้าที่ใช้หาส่วนที่ซ้อนกัน (อย่างน้อยเท่ากับ overlap ตอนแบ่งชิ้น)
+OVERLAP_WINDOW_CHARS = 1000
+
+PASSAGE_SEPARATOR = "\n\n"
+
+def estimate_tokens(text):
+    """
+    ประมาณจำนวน token ของข้อความโดยไม่ต้องใช้ tokenizer ของโมเดล
+
+    Args:
+        text (str): ข้อความ
+
+    Returns:
+        int: จำนวน token โดยประมาณ
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii_chars / NON_ASCII_CHARS_PER_TOKEN)
+
+def pack_context(passages, token_budget=RAG_CONTEXT_TOKEN_BUDGET):
+    """
+    รวมข้อความที่ค้นหาได้เป็น context ของ prompt โดยเรียงตามคะแนนความเกี่ยวข้อง
+    ตัดย่อหน้าที่ซ้ำและส่วนที่ซ้อนกับข้อความก่อนหน้าออก และหยุดเมื่อถึงจำนวน token ที่กำหนด
+
+    Args:
+        passages (list): รายการ (ข้อความ, คะแนนความเกี่ยวข้อง)
+        token_budget (int, optional): จำนวน token สูงสุดของ context
+
+    Returns:
+        dict: ข้อความที่รวมแล้ว (text), จำนวน token (tokens), จำนวนข้อความที่ใช้ (passages_used),
+              จำนวนข้อความทั้งหมด (passages_total), จำนวนย่อหน้าที่ซ้ำ (duplicates_removed)
+              และถูกตัดเพราะเกินจำนวน token หรือไม่ (truncated)
+    """
+    ordered = sorted((passage for passage in passages if passage[0]), key=lambda passage: passage[1] or 0, reverse=True)
+
+    packed = []
+    seen = set()
+    tokens = 0
+    used = 0
+    duplicates = 0
+    truncated = False
+    separator_tokens = estimate_tokens(PASSAGE_SEPARATOR)
+
+    for text, _ in ordered:
+        text = _trim_overlap(text, packed)
+
+        paragraphs = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            key = " ".join(paragraph.split())
+            if not key:
+                continue
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            paragraphs.append(paragraph.strip())
+
+        if not paragraphs:
+            continue
+
+        # เพิ่มทีละย่อหน้าจนกว่าจะเกินจำนวน token ที่กำหนด
+        included = []
+        for paragraph in paragraphs:
+            paragraph_tokens = estimate_tokens(paragraph) + (separator_tokens if packed or included else 0)
+            if tokens + paragraph_tokens > token_budget:
+                # ย่อหน้าแรกที่ยาวเกินจำนวน token ทั้งหมด ให้ตัดเหลือเท่าที่ใส่ได้แทนการไม่ใส่อะไรเลย
+                if not packed and not included:
+                    paragraph = truncate_to_tokens(paragraph, token_budget)
+                    if paragraph:
+                        included.append(paragraph)
+                        tokens += estimate_tokens(paragraph)
+                truncated = True
+                break
+            included.append(paragraph)
+            tokens += paragraph_tokens
+
+        if included:
+            packed.append(PASSAGE_SEPARATOR.join(included))
+            used += 1
+        if truncated:
+            break
+
+    return {
+        "text": PASSAGE_SEPARATOR.join(packed),
+        "tokens": tokens,
+        "passages_used": used,
+        "passages_total": len(ordered),
+        "duplicates_removed": duplicates,
+        "truncated": truncated
+    }
+
+def truncate_to_tokens(text, token_budget):
+    """
+    ตัดท้ายข้อความให้เหลือไม่เกินจำนวน token ที่กำหนด โดยค้นหาความยาวแบบ binary search
+
+    Args:
+        text (str): ข้อความ
+        token_budget (int): จำนวน token สูงสุด
+
+    Returns:
+        str: ข้อความที่ตัดแล้ว
+    """
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip()
+
+def _trim_overlap(text, packed):
+    """ตัดส่วนต้นของข้อความที่ซ้ำกับท้ายของข้อความที่รวมไว้แล้ว (เช่น overlap ระหว่างชิ้นข้อความ)"""
+    head = text[:MIN_OVERLAP_CHARS]
+    if len(head) < MIN_OVERLAP_CHARS:
+        return text
+
+    for previous in packed:
+        tail = previous[-OVERLAP_WINDOW_CHARS:]
+        start = tail.find(head)
+        while start != -1:
+            overlap = tail[start:]
+            if text.startswith(overlap):
+                return text[len(overlap):]
+            start = tail.find(head, start + 1)
+    return text
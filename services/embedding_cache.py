@@ -0,0 +1,99 @@
+# grading_assistant/services/embedding_cache.py
+import os
+import re
+import hashlib
+import unicodedata
+from array import array
+from utils.cache import LRUCache, SQLiteCache
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของแคช embedding
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+
+class EmbeddingCache:
+    """
+    แคช embedding แบบอ้างอิงเนื้อหา (content-addressed) โดยใช้ hash ของชื่อโมเดลและข้อความ
+    มีสองชั้น คือแคช LRU ในหน่วยความจำ และแคชบนดิสก์ (SQLite) ที่เลือกเปิดใช้ได้
+    """
+    def __init__(self, model_name, memory_size=EMBEDDING_CACHE_SIZE, disk_path=EMBEDDING_CACHE_PATH,
+                 disk_max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.model_name = model_name
+        self.memory = LRUCache(memory_size)
+        self.disk = SQLiteCache(disk_path, max_bytes=disk_max_bytes) if disk_path else None
+
+    def make_key(self, text):
+        """
+        สร้างคีย์ของแคชจากชื่อโมเดลและข้อความที่ปรับรูปแบบแล้ว
+
+        Args:
+            text (str): ข้อความ
+
+        Returns:
+            str: คีย์ของแคช
+        """
+        normalized = unicodedata.normalize("NFC", text)
+        normalized = re.sub(r"\s+", " ", normalized).strip()
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalized.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, text):
+        """
+        ดึง embedding ของข้อความจากแคช
+
+        Args:
+            text (str): ข้อความ
+
+        Returns:
+            list: vector embedding หรือ None ถ้าไม่พบในแคช
+        """
+        key = self.make_key(text)
+
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            return list(embedding)
+
+        if self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                vector = array("f")
+                vector.frombytes(blob)
+                self.memory.set(key, vector)
+                return vector.tolist()
+
+        return None
+
+    def set(self, text, embedding):
+        """
+        เก็บ embedding ของข้อความลงในแคช
+
+        Args:
+            text (str): ข้อความ
+            embedding (list): vector embedding
+        """
+        key = self.make_key(text)
+        # เก็บเป็น float32 เพื่อลดหน่วยความจำที่ใช้
+        vector = array("f", embedding)
+        self.memory.set(key, vector)
+        if self.disk is not None:
+            self.disk.set(key, vector.tobytes())
+
+    def stats(self):
+        """
+        ดึงสถิติของแคช
+
+        Returns:
+            dict: สถิติของแคชในหน่วยความจำและบนดิสก์
+        """
+        return {
+            "model": self.model_name,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
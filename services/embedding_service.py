@@ -1,9 +1,13 @@
 # services/embedding_service.py
 import os
 import uuid
-import requests
 import json
+import asyncio
+import threading
 from models.vector_db import VectorDB
+from services.http_client import lmstudio_client
+from services.async_http_client import async_lmstudio_client
+from services.embedding_cache import EmbeddingCache
 from dotenv import load_dotenv
 
 # โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
@@ -11,13 +15,94 @@ load_dotenv()
 
 # ตั้งค่าพื้นฐาน
 LMSTUDIO_URL = os.getenv("LMSTUDIO_URL", "http://127.0.0.1:1234")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+# ขนาดของ embedding (0 = ตรวจหาจากโมเดลโดยอัตโนมัติ)
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "0"))
+
+# แคช embedding ที่ใช้ร่วมกันทุก instance เพื่อให้ผลที่แคชไว้ใช้ได้ข้าม route และ worker
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL_NAME)
+
+# ขนาดของ embedding และ vector database ที่ใช้ร่วมกันทุก instance
+# ตรวจหาขนาดจาก LMStudio เพียงครั้งเดียวเมื่อใช้งานครั้งแรก ไม่ใช่ตอน import
+_embedding_dimension = EMBEDDING_DIMENSION or None
+_dimension_lock = threading.Lock()
+_vector_db = None
+_vector_db_lock = threading.Lock()
+
+class EmbeddingError(Exception):
+    """
+    ข้อผิดพลาดเมื่อสร้าง embedding ไม่ได้ หรือได้ embedding ที่ใช้งานไม่ได้
+    """
 
 class EmbeddingService:
     """
     คลาสสำหรับการสร้าง Vector Embeddings และจัดการกับคลังข้อมูล Vector
     """
     def __init__(self):
-        self.vector_db = VectorDB()
+        self.http_client = lmstudio_client
+        self.async_http_client = async_lmstudio_client
+        self.cache = embedding_cache
+    
+    @property
+    def dimension(self):
+        """ขนาดของ embedding ที่ทราบแล้ว หรือ None ถ้ายังไม่ได้ตรวจหา"""
+        return _embedding_dimension
+    
+    @property
+    def vector_db(self):
+        """
+        Vector database ของ collection ที่ตรงกับโมเดลและขนาดของ embedding
+        สร้างเมื่อใช้งานครั้งแรก ถ้า LMStudio ยังไม่พร้อมจะลองใหม่ในการใช้งานครั้งถัดไป
+        
+        Returns:
+            VectorDB: vector database
+            
+        Raises:
+            EmbeddingError: ถ้าตรวจหาขนาดของ embedding ไม่ได้
+        """
+        global _vector_db
+        if _vector_db is None:
+            dimension = self.get_dimension()
+            with _vector_db_lock:
+                if _vector_db is None:
+                    _vector_db = VectorDB(dimension, EMBEDDING_MODEL_NAME)
+        return _vector_db
+    
+    def get_dimension(self):
+        """
+        ดึงขนาดของ embedding ของโมเดลที่ใช้งาน โดยสร้าง embedding ทดสอบถ้ายังไม่ทราบ
+        
+        Returns:
+            int: ขนาดของ embedding
+            
+        Raises:
+            EmbeddingError: ถ้าสร้าง embedding ทดสอบไม่ได้
+        """
+        global _embedding_dimension
+        if _embedding_dimension is None:
+            with _dimension_lock:
+                if _embedding_dimension is None:
+                    _embedding_dimension = len(self._request_embeddings(["dimension probe"])[0])
+        return _embedding_dimension
+    
+    def cache_stats(self):
+        """
+        ดึงสถิติของแคช embedding
+        
+        Returns:
+            dict: จำนวน hit และ miss ของแคชแต่ละชั้น
+        """
+        return self.cache.stats()
+    
+    def pool_stats(self):
+        """
+        ดึงสถิติของ connection pool ที่ใช้เชื่อมต่อกับ LMStudio
+        
+        Returns:
+            dict: สถิติของ connection pool
+        """
+        return self.http_client.pool_stats()
     
     def create_embedding(self, text):
         """
@@ -28,25 +113,167 @@ class EmbeddingService:
             
         Returns:
             list: vector embedding
+            
+        Raises:
+            EmbeddingError: ถ้าสร้าง embedding ไม่ได้
+        """
+        return self.create_embeddings([text])[0]
+    
+    def create_embeddings(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        สร้าง embeddings จากหลายข้อความ โดยส่งไปยัง LMStudio ครั้งละหลายข้อความ
+        
+        Args:
+            texts (list): รายการข้อความที่ต้องการสร้าง embedding
+            batch_size (int, optional): จำนวนข้อความสูงสุดต่อหนึ่งคำขอ
+            
+        Returns:
+            list: รายการ vector embedding เรียงตามลำดับของข้อความ
+            
+        Raises:
+            EmbeddingError: ถ้าสร้าง embedding ไม่ได้
+        """
+        embeddings, missing = self._lookup_cached(texts)
+        missing_texts = list(missing)
+        
+        for start in range(0, len(missing_texts), batch_size):
+            batch = missing_texts[start:start + batch_size]
+            self._fill_embeddings(embeddings, missing, batch, self._request_embeddings(batch))
+        
+        return embeddings
+    
+    async def create_embeddings_async(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        สร้าง embeddings เหมือน create_embeddings แต่รอ LMStudio แบบ async สำหรับโหมด ASGI
+        
+        Args:
+            texts (list): รายการข้อความที่ต้องการสร้าง embedding
+            batch_size (int, optional): จำนวนข้อความสูงสุดต่อหนึ่งคำขอ
+            
+        Returns:
+            list: รายการ vector embedding เรียงตามลำดับของข้อความ
+            
+        Raises:
+            EmbeddingError: ถ้าสร้าง embedding ไม่ได้
+        """
+        # แคชชั้นดิสก์เป็น SQLite จึงอ่านเขียนผ่าน thread เพื่อไม่ให้ขวาง event loop
+        embeddings, missing = await asyncio.to_thread(self._lookup_cached, texts)
+        missing_texts = list(missing)
+        
+        for start in range(0, len(missing_texts), batch_size):
+            batch = missing_texts[start:start + batch_size]
+            batch_embeddings = await self._request_embeddings_async(batch)
+            await asyncio.to_thread(self._fill_embeddings, embeddings, missing, batch, batch_embeddings)
+        
+        return embeddings
+    
+    def _lookup_cached(self, texts):
+        """
+        ดึง embeddings ที่มีในแคช และรวบรวมข้อความที่ต้องสร้างใหม่
+        
+        Returns:
+            tuple: (รายการ embedding ที่ยังไม่พบเป็น None, ข้อความที่ไม่ซ้ำกัน -> ตำแหน่งในรายการ)
+        """
+        embeddings = [self.cache.get(text) for text in texts]
+        
+        # ส่งเฉพาะข้อความที่ไม่พบในแคช และส่งข้อความที่ซ้ำกันเพียงครั้งเดียว
+        missing = {}
+        for i, text in enumerate(texts):
+            if embeddings[i] is None:
+                missing.setdefault(text, []).append(i)
+        return embeddings, missing
+    
+    def _fill_embeddings(self, embeddings, missing, batch, batch_embeddings):
+        """เก็บ embeddings ที่สร้างใหม่ลงแคชและใส่ในทุกตำแหน่งของข้อความนั้น"""
+        for text, embedding in zip(batch, batch_embeddings):
+            self.cache.set(text, embedding)
+            for i in missing[text]:
+                embeddings[i] = embedding
+    
+    def _request_embeddings(self, inputs):
+        """
+        ส่งคำขอสร้าง embeddings ไปยัง LMStudio และตรวจสอบผลลัพธ์
+        
+        Args:
+            inputs (list): รายการข้อความ
+            
+        Returns:
+            list: รายการ vector embedding เรียงตามลำดับของข้อความ
+            
+        Raises:
+            EmbeddingError: ถ้าเรียก API ไม่สำเร็จ หรือได้ vector ที่ขนาดไม่ตรงหรือเป็นศูนย์ทั้งหมด
         """
         try:
-            # ใช้ API ของ LMStudio เพื่อสร้าง embedding
-            response = requests.post(
+            response = self.http_client.post(
                 f"{LMSTUDIO_URL}/v1/embeddings",
                 headers={"Content-Type": "application/json"},
-                json={"input": text}
+                json={"input": inputs}
             )
+        except Exception as e:
+            print(f"Error connecting to LMStudio: {str(e)}")
+            raise EmbeddingError(f"Error connecting to LMStudio: {str(e)}") from e
+        
+        return self._parse_embeddings(response, inputs)
+    
+    async def _request_embeddings_async(self, inputs):
+        """
+        ส่งคำขอสร้าง embeddings ไปยัง LMStudio แบบ async และตรวจสอบผลลัพธ์
+        
+        Args:
+            inputs (list): รายการข้อความ
+            
+        Returns:
+            list: รายการ vector embedding เรียงตามลำดับของข้อความ
             
-            if response.status_code == 200:
-                data = response.json()
-                return data['data'][0]['embedding']
-            else:
-                # กรณีไม่สามารถเชื่อมต่อได้ หรือมีข้อผิดพลาด ให้ส่งค่า embedding ว่าง
-                print(f"Error creating embedding: {response.text}")
-                return [0] * 1536  # ใช้ค่าว่างขนาด 1536 (ขนาดทั่วไปของ embedding)
+        Raises:
+            EmbeddingError: ถ้าเรียก API ไม่สำเร็จ หรือได้ vector ที่ใช้งานไม่ได้
+        """
+        try:
+            response = await self.async_http_client.post(
+                f"{LMSTUDIO_URL}/v1/embeddings",
+                headers={"Content-Type": "application/json"},
+                json={"input": inputs}
+            )
         except Exception as e:
             print(f"Error connecting to LMStudio: {str(e)}")
-            return [0] * 1536
+            raise EmbeddingError(f"Error connecting to LMStudio: {str(e)}") from e
+        
+        return self._parse_embeddings(response, inputs)
+    
+    def _parse_embeddings(self, response, inputs):
+        """
+        ตรวจสอบการตอบกลับของ embeddings API และเรียง vector ตามลำดับของข้อความ
+        
+        Args:
+            response (requests.Response | httpx.Response): การตอบกลับ
+            inputs (list): รายการข้อความที่ส่งไป
+            
+        Returns:
+            list: รายการ vector embedding
+            
+        Raises:
+            EmbeddingError: ถ้าได้สถานะที่ไม่ใช่ 200 หรือ vector ที่ขนาดไม่ตรงหรือเป็นศูนย์ทั้งหมด
+        """
+        if response.status_code != 200:
+            print(f"Error creating embeddings: {response.text}")
+            raise EmbeddingError(f"Embedding API returned status {response.status_code}")
+        
+        data = response.json()['data']
+        # เรียงผลลัพธ์ตาม index เพื่อให้ตรงกับลำดับของข้อความ
+        data.sort(key=lambda item: item.get('index', 0))
+        embeddings = [item['embedding'] for item in data]
+        
+        if len(embeddings) != len(inputs):
+            raise EmbeddingError(f"Expected {len(inputs)} embeddings, got {len(embeddings)}")
+        
+        # ไม่รับ vector ที่ขนาดไม่ตรงกับ collection หรือเป็นศูนย์ทั้งหมด เพราะจะทำให้ผลการค้นหาผิดพลาด
+        for embedding in embeddings:
+            if self.dimension is not None and len(embedding) != self.dimension:
+                raise EmbeddingError(f"Expected embedding dimension {self.dimension}, got {len(embedding)}")
+            if not any(embedding):
+                raise EmbeddingError("Embedding model returned a zero vector")
+        
+        return embeddings
     
     def store_solution_embedding(self, solution_id, text, metadata=None):
         """
@@ -63,10 +290,11 @@ class EmbeddingService:
         if metadata is None:
             metadata = {}
             
-        # เพิ่มข้อมูลพื้นฐาน
+        # เพิ่มข้อมูลพื้นฐาน และเก็บข้อความไว้ใน payload เพื่อให้การค้นหาไม่ต้องดึงข้อมูลจากฐานข้อมูลอีก
         metadata.update({
             "solution_id": solution_id,
-            "type": "solution"
+            "type": "solution",
+            "content_text": text
         })
         
         # สร้าง vector ID
@@ -78,19 +306,36 @@ class EmbeddingService:
         
         return vector_id
     
-    def find_similar_solutions(self, text, limit=5):
+    def find_similar_solutions(self, text, limit=5, filters=None):
         """
         ค้นหาเฉลยที่คล้ายกับข้อความที่ให้มา
         
         Args:
             text (str): ข้อความที่ต้องการค้นหาเฉลยที่คล้ายกัน
             limit (int, optional): จำนวนผลลัพธ์สูงสุดที่ต้องการ
+            filters (dict, optional): เงื่อนไขของ payload เช่น assignment_id, user_id และ type
             
         Returns:
             list: รายการเฉลยที่คล้ายกัน
         """
         embedding = self.create_embedding(text)
-        return self.vector_db.search_similar(embedding, limit)
+        return self.vector_db.search_similar(embedding, limit, filters)
+    
+    async def find_similar_solutions_async(self, text, limit=5, filters=None):
+        """
+        ค้นหาเฉลยที่คล้ายกันเหมือน find_similar_solutions แต่สร้าง embedding แบบ async
+        และค้นหาใน vector database ผ่าน thread เพราะ client ของ vector database เป็นแบบ sync
+        
+        Args:
+            text (str): ข้อความที่ต้องการค้นหาเฉลยที่คล้ายกัน
+            limit (int, optional): จำนวนผลลัพธ์สูงสุดที่ต้องการ
+            filters (dict, optional): เงื่อนไขของ payload
+            
+        Returns:
+            list: รายการเฉลยที่คล้ายกัน
+        """
+        embedding = (await self.create_embeddings_async([text]))[0]
+        return await asyncio.to_thread(lambda: self.vector_db.search_similar(embedding, limit, filters))
     
     def delete_embedding(self, vector_id):
         """
@@ -108,45 +353,82 @@ class EmbeddingService:
         except Exception:
             return False
     
-    def create_embeddings_from_text_chunks(self, text, chunk_size=1000, overlap=200, metadata=None):
+    def delete_embeddings(self, vector_ids):
         """
-        แบ่งข้อความเป็นชิ้นเล็กๆ และสร้าง embeddings
+        ลบ embeddings หลายรายการในการเรียกครั้งเดียว
+        
+        Args:
+            vector_ids (list): รายการ ID ของ vector ที่ต้องการลบ
+            
+        Returns:
+            bool: True ถ้าลบสำเร็จ, False ถ้าไม่สำเร็จ
+        """
+        if not vector_ids:
+            return True
+        try:
+            self.vector_db.delete_embeddings(vector_ids)
+            return True
+        except Exception:
+            return False
+    
+    def create_embeddings_from_text_chunks(self, text, chunk_size=1000, overlap=200, metadata=None,
+                                           batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        แบ่งข้อความเป็นชิ้นเล็กๆ และสร้าง embeddings โดยสร้างและบันทึกทีละกลุ่มระหว่างที่แบ่งข้อความ
         
         Args:
             text (str): ข้อความที่ต้องการแบ่ง
             chunk_size (int): ขนาดของแต่ละชิ้น
             overlap (int): จำนวนตัวอักษรที่ซ้อนทับกัน
             metadata (dict, optional): ข้อมูลเพิ่มเติม
+            batch_size (int, optional): จำนวนชิ้นที่สร้าง embedding และบันทึกต่อครั้ง
             
         Returns:
             list: รายการ vector IDs ที่บันทึก
         """
         if metadata is None:
             metadata = {}
-            
-        # แบ่งข้อความ
-        chunks = self._split_text(text, chunk_size, overlap)
         
-        # สร้างและบันทึก embeddings
         vector_ids = []
-        for i, chunk in enumerate(chunks):
+        batch = []
+        for chunk in self._iter_chunks(text or "", chunk_size, overlap):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                vector_ids.extend(self._store_chunk_batch(batch, len(vector_ids), metadata))
+                batch = []
+        
+        if batch:
+            vector_ids.extend(self._store_chunk_batch(batch, len(vector_ids), metadata))
+        
+        return vector_ids
+    
+    def _store_chunk_batch(self, chunks, start_index, metadata):
+        """
+        สร้าง embeddings ของชิ้นข้อความหนึ่งกลุ่มและบันทึกในการเรียกครั้งเดียว
+        
+        Args:
+            chunks (list): รายการชิ้นข้อความ
+            start_index (int): ลำดับของชิ้นแรกในกลุ่มนี้
+            metadata (dict): ข้อมูลเพิ่มเติม
+            
+        Returns:
+            list: รายการ vector IDs ที่บันทึก
+        """
+        embeddings = self.create_embeddings(chunks)
+        
+        points = []
+        for i, embedding in enumerate(embeddings):
             # สร้าง metadata สำหรับแต่ละชิ้น
             chunk_metadata = metadata.copy()
-            chunk_metadata.update({
-                "chunk_index": i,
-                "total_chunks": len(chunks)
-            })
+            chunk_metadata["chunk_index"] = start_index + i
             
             # สร้าง vector ID
             vector_id = f"chunk_{uuid.uuid4()}"
-            
-            # สร้างและบันทึก embedding
-            embedding = self.create_embedding(chunk)
-            self.vector_db.store_embedding(vector_id, embedding, chunk_metadata)
-            
-            vector_ids.append(vector_id)
-            
-        return vector_ids
+            points.append((vector_id, embedding, chunk_metadata))
+        
+        self.vector_db.store_embeddings(points)
+        
+        return [vector_id for vector_id, _, _ in points]
         
     def _split_text(self, text, chunk_size=1000, overlap=200):
         """
@@ -160,32 +442,41 @@ class EmbeddingService:
         Returns:
             list: รายการชิ้นข้อความ
         """
-        chunks = []
-        
         if not text:
-            return chunks
+            return []
+        
+        return list(self._iter_chunks(text, chunk_size, overlap))
+    
+    def _iter_chunks(self, text, chunk_size=1000, overlap=200):
+        """
+        แบ่งข้อความเป็นชิ้นเล็กๆ ทีละชิ้น โดยไม่ตัดคำกลาง
+        
+        Args:
+            text (str): ข้อความที่ต้องการแบ่ง
+            chunk_size (int): ขนาดของแต่ละชิ้น
+            overlap (int): จำนวนตัวอักษรที่ซ้อนทับกัน
             
-        i = 0
-        text_length = len(text)
+        Yields:
+            str: ชิ้นข้อความ
+        """
+        start = 0
         
-        while i < text_length:
-            # กำหนดจุดสิ้นสุดของชิ้นปัจจุบัน
-            end = min(i + chunk_size, text_length)
+        # ตัดชิ้นได้เมื่อข้อความที่เหลือยาวเกินหนึ่งชิ้น เพราะต้องดูตัวอักษรถัดจากขอบของชิ้น
+        while len(text) - start > chunk_size:
+            end = start + chunk_size
             
-            # ตรวจสอบว่าควรขยายชิ้นเพื่อไม่ให้ตัดคำกลาง
-            if end < text_length:
-                # หาจุดสิ้นสุดที่เป็นช่องว่างหรือเครื่องหมายวรรคตอน
-                while end > i and not text[end].isspace() and not text[end] in ",.!?;:":
-                    end -= 1
-                
-                # ถ้าไม่พบช่องว่างหรือเครื่องหมายวรรคตอน ใช้ขนาดเต็ม
-                if end == i:
-                    end = min(i + chunk_size, text_length)
+            # หาจุดสิ้นสุดที่เป็นช่องว่างหรือเครื่องหมายวรรคตอน เพื่อไม่ให้ตัดคำกลาง
+            while end > start and not text[end].isspace() and not text[end] in ",.!?;:":
+                end -= 1
             
-            # เพิ่มชิ้นข้อความลงในรายการ
-            chunks.append(text[i:end])
+            # ถ้าไม่พบช่องว่างหรือเครื่องหมายวรรคตอน ใช้ขนาดเต็ม
+            if end == start:
+                end = start + chunk_size
             
-            # เลื่อนไปยังจุดเริ่มต้นของชิ้นถัดไป โดยคำนึงถึงการซ้อนทับ
-            i = end - overlap if end - overlap > i else end
+            yield text[start:end]
             
-        return chunks
\ No newline at end of file
+            # เลื่อนไปยังจุดเริ่มต้นของชิ้นถัดไป โดยคำนึงถึงการซ้อนทับ
+            start = end - overlap if end - overlap > start else end
+        
+        if start < len(text):
+            yield text[start:]
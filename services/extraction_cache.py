@@ -0,0 +1,69 @@
+# grading_assistant/services/extraction_cache.py
+import os
+import hashlib
+from utils.cache import SQLiteCache
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของแคชข้อความที่ดึงจากไฟล์
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./data/extraction_cache.db")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "256"))
+
+# เปลี่ยนเมื่อวิธีดึงข้อความเปลี่ยน เพื่อไม่ให้ใช้ผลจากแคชเดิม
+EXTRACTOR_VERSION = "1"
+
+class ExtractionCache:
+    """
+    แคชข้อความที่ดึงจากไฟล์ โดยใช้ hash (BLAKE2) ของเนื้อหาไฟล์เป็นคีย์
+    ไฟล์เดียวกันที่อัปโหลดซ้ำจึงไม่ต้องอ่าน PDF หรือ OCR ใหม่
+    """
+    def __init__(self, db_path=EXTRACTION_CACHE_PATH, max_bytes=EXTRACTION_CACHE_MAX_MB * 1024 * 1024):
+        self.store = SQLiteCache(db_path, max_bytes=max_bytes)
+
+    @staticmethod
+    def make_key(file_data, file_type):
+        """
+        สร้างคีย์ของแคชจากเนื้อหาและประเภทของไฟล์
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            file_type (str): ประเภทของไฟล์
+
+        Returns:
+            str: คีย์ของแคช
+        """
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(f"{EXTRACTOR_VERSION}\0{file_type}\0".encode("utf-8"))
+        digest.update(file_data)
+        return digest.hexdigest()
+
+    def get(self, file_data, file_type):
+        """
+        ดึงข้อความของไฟล์จากแคช
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            file_type (str): ประเภทของไฟล์
+
+        Returns:
+            str: ข้อความที่ดึงจากไฟล์ หรือ None ถ้าไม่พบ
+        """
+        value = self.store.get(self.make_key(file_data, file_type))
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, file_data, file_type, content_text):
+        """
+        เก็บข้อความของไฟล์ลงในแคช
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            file_type (str): ประเภทของไฟล์
+            content_text (str): ข้อความที่ดึงจากไฟล์
+        """
+        self.store.set(self.make_key(file_data, file_type), content_text.encode("utf-8"))
+
+    def stats(self):
+        """ดึงสถิติของแคช"""
+        return self.store.stats()
@@ -0,0 +1,132 @@
+# grading_assistant/services/extraction_pipeline.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from services.storage_service import extract_text_from_bytes, PDF_MAX_PAGES, PDF_EXTRACTION_TIMEOUT
+from services.ocr_service import OCRService
+from services.extraction_cache import ExtractionCache
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# จำนวน process ที่ใช้ดึงข้อความ (ค่าเริ่มต้นเท่ากับจำนวนคอร์)
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", "0")) or os.cpu_count() or 1
+# จำนวนไฟล์ที่รอผลการดึงข้อความและบันทึกลงฐานข้อมูลพร้อมกันได้
+EXTRACTION_MAX_PENDING = int(os.getenv("EXTRACTION_MAX_PENDING", "16"))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """
+    ดึง process pool ที่ใช้ร่วมกันสำหรับงานที่ใช้ CPU มาก เช่น การอ่าน PDF และ OCR
+
+    Returns:
+        ProcessPoolExecutor: process pool
+    """
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESSES)
+    return _process_pool
+
+class ExtractionPipeline:
+    """
+    ดึงข้อความจากไฟล์ที่อัปโหลดในเบื้องหลัง โดยให้ process pool ทำงานที่ใช้ CPU
+    และให้ thread ประสานงานบันทึกผลลงฐานข้อมูลเมื่อดึงข้อความเสร็จ
+    """
+    def __init__(self, max_pending=EXTRACTION_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="extraction")
+        self.ocr_service = OCRService()
+        self.cache = ExtractionCache()
+
+    def lookup(self, file_data, file_type):
+        """
+        ค้นหาข้อความของไฟล์ที่เคยดึงไว้แล้วจากแคช
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            file_type (str): ประเภทของไฟล์
+
+        Returns:
+            str: ข้อความที่ดึงจากไฟล์ หรือ None ถ้าไม่พบในแคช
+        """
+        return self.cache.get(file_data, file_type)
+
+    def submit(self, model, record_id, file_data, file_type, on_complete=None, content_text=None, load_file=None):
+        """
+        ส่งไฟล์เข้าคิวเพื่อดึงข้อความ แล้วอัปเดต content_text และ extraction_status ของแถว
+        ถ้าระบุ content_text (เช่น ได้จากแคช) จะไม่ดึงข้อความใหม่ และเรียกเพียง on_complete
+
+        Args:
+            model (SupabaseModel): โมเดลของตารางที่เก็บแถวนี้
+            record_id (str): ID ของแถว
+            file_data (bytes): ข้อมูลไฟล์ หรือ None ถ้าระบุ load_file
+            file_type (str): ประเภทของไฟล์
+            on_complete (callable, optional): ฟังก์ชันที่เรียกพร้อมข้อความเมื่อดึงข้อความสำเร็จ
+            content_text (str, optional): ข้อความของไฟล์ที่ดึงไว้แล้ว
+            load_file (callable, optional): ฟังก์ชันที่คืนข้อมูลไฟล์เมื่อถึงคิว
+                เพื่อไม่ต้องเก็บข้อมูลไฟล์ไว้ในหน่วยความจำระหว่างรอ
+
+        Returns:
+            Future: ผลลัพธ์ของงาน
+        """
+        return self.executor.submit(self._run, model, record_id, file_data, file_type, on_complete, content_text,
+                                    load_file)
+
+    def extract_text(self, file_data, file_type):
+        """
+        ดึงข้อความจากไฟล์ โดยให้ process pool ทำงานที่ใช้ CPU
+        รูปภาพและหน้า PDF ที่เป็นภาพสแกนจะถูก OCR แยกทีละหน้าแบบขนาน
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            file_type (str): ประเภทของไฟล์
+
+        Returns:
+            str: ข้อความที่ดึงจากไฟล์
+        """
+        pool = get_process_pool()
+
+        if file_type.endswith(('png', 'jpg', 'jpeg')):
+            return self.ocr_service.ocr_image(file_data, pool)
+
+        if file_type.endswith('pdf') and self.ocr_service.pdf_rasterizer_available():
+            return self.ocr_service.ocr_pdf(file_data, pool, max_pages=PDF_MAX_PAGES, timeout=PDF_EXTRACTION_TIMEOUT)
+
+        return pool.submit(extract_text_from_bytes, file_data, file_type).result()
+
+    def _run(self, model, record_id, file_data, file_type, on_complete, content_text=None, load_file=None):
+        """ดึงข้อความใน process pool และบันทึกผลของแถวหนึ่งแถว"""
+        if content_text is None:
+            try:
+                if file_data is None:
+                    file_data = load_file()
+                content_text = self.extract_text(file_data, file_type)
+            except Exception as e:
+                print(f"Error extracting text for {model.table_name} {record_id}: {str(e)}")
+                model.update(record_id, {
+                    "extraction_status": "failed",
+                    "extraction_error": str(e)
+                })
+                return None
+
+            self.cache.set(file_data, file_type, content_text)
+            model.update(record_id, {
+                "content_text": content_text,
+                "extraction_status": "done",
+                "extraction_error": None
+            })
+
+        if on_complete is not None and content_text:
+            try:
+                on_complete(content_text)
+            except Exception as e:
+                print(f"Error after extracting text for {model.table_name} {record_id}: {str(e)}")
+
+        return content_text
+
+# pipeline ที่ใช้ร่วมกันสำหรับทุกการอัปโหลด
+extraction_pipeline = ExtractionPipeline()
@@ -0,0 +1,72 @@
+# grading_assistant/services/grading_cache.py
+import os
+import json
+import hashlib
+from utils.cache import SQLiteCache
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของแคชผลการตรวจ (ปิดไว้เป็นค่าเริ่มต้น)
+GRADING_CACHE_ENABLED = os.getenv("GRADING_CACHE_ENABLED", "False") == "True"
+GRADING_CACHE_PATH = os.getenv("GRADING_CACHE_PATH", "./data/grading_cache.db")
+GRADING_CACHE_TTL_HOURS = float(os.getenv("GRADING_CACHE_TTL_HOURS", "168"))
+GRADING_CACHE_MAX_MB = int(os.getenv("GRADING_CACHE_MAX_MB", "64"))
+
+class GradingCache:
+    """
+    แคชผลการตรวจจาก LLM โดยใช้ hash ของคำขอทั้งหมด (prompt, พารามิเตอร์ และโมเดล) เป็นคีย์
+    เนื่องจากการตรวจใช้ temperature ต่ำ คำขอเดิมจึงให้ผลที่ใช้ซ้ำได้
+    """
+    def __init__(self, db_path=GRADING_CACHE_PATH, ttl_hours=GRADING_CACHE_TTL_HOURS,
+                 max_bytes=GRADING_CACHE_MAX_MB * 1024 * 1024):
+        self.store = SQLiteCache(db_path, max_bytes=max_bytes, ttl_seconds=ttl_hours * 3600)
+
+    @staticmethod
+    def make_key(payload, model_id, prompt_version):
+        """
+        สร้างคีย์ของแคชจากข้อมูลคำขอ
+
+        Args:
+            payload (dict): ข้อมูลคำขอที่ส่งไปยัง chat completions API
+            model_id (str): ID ของโมเดล
+            prompt_version (str): เวอร์ชันของ prompt
+
+        Returns:
+            str: คีย์ของแคช
+        """
+        request = {key: value for key, value in payload.items() if key != 'stream'}
+        material = json.dumps({
+            "model": model_id,
+            "prompt_version": prompt_version,
+            "request": request
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=32).hexdigest()
+
+    def get(self, key):
+        """
+        ดึงผลการตรวจจากแคช
+
+        Args:
+            key (str): คีย์ของแคช
+
+        Returns:
+            str: ข้อความตอบกลับจาก LLM หรือ None ถ้าไม่พบ
+        """
+        value = self.store.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, llm_response):
+        """
+        เก็บผลการตรวจลงในแคช
+
+        Args:
+            key (str): คีย์ของแคช
+            llm_response (str): ข้อความตอบกลับจาก LLM
+        """
+        self.store.set(key, llm_response.encode("utf-8"))
+
+    def stats(self):
+        """ดึงสถิติของแคช"""
+        return self.store.stats()
@@ -1,8 +1,10 @@
 # grading_assistant/services/grading_service.py
 import os
 import json
-from services.llm_service import LLMService
-from services.embedding_service import EmbeddingService
+import asyncio
+from services.llm_service import LLMService, LLMError
+from services.embedding_service import EmbeddingService, EmbeddingError
+from services.context_packer import pack_context
 from models.database import SolutionModel, SubmissionModel, GradeModel, AssignmentModel
 from dotenv import load_dotenv
 
@@ -67,12 +69,13 @@ class GradingService:
             "feedback": feedback.strip()
         }
         
-    def grade_submission_with_llm(self, submission_id):
+    def grade_submission_with_llm(self, submission_id, use_cache=True):
         """
         ตรวจคำตอบของนักเรียนโดยใช้ LLM
         
         Args:
             submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
             
         Returns:
             dict: ผลการตรวจและให้คะแนน
@@ -83,54 +86,37 @@ class GradingService:
         
         # ดึงข้อมูลงานและเฉลย
         assignment_data = self.assignment_model.get_by_id(assignment_id).data[0]
-        solution_data = self.solution_model.get_by_assignment(assignment_id, submission_data['user_id']).data
+        solution_text = self._get_assignment_solution_text(submission_data)
         
-        if not solution_data:
+        if solution_text is None:
             return {"error": "ไม่พบเฉลยสำหรับงานนี้"}
         
-        # ใช้เฉลยแรกที่พบ
-        solution_text = solution_data[0]['content_text']
-        submission_text = submission_data['content_text']
         total_score = assignment_data['total_score']
+        solution_text, submission_text, prompt_info = self._fit_prompt(
+            solution_text, submission_data['content_text'], total_score)
         
-        # ใช้ LLM ตรวจคำตอบ
-        llm_response = self.llm_service.grade_submission(
-            solution_text=solution_text,
-            submission_text=submission_text,
-            total_score=total_score
-        )
-        
-        # แยกข้อมูลคะแนนและข้อเสนอแนะ
-        grading_results = self.extract_grading_results(llm_response)
-        
-        # บันทึกผลการตรวจลงฐานข้อมูล
-        grade_data = {
-            "score": grading_results['score'],
-            "feedback": grading_results['reasons'] + "\n\n" + grading_results['feedback'],
-            "approved": False,  # ต้องได้รับการอนุมัติจากอาจารย์
-            "user_id": submission_data['user_id'],
-            "submission_id": submission_id
-        }
-        
-        grade_result = self.grade_model.create(grade_data)
-        
-        # อัปเดตสถานะของคำตอบ
-        self.submission_model.update(submission_id, {"status": "graded"})
+        # ใช้ LLM ตรวจคำตอบ ถ้าไม่สำเร็จจะไม่บันทึกคะแนน เพื่อให้ตรวจใหม่ได้
+        try:
+            llm_response = self.llm_service.grade_submission(
+                solution_text=solution_text,
+                submission_text=submission_text,
+                total_score=total_score,
+                use_cache=use_cache
+            )
+        except LLMError as e:
+            return {"error": str(e)}
         
-        return {
-            "grade_id": grade_result.data[0]['id'],
-            "score": grading_results['score'],
-            "feedback": grading_results['reasons'] + "\n\n" + grading_results['feedback'],
-            "total_score": total_score,
-            "raw_llm_response": llm_response
-        }
+        result = self._save_grading_result(submission_data, llm_response, total_score)
+        result.update(prompt_info)
+        return result
     
-    def grade_with_rag(self, submission_id):
+    def grade_with_rag(self, submission_id, use_cache=True):
         """
         ตรวจคำตอบโดยใช้เทคนิค RAG (Retrieval-Augmented Generation)
         
         Args:
             submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
             
         Returns:
             dict: ผลการตรวจและให้คะแนน
@@ -146,66 +132,433 @@ class GradingService:
         submission_text = submission_data['content_text']
         
         # ค้นหาเฉลยที่เกี่ยวข้องโดยใช้ vector search
-        similar_solutions = self.embedding_service.find_similar_solutions(submission_text)
+        try:
+            combined_solution_text, context = self._get_rag_solution_text(submission_data)
+        except EmbeddingError as e:
+            print(f"Exception in RAG retrieval: {str(e)}")
+            combined_solution_text, context = "", {}
         
-        if not similar_solutions:
-            # ถ้าไม่พบเฉลยที่เกี่ยวข้อง ให้ใช้การตรวจแบบปกติ
-            return self.grade_submission_with_llm(submission_id)
+        # ถ้าไม่มีเฉลยที่เกี่ยวข้อง ให้ใช้การตรวจแบบปกติ
+        if not combined_solution_text:
+            return self.grade_submission_with_llm(submission_id, use_cache)
         
-        # ดึงข้อมูลเฉลยทั้งหมดที่เกี่ยวข้อง
-        relevant_solutions = []
-        for solution in similar_solutions:
-            solution_id = solution.payload.get('solution_id')
-            if solution_id:
-                solution_data = self.solution_model.get_by_id(solution_id).data
-                if solution_data:
-                    relevant_solutions.append(solution_data[0])
+        try:
+            combined_solution_text, submission_text, prompt_info = self._fit_prompt(
+                combined_solution_text, submission_text, assignment_data['total_score'])
+            
+            # เรียกใช้ LLM service กับเฉลยที่รวมแล้ว
+            llm_response = self.llm_service.grade_submission(
+                solution_text=combined_solution_text,
+                submission_text=submission_text,
+                total_score=assignment_data['total_score'],
+                use_cache=use_cache
+            )
+            
+            result = self._save_grading_result(submission_data, llm_response, assignment_data['total_score'])
+            result["method"] = "rag"
+            result.update(prompt_info)
+            result.update(context)
+            return result
+        except LLMError as e:
+            # LLM ใช้งานไม่ได้ การตรวจแบบปกติก็จะล้มเหลวเช่นกัน จึงส่งข้อผิดพลาดกลับไปเลย
+            return {"error": str(e)}
+        except Exception as e:
+            print(f"Exception in RAG grading: {str(e)}")
+            # กรณีที่มีข้อผิดพลาด ให้ใช้การตรวจแบบปกติ
+            return self.grade_submission_with_llm(submission_id, use_cache)
+    
+    def grade_submission_stream(self, submission_id, use_rag=True, use_cache=True):
+        """
+        ตรวจคำตอบโดยส่งข้อความจาก LLM ออกมาทีละส่วนระหว่างที่กำลังสร้าง
+        และบันทึกผลการตรวจเมื่อ LLM ตอบครบแล้วเท่านั้น
+        
+        Args:
+            submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_rag (bool, optional): ใช้เฉลยที่ค้นหาด้วย vector search หรือไม่
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
+            
+        Yields:
+            tuple: (ชื่อเหตุการณ์, ข้อมูล) โดยเหตุการณ์เป็น 'start', 'token', 'result' หรือ 'error'
+        """
+        submission_data = self.submission_model.get_by_id(submission_id).data[0]
+        assignment_data = self.assignment_model.get_by_id(submission_data['assignment_id']).data[0]
+        submission_text = submission_data['content_text']
+        total_score = assignment_data['total_score']
+        
+        method = "llm"
+        context = {}
+        solution_text = None
+        
+        if use_rag:
+            try:
+                solution_text, context = self._get_rag_solution_text(submission_data)
+                method = "rag"
+            except Exception as e:
+                print(f"Exception in RAG retrieval: {str(e)}")
+        
+        # ถ้าไม่มีเฉลยที่เกี่ยวข้อง ให้ใช้เฉลยของงานโดยตรง
+        if not solution_text:
+            method = "llm"
+            solution_text = self._get_assignment_solution_text(submission_data)
+        
+        if solution_text is None:
+            yield "error", {"error": "ไม่พบเฉลยสำหรับงานนี้"}
+            return
+        
+        solution_text, submission_text, prompt_info = self._fit_prompt(solution_text, submission_text, total_score)
+        
+        yield "start", {"submission_id": submission_id, "method": method, "total_score": total_score}
+        
+        tokens = []
+        try:
+            for token in self.llm_service.grade_submission_stream(
+                solution_text=solution_text,
+                submission_text=submission_text,
+                total_score=total_score,
+                use_cache=use_cache
+            ):
+                tokens.append(token)
+                yield "token", {"text": token}
+        except LLMError as e:
+            # LLM ตอบไม่สำเร็จหรือตอบไม่ครบ จึงไม่บันทึกผลการตรวจ
+            yield "error", {"error": str(e)}
+            return
+        except Exception as e:
+            print(f"Exception in streaming grading: {str(e)}")
+            yield "error", {"error": "เกิดข้อผิดพลาดในการเชื่อมต่อกับ LLM โปรดตรวจสอบการเชื่อมต่อ"}
+            return
+        
+        result = self._save_grading_result(submission_data, "".join(tokens), total_score)
+        result["method"] = method
+        result.update(prompt_info)
+        if method == "rag":
+            result.update(context)
+        
+        yield "result", result
+    
+    async def grade_submission_with_llm_async(self, submission_id, use_cache=True):
+        """
+        ตรวจคำตอบโดยใช้ LLM เหมือน grade_submission_with_llm สำหรับโหมด ASGI
+        โดยรอ LLM แบบ async และเรียกฐานข้อมูลผ่าน thread
+        
+        Args:
+            submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
+            
+        Returns:
+            dict: ผลการตรวจและให้คะแนน
+        """
+        submission_data, assignment_data = await asyncio.to_thread(self._load_submission, submission_id)
+        solution_text = await asyncio.to_thread(self._get_assignment_solution_text, submission_data)
+        
+        if solution_text is None:
+            return {"error": "ไม่พบเฉลยสำหรับงานนี้"}
         
-        # รวมเนื้อหาเฉลยทั้งหมด
-        combined_solution_text = ""
-        for solution in relevant_solutions:
-            if solution['content_text']:
-                combined_solution_text += solution['content_text'] + "\n\n"
+        total_score = assignment_data['total_score']
+        solution_text, submission_text, prompt_info = self._fit_prompt(
+            solution_text, submission_data['content_text'], total_score)
+        try:
+            llm_response = await self.llm_service.grade_submission_async(
+                solution_text=solution_text,
+                submission_text=submission_text,
+                total_score=total_score,
+                use_cache=use_cache
+            )
+        except LLMError as e:
+            return {"error": str(e)}
+        
+        result = await asyncio.to_thread(self._save_grading_result, submission_data, llm_response, total_score)
+        result.update(prompt_info)
+        return result
+    
+    async def grade_with_rag_async(self, submission_id, use_cache=True):
+        """
+        ตรวจคำตอบโดยใช้ RAG เหมือน grade_with_rag สำหรับโหมด ASGI
+        
+        Args:
+            submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
+            
+        Returns:
+            dict: ผลการตรวจและให้คะแนน
+        """
+        submission_data, assignment_data = await asyncio.to_thread(self._load_submission, submission_id)
+        
+        try:
+            combined_solution_text, context = await self._get_rag_solution_text_async(submission_data)
+        except EmbeddingError as e:
+            print(f"Exception in RAG retrieval: {str(e)}")
+            combined_solution_text, context = "", {}
         
         # ถ้าไม่มีเฉลยที่เกี่ยวข้อง ให้ใช้การตรวจแบบปกติ
         if not combined_solution_text:
-            return self.grade_submission_with_llm(submission_id)
+            return await self.grade_submission_with_llm_async(submission_id, use_cache)
         
         try:
-            # เรียกใช้ LLM service กับเฉลยที่รวมแล้ว
-            llm_response = self.llm_service.grade_submission(
+            total_score = assignment_data['total_score']
+            combined_solution_text, submission_text, prompt_info = self._fit_prompt(
+                combined_solution_text, submission_data['content_text'], total_score)
+            llm_response = await self.llm_service.grade_submission_async(
                 solution_text=combined_solution_text,
                 submission_text=submission_text,
-                total_score=assignment_data['total_score']
+                total_score=total_score,
+                use_cache=use_cache
             )
             
-            # แยกข้อมูลคะแนนและข้อเสนอแนะ
-            grading_results = self.extract_grading_results(llm_response)
+            result = await asyncio.to_thread(self._save_grading_result, submission_data, llm_response, total_score)
+            result["method"] = "rag"
+            result.update(prompt_info)
+            result.update(context)
+            return result
+        except LLMError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            print(f"Exception in RAG grading: {str(e)}")
+            return await self.grade_submission_with_llm_async(submission_id, use_cache)
+    
+    async def grade_submission_stream_async(self, submission_id, use_rag=True, use_cache=True):
+        """
+        ตรวจคำตอบแบบ streaming เหมือน grade_submission_stream สำหรับโหมด ASGI
+        
+        Args:
+            submission_id (str): ID ของคำตอบที่ต้องการตรวจ
+            use_rag (bool, optional): ใช้เฉลยที่ค้นหาด้วย vector search หรือไม่
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี
+            
+        Yields:
+            tuple: (ชื่อเหตุการณ์, ข้อมูล) โดยเหตุการณ์เป็น 'start', 'token', 'result' หรือ 'error'
+        """
+        submission_data, assignment_data = await asyncio.to_thread(self._load_submission, submission_id)
+        total_score = assignment_data['total_score']
+        
+        method = "llm"
+        context = {}
+        solution_text = None
+        
+        if use_rag:
+            try:
+                solution_text, context = await self._get_rag_solution_text_async(submission_data)
+                method = "rag"
+            except Exception as e:
+                print(f"Exception in RAG retrieval: {str(e)}")
+        
+        # ถ้าไม่มีเฉลยที่เกี่ยวข้อง ให้ใช้เฉลยของงานโดยตรง
+        if not solution_text:
+            method = "llm"
+            solution_text = await asyncio.to_thread(self._get_assignment_solution_text, submission_data)
+        
+        if solution_text is None:
+            yield "error", {"error": "ไม่พบเฉลยสำหรับงานนี้"}
+            return
+        
+        solution_text, submission_text, prompt_info = self._fit_prompt(
+            solution_text, submission_data['content_text'], total_score)
+        
+        yield "start", {"submission_id": submission_id, "method": method, "total_score": total_score}
+        
+        tokens = []
+        try:
+            async for token in self.llm_service.grade_submission_stream_async(
+                solution_text=solution_text,
+                submission_text=submission_text,
+                total_score=total_score,
+                use_cache=use_cache
+            ):
+                tokens.append(token)
+                yield "token", {"text": token}
+        except LLMError as e:
+            # LLM ตอบไม่สำเร็จหรือตอบไม่ครบ จึงไม่บันทึกผลการตรวจ
+            yield "error", {"error": str(e)}
+            return
+        except Exception as e:
+            print(f"Exception in streaming grading: {str(e)}")
+            yield "error", {"error": "เกิดข้อผิดพลาดในการเชื่อมต่อกับ LLM โปรดตรวจสอบการเชื่อมต่อ"}
+            return
+        
+        result = await asyncio.to_thread(self._save_grading_result, submission_data, "".join(tokens), total_score)
+        result["method"] = method
+        result.update(prompt_info)
+        if method == "rag":
+            result.update(context)
+        
+        yield "result", result
+    
+    def _load_submission(self, submission_id):
+        """
+        ดึงข้อมูลคำตอบและงานของคำตอบนั้น
+        
+        Args:
+            submission_id (str): ID ของคำตอบ
+            
+        Returns:
+            tuple: (ข้อมูลคำตอบ, ข้อมูลงาน)
+        """
+        submission_data = self.submission_model.get_by_id(submission_id).data[0]
+        assignment_data = self.assignment_model.get_by_id(submission_data['assignment_id']).data[0]
+        return submission_data, assignment_data
+    
+    def _get_assignment_solution_text(self, submission_data):
+        """
+        ดึงข้อความเฉลยของงานที่คำตอบนี้ส่งมา
+        
+        Args:
+            submission_data (dict): ข้อมูลคำตอบ
             
-            # บันทึกผลการตรวจลงฐานข้อมูล
-            grade_data = {
-                "score": grading_results['score'],
-                "feedback": grading_results['reasons'] + "\n\n" + grading_results['feedback'],
-                "approved": False,  # ต้องได้รับการอนุมัติจากอาจารย์
+        Returns:
+            str: ข้อความเฉลยแรกที่พบซึ่งจำกัดจำนวน token แล้ว หรือ None ถ้าไม่พบเฉลย
+        """
+        solution_data = self.solution_model.get_by_assignment(
+            submission_data['assignment_id'],
+            submission_data['user_id']
+        ).data
+        
+        # ใช้เฉลยแรกที่ดึงข้อความเสร็จแล้ว
+        for solution in solution_data:
+            if solution.get('content_text'):
+                # จำกัดจำนวน token เหมือนเฉลยที่ค้นหาด้วย RAG และตัดย่อหน้าที่ซ้ำ
+                return pack_context([(solution['content_text'], None)])["text"]
+        
+        return None
+    
+    def _get_rag_solution_text(self, submission_data):
+        """
+        ค้นหาเฉลยของงานเดียวกันที่เกี่ยวข้องกับคำตอบด้วย vector search แล้วรวมเนื้อหาเข้าด้วยกัน
+        
+        Args:
+            submission_data (dict): ข้อมูลคำตอบของนักเรียน
+            
+        Returns:
+            tuple: (ข้อความเฉลยที่รวมแล้ว, ข้อมูลของ context)
+        """
+        # ค้นหาเฉพาะเฉลยของงานนี้ เพื่อไม่ให้เฉลยของงานอื่นหรือผู้ใช้อื่นถูกนำมาใช้
+        similar_solutions = self.embedding_service.find_similar_solutions(
+            submission_data['content_text'],
+            filters={
+                "assignment_id": submission_data['assignment_id'],
+                "user_id": submission_data['user_id'],
+                "type": "solution"
+            }
+        )
+        
+        return self._combine_solution_texts(similar_solutions)
+    
+    async def _get_rag_solution_text_async(self, submission_data):
+        """
+        ค้นหาเฉลยที่เกี่ยวข้องเหมือน _get_rag_solution_text แต่สร้าง embedding แบบ async
+        
+        Args:
+            submission_data (dict): ข้อมูลคำตอบของนักเรียน
+            
+        Returns:
+            tuple: (ข้อความเฉลยที่รวมแล้ว, ข้อมูลของ context)
+        """
+        similar_solutions = await self.embedding_service.find_similar_solutions_async(
+            submission_data['content_text'],
+            filters={
+                "assignment_id": submission_data['assignment_id'],
                 "user_id": submission_data['user_id'],
-                "submission_id": submission_id
+                "type": "solution"
             }
+        )
+        return await asyncio.to_thread(self._combine_solution_texts, similar_solutions)
+    
+    def _combine_solution_texts(self, similar_solutions):
+        """
+        รวมข้อความของเฉลยที่ค้นหาได้ตามลำดับความเกี่ยวข้อง
+        
+        Args:
+            similar_solutions (list): ผลการค้นหาจาก vector database
             
-            grade_result = self.grade_model.create(grade_data)
+        Returns:
+            tuple: (ข้อความเฉลยที่รวมแล้ว, ข้อมูลของ context เช่นจำนวนเฉลย จำนวน token และถูกตัดหรือไม่)
+        """
+        if not similar_solutions:
+            return "", {"relevant_solutions_count": 0}
+        
+        # ใช้ข้อความใน payload ถ้ามี และรวบรวมเฉลยที่ต้องดึงจากฐานข้อมูล
+        solution_ids = []
+        scores = {}
+        payload_texts = {}
+        for solution in similar_solutions:
+            solution_id = solution.payload.get('solution_id')
+            if not solution_id or solution_id in solution_ids:
+                continue
+            solution_ids.append(solution_id)
+            scores[solution_id] = solution.score
+            if solution.payload.get('content_text') is not None:
+                payload_texts[solution_id] = solution.payload['content_text']
+        
+        # ดึงเฉลยที่ไม่มีข้อความใน payload ในการเรียกครั้งเดียว
+        missing_ids = [solution_id for solution_id in solution_ids if solution_id not in payload_texts]
+        if missing_ids:
+            for solution in self.solution_model.get_by_ids(missing_ids).data:
+                payload_texts[solution['id']] = solution['content_text']
+        
+        # รวมเนื้อหาเฉลยตามลำดับความเกี่ยวข้อง โดยตัดส่วนที่ซ้ำและจำกัดจำนวน token ของ prompt
+        context = pack_context([
+            (payload_texts[solution_id], scores[solution_id])
+            for solution_id in solution_ids if solution_id in payload_texts
+        ])
+        
+        return context["text"], {
+            "relevant_solutions_count": context["passages_used"],
+            "context_tokens": context["tokens"],
+            "context_truncated": context["truncated"],
+            "context_duplicates_removed": context["duplicates_removed"]
+        }
+    
+    def _fit_prompt(self, solution_text, submission_text, total_score):
+        """
+        ตัดเฉลยและคำตอบให้ prompt ไม่เกินขนาด context ของโมเดล
+        
+        Args:
+            solution_text (str): ข้อความเฉลย
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
             
-            # อัปเดตสถานะของคำตอบ
-            self.submission_model.update(submission_id, {"status": "graded"})
+        Returns:
+            tuple: (ข้อความเฉลย, ข้อความคำตอบ, จำนวน token ของ prompt และถูกตัดหรือไม่)
+        """
+        solution_text, submission_text, prompt_tokens, truncated = self.llm_service.fit_prompt_texts(
+            solution_text, submission_text or "", total_score)
+        return solution_text, submission_text, {"prompt_tokens": prompt_tokens, "prompt_truncated": truncated}
+    
+    def _save_grading_result(self, submission_data, llm_response, total_score):
+        """
+        แยกผลการตรวจจากการตอบกลับของ LLM บันทึกคะแนน และอัปเดตสถานะของคำตอบ
+        
+        Args:
+            submission_data (dict): ข้อมูลคำตอบ
+            llm_response (str): ข้อความตอบกลับจาก LLM
+            total_score (float): คะแนนเต็ม
             
-            return {
-                "grade_id": grade_result.data[0]['id'],
-                "score": grading_results['score'],
-                "feedback": grading_results['reasons'] + "\n\n" + grading_results['feedback'],
-                "total_score": assignment_data['total_score'],
-                "raw_llm_response": llm_response,
-                "method": "rag",
-                "relevant_solutions_count": len(relevant_solutions)
-            }
-        except Exception as e:
-            print(f"Exception in RAG grading: {str(e)}")
-            # กรณีที่มีข้อผิดพลาด ให้ใช้การตรวจแบบปกติ
-            return self.grade_submission_with_llm(submission_id)
\ No newline at end of file
+        Returns:
+            dict: ผลการตรวจและให้คะแนน
+        """
+        submission_id = submission_data['id']
+        
+        # แยกข้อมูลคะแนนและข้อเสนอแนะ
+        grading_results = self.extract_grading_results(llm_response)
+        feedback = grading_results['reasons'] + "\n\n" + grading_results['feedback']
+        
+        # บันทึกผลการตรวจลงฐานข้อมูล
+        grade_data = {
+            "score": grading_results['score'],
+            "feedback": feedback,
+            "approved": False,  # ต้องได้รับการอนุมัติจากอาจารย์
+            "user_id": submission_data['user_id'],
+            "submission_id": submission_id
+        }
+        
+        grade_result = self.grade_model.create(grade_data)
+        
+        # อัปเดตสถานะของคำตอบ
+        self.submission_model.update(submission_id, {"status": "graded"})
+        
+        return {
+            "grade_id": grade_result.data[0]['id'],
+            "score": grading_results['score'],
+            "feedback": feedback,
+            "total_score": total_score,
+            "raw_llm_response": llm_response
+        }
@@ -0,0 +1,131 @@
+# grading_assistant/services/grading_worker.py
+import os
+import socket
+import argparse
+import threading
+from services.job_queue import GradingJobQueue
+from services.grading_service import GradingService
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของ worker
+GRADING_WORKER_CONCURRENCY = int(os.getenv("GRADING_WORKER_CONCURRENCY", "2"))
+GRADING_LEASE_SECONDS = float(os.getenv("GRADING_LEASE_SECONDS", "180"))
+GRADING_POLL_INTERVAL = float(os.getenv("GRADING_POLL_INTERVAL", "2"))
+
+class GradingWorker:
+    """
+    Worker สำหรับดึงงานตรวจจากคิวถาวรและตรวจด้วย GradingService
+    """
+    def __init__(self, queue=None, grading_service=None, concurrency=GRADING_WORKER_CONCURRENCY,
+                 lease_seconds=GRADING_LEASE_SECONDS, poll_interval=GRADING_POLL_INTERVAL):
+        self.queue = queue or GradingJobQueue()
+        self.grading_service = grading_service or GradingService()
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+
+    def run(self, drain=False):
+        """
+        เริ่มการทำงานของ worker
+
+        Args:
+            drain (bool, optional): ถ้าเป็น True จะหยุดเมื่อไม่มีงานเหลือในคิว
+        """
+        threads = [
+            threading.Thread(target=self._loop, args=(f"{self.worker_id}:{i}", drain), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("Stopping grading worker...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def _loop(self, worker_id, drain):
+        """วนดึงงานจากคิวจนกว่าจะได้รับสัญญาณหยุด"""
+        while not self.stop_event.is_set():
+            job = self.queue.lease(worker_id, self.lease_seconds)
+            if not job:
+                if drain:
+                    return
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            self.process_job(job, worker_id)
+
+    def process_job(self, job, worker_id):
+        """
+        ตรวจงานหนึ่งชิ้นจากคิว พร้อมส่ง heartbeat ระหว่างรอผลจาก LLM
+
+        Args:
+            job (dict): ข้อมูลงานที่จองได้
+            worker_id (str): ID ของ worker
+        """
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], worker_id, done), daemon=True)
+        heartbeat.start()
+
+        try:
+            # งานอาจถูกตรวจไปแล้วก่อนที่ worker เดิมจะหยุดทำงาน
+            submission = self.grading_service.submission_model.get_by_id(job['submission_id']).data
+            if not submission:
+                self.queue.complete(job['id'], worker_id, {"skipped": "submission not found"})
+                return
+            if submission[0]['status'] != 'pending':
+                self.queue.complete(job['id'], worker_id, {"skipped": f"status is {submission[0]['status']}"})
+                return
+
+            if job['use_rag']:
+                result = self.grading_service.grade_with_rag(job['submission_id'])
+            else:
+                result = self.grading_service.grade_submission_with_llm(job['submission_id'])
+
+            if "error" in result:
+                self.queue.fail(job['id'], worker_id, result['error'])
+            else:
+                self.queue.complete(job['id'], worker_id, {
+                    "grade_id": result.get('grade_id'),
+                    "score": result.get('score'),
+                    "total_score": result.get('total_score')
+                })
+        except Exception as e:
+            print(f"Exception in grading worker: {str(e)}")
+            self.queue.fail(job['id'], worker_id, str(e))
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def _heartbeat(self, job_id, worker_id, done):
+        """ต่ออายุการจองงานเป็นระยะจนกว่างานจะเสร็จ"""
+        interval = max(self.lease_seconds / 3, 1)
+        while not done.wait(interval):
+            if not self.queue.heartbeat(job_id, worker_id, self.lease_seconds):
+                print(f"Lost lease on grading job {job_id}")
+                return
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker สำหรับตรวจงานจากคิวงานตรวจ")
+    parser.add_argument("--concurrency", type=int, default=GRADING_WORKER_CONCURRENCY,
+                        help="จำนวนงานที่ตรวจพร้อมกัน")
+    parser.add_argument("--drain", action="store_true",
+                        help="หยุดการทำงานเมื่อไม่มีงานเหลือในคิว")
+    args = parser.parse_args()
+
+    worker = GradingWorker(concurrency=args.concurrency)
+    print(f"Grading worker {worker.worker_id} started (concurrency={args.concurrency})")
+    worker.run(drain=args.drain)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# grading_assistant/services/http_client.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของการเชื่อมต่อกับ LMStudio
+LMSTUDIO_POOL_SIZE = int(os.getenv("LMSTUDIO_POOL_SIZE", "10"))
+LMSTUDIO_CONNECT_TIMEOUT = float(os.getenv("LMSTUDIO_CONNECT_TIMEOUT", "5"))
+LMSTUDIO_READ_TIMEOUT = float(os.getenv("LMSTUDIO_READ_TIMEOUT", "300"))
+LMSTUDIO_MAX_RETRIES = int(os.getenv("LMSTUDIO_MAX_RETRIES", "3"))
+LMSTUDIO_RETRY_BACKOFF = float(os.getenv("LMSTUDIO_RETRY_BACKOFF", "0.5"))
+
+class _CountingRetry(Retry):
+    """
+    Retry ที่นับจำนวนครั้งที่มีการลองใหม่เพื่อแสดงในสถิติของ pool
+    """
+    def __init__(self, *args, counter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter
+
+    def new(self, **kwargs):
+        kwargs['counter'] = self.counter
+        return super().new(**kwargs)
+
+    def increment(self, *args, **kwargs):
+        if self.counter is not None:
+            self.counter.increment('retries')
+        return super().increment(*args, **kwargs)
+
+class _Counters:
+    """ตัวนับแบบ thread-safe"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {"requests": 0, "errors": 0, "retries": 0}
+
+    def increment(self, name):
+        with self.lock:
+            self.values[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+class PooledHTTPClient:
+    """
+    HTTP client ที่ใช้ session ร่วมกันพร้อม connection pool แบบ keep-alive,
+    timeout ค่าเริ่มต้น และการลองใหม่เมื่อเกิดข้อผิดพลาดชั่วคราว
+    """
+    def __init__(self, pool_size=LMSTUDIO_POOL_SIZE, connect_timeout=LMSTUDIO_CONNECT_TIMEOUT,
+                 read_timeout=LMSTUDIO_READ_TIMEOUT, max_retries=LMSTUDIO_MAX_RETRIES,
+                 retry_backoff=LMSTUDIO_RETRY_BACKOFF):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.counters = _Counters()
+
+        retry = _CountingRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,  # ไม่ลองใหม่เมื่ออ่านข้อมูลค้าง เพราะ LLM อาจประมวลผลคำขอเดิมอยู่
+            status=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+            counter=self.counters
+        )
+        # ไม่รอ connection ว่างเมื่อคำขอเกินขนาด pool (urllib3 รอโดยไม่จำกัดเวลาและไม่นับรวมใน timeout)
+        # แต่เปิด connection ใหม่แทน โดยเก็บไว้ใช้ซ้ำเพียง pool_size connection
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                   max_retries=retry, pool_block=False)
+
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def post(self, url, **kwargs):
+        """
+        ส่งคำขอ POST ผ่าน session ที่ใช้ร่วมกัน
+
+        Args:
+            url (str): URL ปลายทาง
+            **kwargs: อาร์กิวเมนต์เพิ่มเติมของ requests
+
+        Returns:
+            requests.Response: การตอบกลับ
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        self.counters.increment('requests')
+        try:
+            return self.session.post(url, **kwargs)
+        except requests.RequestException:
+            self.counters.increment('errors')
+            raise
+
+    def pool_stats(self):
+        """
+        ดึงสถิติของ connection pool
+
+        Returns:
+            dict: จำนวนคำขอ ข้อผิดพลาด การลองใหม่ และสถานะการเชื่อมต่อของแต่ละ host
+        """
+        stats = self.counters.snapshot()
+        stats.update({
+            "pool_size": self.pool_size,
+            "connect_timeout": self.timeout[0],
+            "read_timeout": self.timeout[1],
+            "hosts": []
+        })
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["hosts"].append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                # queue ของ pool ถูกเติมด้วย None ไว้ก่อน จึงนับเฉพาะการเชื่อมต่อจริงที่รอใช้งาน
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool is not None else 0
+            })
+
+        return stats
+
+# client ที่ใช้ร่วมกันสำหรับทุกการเรียก LMStudio
+lmstudio_client = PooledHTTPClient()
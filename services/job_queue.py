@@ -0,0 +1,320 @@
+# grading_assistant/services/job_queue.py
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของคิวงานตรวจ
+GRADING_QUEUE_PATH = os.getenv("GRADING_QUEUE_PATH", "./data/grading_queue.db")
+GRADING_JOB_MAX_ATTEMPTS = int(os.getenv("GRADING_JOB_MAX_ATTEMPTS", "3"))
+GRADING_JOB_BACKOFF_SECONDS = float(os.getenv("GRADING_JOB_BACKOFF_SECONDS", "10"))
+GRADING_JOB_BACKOFF_MAX_SECONDS = float(os.getenv("GRADING_JOB_BACKOFF_MAX_SECONDS", "600"))
+
+class GradingJobQueue:
+    """
+    คิวงานตรวจแบบถาวรที่เก็บใน SQLite รองรับการจองงาน (lease), heartbeat,
+    การลองใหม่แบบ backoff และการทำงานต่อหลังจาก process เริ่มใหม่
+    """
+    def __init__(self, db_path=GRADING_QUEUE_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """เปิดการเชื่อมต่อ SQLite สำหรับหนึ่งการทำงาน"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """สร้างตารางคิวงานถ้ายังไม่มี"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_jobs (
+                    id TEXT PRIMARY KEY,
+                    submission_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    assignment_id TEXT,
+                    batch_id TEXT,
+                    use_rag INTEGER NOT NULL DEFAULT 1,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    last_error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_ready ON grading_jobs (status, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_batch ON grading_jobs (batch_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_submission ON grading_jobs (submission_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_assignment ON grading_jobs (assignment_id, status)")
+
+    def enqueue(self, submission_id, user_id, use_rag=True, assignment_id=None, batch_id=None,
+                max_attempts=GRADING_JOB_MAX_ATTEMPTS):
+        """
+        เพิ่มงานตรวจลงในคิว ถ้างานที่ส่งนี้มีงานตรวจที่ยังไม่เสร็จอยู่แล้วจะคืนงานเดิม
+        โดยงานเดิมที่ไม่ได้อยู่ในงานตรวจแบบกลุ่มจะถูกนับรวมใน batch_id ที่ระบุ
+
+        Args:
+            submission_id (str): ID ของงานที่ส่ง
+            user_id (str): ID ของผู้ใช้
+            use_rag (bool, optional): ใช้การตรวจแบบ RAG หรือไม่
+            assignment_id (str, optional): ID ของงาน
+            batch_id (str, optional): ID ของงานตรวจแบบกลุ่ม
+            max_attempts (int, optional): จำนวนครั้งสูงสุดที่จะลองตรวจ
+
+        Returns:
+            dict: ข้อมูลงานในคิว
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = conn.execute(
+                "SELECT * FROM grading_jobs WHERE submission_id = ? AND status IN ('queued', 'leased')",
+                (submission_id,)
+            ).fetchone()
+            if existing:
+                # ให้งานตรวจแบบกลุ่มติดตามงานเดิมได้ แทนการตรวจงานที่ส่งเดียวกันซ้ำ
+                if batch_id and existing['batch_id'] is None:
+                    conn.execute(
+                        "UPDATE grading_jobs SET batch_id = ?, updated_at = ? WHERE id = ?",
+                        (batch_id, now, existing['id'])
+                    )
+                    existing = conn.execute("SELECT * FROM grading_jobs WHERE id = ?", (existing['id'],)).fetchone()
+                conn.execute("COMMIT")
+                return self._to_dict(existing)
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                """
+                INSERT INTO grading_jobs (id, submission_id, user_id, assignment_id, batch_id, use_rag,
+                                          status, max_attempts, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                (job_id, submission_id, user_id, assignment_id, batch_id, int(use_rag), max_attempts, now, now, now)
+            )
+            row = conn.execute("SELECT * FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+            return self._to_dict(row)
+
+    def lease(self, worker_id, lease_seconds):
+        """
+        จองงานถัดไปที่พร้อมทำงาน รวมถึงงานที่ lease หมดอายุจาก worker ที่หยุดทำงานไป
+
+        Args:
+            worker_id (str): ID ของ worker
+            lease_seconds (float): ระยะเวลาการจองงาน
+
+        Returns:
+            dict: ข้อมูลงานที่จองได้ หรือ None ถ้าไม่มีงาน
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            while True:
+                row = conn.execute(
+                    """
+                    SELECT * FROM grading_jobs
+                    WHERE (status = 'queued' AND available_at <= ?)
+                       OR (status = 'leased' AND lease_expires_at < ?)
+                    ORDER BY available_at
+                    LIMIT 1
+                    """,
+                    (now, now)
+                ).fetchone()
+
+                if not row:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row['attempts'] < row['max_attempts']:
+                    break
+
+                # งานที่ lease หมดอายุและใช้ความพยายามครบแล้วถือว่าล้มเหลว
+                conn.execute(
+                    """
+                    UPDATE grading_jobs
+                    SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL,
+                        last_error = COALESCE(last_error, 'lease expired'), updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now, row['id'])
+                )
+
+            conn.execute(
+                """
+                UPDATE grading_jobs
+                SET status = 'leased', attempts = attempts + 1, lease_owner = ?,
+                    lease_expires_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (worker_id, now + lease_seconds, now, row['id'])
+            )
+            leased = conn.execute("SELECT * FROM grading_jobs WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute("COMMIT")
+            return self._to_dict(leased)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """
+        ต่ออายุการจองงานที่ worker กำลังทำอยู่
+
+        Args:
+            job_id (str): ID ของงาน
+            worker_id (str): ID ของ worker
+            lease_seconds (float): ระยะเวลาการจองงานที่ต่อออกไป
+
+        Returns:
+            bool: True ถ้า worker ยังเป็นเจ้าของงานอยู่
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE grading_jobs SET lease_expires_at = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+                """,
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """
+        บันทึกว่างานตรวจเสร็จแล้ว
+
+        Args:
+            job_id (str): ID ของงาน
+            worker_id (str): ID ของ worker
+            result (dict, optional): ผลการตรวจ
+
+        Returns:
+            bool: True ถ้าบันทึกสำเร็จ
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE grading_jobs
+                SET status = 'done', result = ?, last_error = NULL, lease_owner = NULL,
+                    lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (json.dumps(result, ensure_ascii=False) if result is not None else None, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """
+        บันทึกว่างานตรวจล้มเหลว ถ้ายังลองไม่ครบจะนำกลับเข้าคิวพร้อมเวลารอแบบ exponential backoff
+
+        Args:
+            job_id (str): ID ของงาน
+            worker_id (str): ID ของ worker
+            error (str): ข้อความข้อผิดพลาด
+
+        Returns:
+            str: สถานะใหม่ของงาน ('queued' หรือ 'failed') หรือ None ถ้า worker ไม่ใช่เจ้าของงาน
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM grading_jobs WHERE id = ? AND lease_owner = ?",
+                (job_id, worker_id)
+            ).fetchone()
+            if not row:
+                conn.execute("COMMIT")
+                return None
+
+            if row['attempts'] >= row['max_attempts']:
+                status = 'failed'
+                available_at = row['available_at']
+            else:
+                status = 'queued'
+                delay = min(GRADING_JOB_BACKOFF_SECONDS * (2 ** (row['attempts'] - 1)), GRADING_JOB_BACKOFF_MAX_SECONDS)
+                available_at = now + delay * random.uniform(0.8, 1.2)
+
+            conn.execute(
+                """
+                UPDATE grading_jobs
+                SET status = ?, available_at = ?, last_error = ?, lease_owner = NULL,
+                    lease_expires_at = NULL, updated_at = ?
+                WHERE id = ?
+                """,
+                (status, available_at, error, now, job_id)
+            )
+            conn.execute("COMMIT")
+            return status
+
+    def get(self, job_id):
+        """ดึงข้อมูลงานในคิวตาม ID"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._to_dict(row) if row else None
+
+    def get_by_batch(self, batch_id):
+        """ดึงข้อมูลงานในคิวทั้งหมดของงานตรวจแบบกลุ่ม"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM grading_jobs WHERE batch_id = ? ORDER BY created_at",
+                (batch_id,)
+            ).fetchall()
+            return [self._to_dict(row) for row in rows]
+
+    def get_active_batch(self, assignment_id):
+        """
+        ค้นหางานตรวจแบบกลุ่มของงานที่ยังมีงานในคิวค้างอยู่
+
+        Args:
+            assignment_id (str): ID ของงาน
+
+        Returns:
+            str: batch_id ของงานตรวจแบบกลุ่มที่ยังไม่เสร็จ หรือ None ถ้าไม่มี
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT batch_id FROM grading_jobs
+                WHERE assignment_id = ? AND batch_id IS NOT NULL AND status IN ('queued', 'leased')
+                LIMIT 1
+                """,
+                (assignment_id,)
+            ).fetchone()
+            return row['batch_id'] if row else None
+
+    def stats(self):
+        """
+        นับจำนวนงานในคิวตามสถานะ
+
+        Returns:
+            dict: จำนวนงานในแต่ละสถานะ
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS total FROM grading_jobs GROUP BY status").fetchall()
+            return {row['status']: row['total'] for row in rows}
+
+    @staticmethod
+    def _to_dict(row):
+        """แปลงแถวจาก SQLite เป็น dict"""
+        job = dict(row)
+        job['use_rag'] = bool(job['use_rag'])
+        if job.get('result'):
+            job['result'] = json.loads(job['result'])
+        return job
@@ -1,7 +1,13 @@
 # services/llm_service.py
 import os
-import requests
 import json
+import asyncio
+import httpx
+import requests
+from services.http_client import lmstudio_client
+from services.async_http_client import async_lmstudio_client
+from services.grading_cache import GradingCache, GRADING_CACHE_ENABLED
+from services.context_packer import estimate_tokens, truncate_to_tokens
 from dotenv import load_dotenv
 
 # โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
@@ -9,6 +15,21 @@ load_dotenv()
 
 # กำหนดค่าพื้นฐาน
 LMSTUDIO_URL = os.getenv("LMSTUDIO_URL", "http://127.0.0.1:1234")
+# ID ของโมเดลที่ใช้ตรวจ (ถ้าไม่กำหนด LMStudio จะใช้โมเดลที่โหลดอยู่)
+LMSTUDIO_MODEL = os.getenv("LMSTUDIO_MODEL", "")
+# เวอร์ชันของ prompt สำหรับการตรวจ ต้องเปลี่ยนทุกครั้งที่แก้ไข prompt เพื่อไม่ให้ใช้ผลจากแคชเดิม
+PROMPT_VERSION = "1"
+# ขนาด context ของโมเดล (token) ใช้จำกัดขนาด prompt ทั้งหมดรวมกับคำตอบของ LLM
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+# จำนวน token สูงสุดที่ LLM ตอบได้ในการตรวจหนึ่งครั้ง
+LLM_MAX_OUTPUT_TOKENS = 2048
+# ข้อความเมื่อ LLM ตอบไม่ทันภายในเวลาที่กำหนด (LMSTUDIO_READ_TIMEOUT)
+LLM_TIMEOUT_MESSAGE = "LLM ใช้เวลาตรวจนานเกินกำหนด โปรดลองอีกครั้ง"
+
+class LLMError(Exception):
+    """
+    ข้อผิดพลาดเมื่อ LLM ตรวจคำตอบไม่สำเร็จ เช่น เชื่อมต่อไม่ได้ หมดเวลารอ หรือ API ตอบกลับด้วยสถานะที่ไม่ใช่ 200
+    """
 
 class LLMService:
     """
@@ -19,8 +40,33 @@ class LLMService:
         self.headers = {
             "Content-Type": "application/json"
         }
+        self.http_client = lmstudio_client
+        self.async_http_client = async_lmstudio_client
+        # ผลที่แคชไว้ต้องผูกกับโมเดลที่ตรวจ ถ้าไม่ระบุ LMSTUDIO_MODEL จะไม่รู้ว่า LMStudio โหลดโมเดลใดอยู่
+        # การเปลี่ยนโมเดลจึงอาจได้ผลการตรวจของโมเดลเดิมจากแคช
+        self.cache = GradingCache() if GRADING_CACHE_ENABLED and LMSTUDIO_MODEL else None
+        if GRADING_CACHE_ENABLED and not LMSTUDIO_MODEL:
+            print("Grading cache is disabled because LMSTUDIO_MODEL is not set")
     
-    def grade_submission(self, solution_text, submission_text, total_score):
+    def cache_stats(self):
+        """
+        ดึงสถิติของแคชผลการตรวจ
+        
+        Returns:
+            dict: สถิติของแคช หรือ None ถ้าไม่ได้เปิดใช้แคช
+        """
+        return self.cache.stats() if self.cache is not None else None
+    
+    def pool_stats(self):
+        """
+        ดึงสถิติของ connection pool ที่ใช้เชื่อมต่อกับ LMStudio
+        
+        Returns:
+            dict: สถิติของ connection pool
+        """
+        return self.http_client.pool_stats()
+    
+    def grade_submission(self, solution_text, submission_text, total_score, use_cache=True):
         """
         ตรวจคำตอบของนักเรียนโดยเปรียบเทียบกับเฉลย
         
@@ -28,35 +74,321 @@ class LLMService:
             solution_text (str): ข้อความเฉลยของอาจารย์
             submission_text (str): ข้อความคำตอบของนักเรียน
             total_score (float): คะแนนเต็ม
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี (เมื่อเปิดใช้แคช)
             
         Returns:
             str: ผลการตรวจและให้คะแนน
+            
+        Raises:
+            LLMError: ถ้าเชื่อมต่อกับ LLM ไม่ได้ หมดเวลารอ หรือ LLM API ตอบกลับด้วยสถานะที่ไม่ใช่ 200
         """
         prompt = self._create_grading_prompt(solution_text, submission_text, total_score)
+        payload = self._create_payload(prompt, stream=False)
+        
+        cache_key = self._cache_key(payload)
+        if use_cache and cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         
+        # ส่งข้อผิดพลาดกลับไปให้ผู้เรียกแทนการคืนข้อความ เพื่อไม่ให้ข้อความข้อผิดพลาดถูกบันทึกเป็นผลการตรวจ
         try:
-            payload = {
-                "messages": [
-                    {"role": "system", "content": "คุณเป็นผู้ช่วยตรวจข้อสอบอัตนัยที่มีความเชี่ยวชาญในการตรวจข้อสอบและให้คะแนน"},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1,
-                "max_tokens": 2048,
-                "top_p": 0.95,
-                "stream": False
-            }
-            
-            response = requests.post(self.api_url, headers=self.headers, json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
+            response = self.http_client.post(self.api_url, headers=self.headers, json=payload)
+        except requests.Timeout as e:
+            print(f"Timeout in LLM service: {str(e)}")
+            raise LLMError(LLM_TIMEOUT_MESSAGE) from e
+        except Exception as e:
+            print(f"Exception in LLM service: {str(e)}")
+            raise LLMError("เกิดข้อผิดพลาดในการเชื่อมต่อกับ LLM โปรดตรวจสอบการเชื่อมต่อ") from e
+        
+        content = self._parse_completion(response)
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+    
+    def grade_submission_stream(self, solution_text, submission_text, total_score, use_cache=True):
+        """
+        ตรวจคำตอบของนักเรียนแบบ streaming โดยรับข้อความจาก LMStudio ผ่าน Server-Sent Events
+        
+        Args:
+            solution_text (str): ข้อความเฉลยของอาจารย์
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี (เมื่อเปิดใช้แคช)
+            
+        Yields:
+            str: ข้อความที่ LLM สร้างขึ้นทีละส่วน
+            
+        Raises:
+            LLMError: ถ้า LLM API ตอบกลับด้วยสถานะที่ไม่ใช่ 200 หรือ stream จบก่อนได้รับ [DONE] หรือไม่มีข้อความ
+        """
+        prompt = self._create_grading_prompt(solution_text, submission_text, total_score)
+        payload = self._create_payload(prompt, stream=True)
+        
+        cache_key = self._cache_key(payload)
+        if use_cache and cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        tokens = []
+        done = False
+        with self.http_client.post(self.api_url, headers=self.headers, json=payload, stream=True) as response:
+            if response.status_code != 200:
                 print(f"Error calling LLM API: {response.text}")
-                return "เกิดข้อผิดพลาดในการตรวจข้อสอบ โปรดลองอีกครั้ง"
+                raise LLMError(f"เกิดข้อผิดพลาดในการตรวจข้อสอบ (LLM API ตอบกลับด้วยสถานะ {response.status_code}) โปรดลองอีกครั้ง")
+            
+            # LMStudio ไม่ระบุ charset ใน text/event-stream ทำให้ requests ถอดรหัสเป็น ISO-8859-1
+            # จึงอ่านเป็นไบต์แล้วถอดรหัสเป็น UTF-8 เองเพื่อไม่ให้ข้อความภาษาไทยเพี้ยน
+            for line in response.iter_lines():
+                done, content = self._parse_stream_line(line.decode('utf-8'))
+                if done:
+                    break
+                if content:
+                    tokens.append(content)
+                    yield content
+        
+        self._check_stream_complete(done, tokens)
+        if cache_key:
+            self.cache.set(cache_key, "".join(tokens))
+    
+    async def grade_submission_async(self, solution_text, submission_text, total_score, use_cache=True):
+        """
+        ตรวจคำตอบของนักเรียนเหมือน grade_submission แต่รอ LMStudio แบบ async สำหรับโหมด ASGI
+        
+        Args:
+            solution_text (str): ข้อความเฉลยของอาจารย์
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี (เมื่อเปิดใช้แคช)
+            
+        Returns:
+            str: ผลการตรวจและให้คะแนน
+            
+        Raises:
+            LLMError: ถ้าเชื่อมต่อกับ LLM ไม่ได้ หมดเวลารอ หรือ LLM API ตอบกลับด้วยสถานะที่ไม่ใช่ 200
+        """
+        prompt = self._create_grading_prompt(solution_text, submission_text, total_score)
+        payload = self._create_payload(prompt, stream=False)
+        
+        cache_key = self._cache_key(payload)
+        if use_cache and cache_key:
+            # แคชเป็น SQLite จึงอ่านเขียนผ่าน thread เพื่อไม่ให้ขวาง event loop
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = await self.async_http_client.post(self.api_url, headers=self.headers, json=payload)
+        except httpx.TimeoutException as e:
+            print(f"Timeout in LLM service: {str(e)}")
+            raise LLMError(LLM_TIMEOUT_MESSAGE) from e
         except Exception as e:
             print(f"Exception in LLM service: {str(e)}")
-            return "เกิดข้อผิดพลาดในการเชื่อมต่อกับ LLM โปรดตรวจสอบการเชื่อมต่อ"
+            raise LLMError("เกิดข้อผิดพลาดในการเชื่อมต่อกับ LLM โปรดตรวจสอบการเชื่อมต่อ") from e
+        
+        content = self._parse_completion(response)
+        if cache_key:
+            await asyncio.to_thread(self.cache.set, cache_key, content)
+        return content
+    
+    async def grade_submission_stream_async(self, solution_text, submission_text, total_score, use_cache=True):
+        """
+        ตรวจคำตอบของนักเรียนแบบ streaming เหมือน grade_submission_stream แต่อ่านข้อมูลแบบ async
+        
+        Args:
+            solution_text (str): ข้อความเฉลยของอาจารย์
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
+            use_cache (bool, optional): ใช้ผลการตรวจจากแคชถ้ามี (เมื่อเปิดใช้แคช)
+            
+        Yields:
+            str: ข้อความที่ LLM สร้างขึ้นทีละส่วน
+            
+        Raises:
+            LLMError: ถ้า LLM API ตอบกลับด้วยสถานะที่ไม่ใช่ 200 หรือ stream จบก่อนได้รับ [DONE] หรือไม่มีข้อความ
+        """
+        prompt = self._create_grading_prompt(solution_text, submission_text, total_score)
+        payload = self._create_payload(prompt, stream=True)
+        
+        cache_key = self._cache_key(payload)
+        if use_cache and cache_key:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        tokens = []
+        done = False
+        async with self.async_http_client.stream(self.api_url, headers=self.headers, json=payload) as response:
+            if response.status_code != 200:
+                print(f"Error calling LLM API: {(await response.aread()).decode('utf-8', 'replace')}")
+                raise LLMError(f"เกิดข้อผิดพลาดในการตรวจข้อสอบ (LLM API ตอบกลับด้วยสถานะ {response.status_code}) โปรดลองอีกครั้ง")
+            
+            async for line in response.aiter_lines():
+                done, content = self._parse_stream_line(line)
+                if done:
+                    break
+                if content:
+                    tokens.append(content)
+                    yield content
+        
+        self._check_stream_complete(done, tokens)
+        if cache_key:
+            await asyncio.to_thread(self.cache.set, cache_key, "".join(tokens))
+    
+    def _parse_completion(self, response):
+        """
+        ดึงข้อความตอบกลับจากผลของ chat completions API
+        
+        Args:
+            response: การตอบกลับของ requests หรือ httpx
+            
+        Returns:
+            str: ข้อความที่ LLM ตอบ
+            
+        Raises:
+            LLMError: ถ้า LLM API ตอบกลับด้วยสถานะที่ไม่ใช่ 200 หรือไม่มีข้อความตอบกลับ
+        """
+        if response.status_code != 200:
+            # สถานะ 5xx ที่เหลืออยู่คือการลองใหม่ครบตามที่กำหนดแล้ว
+            print(f"Error calling LLM API: {response.text}")
+            raise LLMError(f"เกิดข้อผิดพลาดในการตรวจข้อสอบ (LLM API ตอบกลับด้วยสถานะ {response.status_code}) โปรดลองอีกครั้ง")
+        
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"Invalid response from LLM API: {str(e)}")
+            raise LLMError("เกิดข้อผิดพลาดในการตรวจข้อสอบ โปรดลองอีกครั้ง") from e
+    
+    def _check_stream_complete(self, done, tokens):
+        """
+        ตรวจสอบว่า stream จบด้วย [DONE] และมีข้อความ เพื่อไม่ให้ผลที่ขาดหายถูกบันทึกหรือเก็บในแคช
+        
+        Args:
+            done (bool): ได้รับ [DONE] หรือไม่
+            tokens (list): ข้อความที่ได้รับทั้งหมด
+            
+        Raises:
+            LLMError: ถ้า stream จบก่อนได้รับ [DONE] หรือไม่มีข้อความ
+        """
+        if not done:
+            print("LLM stream ended before [DONE]")
+            raise LLMError("การเชื่อมต่อกับ LLM ขาดหายก่อนตรวจเสร็จ โปรดลองอีกครั้ง")
+        if not "".join(tokens).strip():
+            print("LLM stream returned no content")
+            raise LLMError("LLM ไม่ได้ส่งผลการตรวจกลับมา โปรดลองอีกครั้ง")
+    
+    def _parse_stream_line(self, line):
+        """
+        แยกข้อความจากหนึ่งบรรทัดของ Server-Sent Events ที่ได้จาก chat completions API
+        
+        Args:
+            line (str): บรรทัดที่ได้รับ
+            
+        Returns:
+            tuple: (สิ้นสุดการ stream หรือไม่, ข้อความในบรรทัดนี้หรือ None)
+        """
+        # ข้อมูลแต่ละเหตุการณ์อยู่ในบรรทัดที่ขึ้นต้นด้วย "data:"
+        if not line or not line.startswith("data:"):
+            return False, None
+        
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return True, None
+        
+        chunk = json.loads(data)
+        choices = chunk.get('choices') or [{}]
+        return False, choices[0].get('delta', {}).get('content')
+    
+    def estimate_prompt_tokens(self, solution_text, submission_text, total_score):
+        """
+        ประมาณจำนวน token ของข้อความทั้งหมดที่ส่งให้ LLM ในการตรวจหนึ่งครั้ง
+        
+        Args:
+            solution_text (str): ข้อความเฉลยของอาจารย์
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
+            
+        Returns:
+            int: จำนวน token โดยประมาณ
+        """
+        prompt = self._create_grading_prompt(solution_text, submission_text, total_score)
+        payload = self._create_payload(prompt)
+        return sum(estimate_tokens(message["content"]) for message in payload["messages"])
+    
+    def fit_prompt_texts(self, solution_text, submission_text, total_score, context_tokens=LLM_CONTEXT_TOKENS):
+        """
+        ตัดเฉลยและคำตอบของนักเรียนให้ prompt รวมกับจำนวน token ที่เผื่อไว้สำหรับคำตอบของ LLM
+        ไม่เกินขนาด context ของโมเดล โดยให้ข้อความที่สั้นกว่าครบก่อน แล้วตัดท้ายของข้อความที่ยาวกว่า
+        
+        Args:
+            solution_text (str): ข้อความเฉลยของอาจารย์
+            submission_text (str): ข้อความคำตอบของนักเรียน
+            total_score (float): คะแนนเต็ม
+            context_tokens (int, optional): ขนาด context ของโมเดล
+            
+        Returns:
+            tuple: (ข้อความเฉลย, ข้อความคำตอบ, จำนวน token ของ prompt โดยประมาณ, ถูกตัดหรือไม่)
+        """
+        template_tokens = self.estimate_prompt_tokens("", "", total_score)
+        available = max(context_tokens - LLM_MAX_OUTPUT_TOKENS - template_tokens, 0)
+        solution_tokens = estimate_tokens(solution_text)
+        submission_tokens = estimate_tokens(submission_text)
+        
+        truncated = solution_tokens + submission_tokens > available
+        if truncated:
+            half = available // 2
+            if submission_tokens <= half:
+                solution_text = truncate_to_tokens(solution_text, available - submission_tokens)
+            elif solution_tokens <= half:
+                submission_text = truncate_to_tokens(submission_text, available - solution_tokens)
+            else:
+                solution_text = truncate_to_tokens(solution_text, half)
+                submission_text = truncate_to_tokens(submission_text, available - half)
+        
+        prompt_tokens = self.estimate_prompt_tokens(solution_text, submission_text, total_score)
+        return solution_text, submission_text, prompt_tokens, truncated
+    
+    def _create_payload(self, prompt, stream=False):
+        """
+        สร้างข้อมูลคำขอสำหรับ chat completions API
+        
+        Args:
+            prompt (str): prompt สำหรับการตรวจข้อสอบ
+            stream (bool, optional): ขอผลลัพธ์แบบ streaming หรือไม่
+            
+        Returns:
+            dict: ข้อมูลคำขอ
+        """
+        payload = {
+            "messages": [
+                {"role": "system", "content": "คุณเป็นผู้ช่วยตรวจข้อสอบอัตนัยที่มีความเชี่ยวชาญในการตรวจข้อสอบและให้คะแนน"},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": LLM_MAX_OUTPUT_TOKENS,
+            "top_p": 0.95,
+            "stream": stream
+        }
+        if LMSTUDIO_MODEL:
+            payload["model"] = LMSTUDIO_MODEL
+        return payload
+    
+    def _cache_key(self, payload):
+        """
+        สร้างคีย์ของแคชผลการตรวจจากข้อมูลคำขอ
+        
+        Args:
+            payload (dict): ข้อมูลคำขอ
+            
+        Returns:
+            str: คีย์ของแคช หรือ None ถ้าไม่ได้เปิดใช้แคช
+        """
+        if self.cache is None:
+            return None
+        return GradingCache.make_key(payload, LMSTUDIO_MODEL, PROMPT_VERSION)
     
     def _create_grading_prompt(self, solution_text, submission_text, total_score):
         """
@@ -0,0 +1,296 @@
+# grading_assistant/services/ocr_service.py
+import os
+import io
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import numpy as np
+import pytesseract
+from PIL import Image, ImageOps
+from utils.cache import SQLiteCache
+from dotenv import load_dotenv
+
+try:
+    import fitz  # PyMuPDF สำหรับแปลงหน้า PDF เป็นรูปภาพ
+except ImportError:
+    fitz = None
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ค่ากำหนดของ OCR
+OCR_LANG = os.getenv("OCR_LANG", "tha+eng")
+OCR_RENDER_DPI = int(os.getenv("OCR_RENDER_DPI", "200"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2400"))
+OCR_MAX_SKEW_DEGREES = float(os.getenv("OCR_MAX_SKEW_DEGREES", "5"))
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+OCR_MAX_PAGES_IN_FLIGHT = int(os.getenv("OCR_MAX_PAGES_IN_FLIGHT", str(2 * (os.cpu_count() or 1))))
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "./data/ocr_cache.db")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "64"))
+
+# เปลี่ยนเมื่อขั้นตอนการเตรียมรูปภาพเปลี่ยน เพื่อไม่ให้ใช้ผลจากแคชเดิม
+PREPROCESS_VERSION = "1"
+
+# ขนาดของรูปที่ใช้ประมาณมุมเอียง
+DESKEW_SAMPLE_SIDE = 800
+DESKEW_STEP_DEGREES = 0.5
+
+def preprocess_image(image):
+    """
+    เตรียมรูปภาพก่อน OCR โดยหมุนตาม EXIF แปลงเป็นภาพขาวดำ ย่อขนาด และแก้ภาพเอียง
+
+    Args:
+        image (Image.Image): รูปภาพ
+
+    Returns:
+        Image.Image: รูปภาพระดับสีเทาที่พร้อมสำหรับ OCR
+    """
+    image = ImageOps.exif_transpose(image)
+    gray = ImageOps.autocontrast(image.convert("L"))
+
+    # รูปจากกล้องโทรศัพท์มักมีความละเอียดเกินกว่าที่ OCR ต้องใช้ จึงย่อให้ไม่เกินขนาดที่กำหนด
+    if max(gray.size) > OCR_MAX_SIDE:
+        gray.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+
+    angle = estimate_skew(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    return gray
+
+def estimate_skew(gray):
+    """
+    ประมาณมุมเอียงของข้อความด้วย projection profile โดยหามุมที่ผลรวมของจุดหมึกในแต่ละแถวแปรปรวนมากที่สุด
+
+    Args:
+        gray (Image.Image): รูปภาพระดับสีเทา
+
+    Returns:
+        float: มุมที่ต้องหมุนกลับ (องศา) หรือ 0 ถ้าไม่เอียง
+    """
+    sample = gray.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE))
+    ink = Image.fromarray(((np.asarray(sample) < 128) * 255).astype(np.uint8))
+
+    best_angle = 0.0
+    best_score = None
+    for angle in np.arange(-OCR_MAX_SKEW_DEGREES, OCR_MAX_SKEW_DEGREES + DESKEW_STEP_DEGREES / 2, DESKEW_STEP_DEGREES):
+        profile = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST), dtype=np.float32).sum(axis=1)
+        score = float(np.var(profile))
+        if best_score is None or score > best_score:
+            best_angle, best_score = float(angle), score
+
+    return best_angle
+
+def ocr_image(image):
+    """
+    เตรียมรูปภาพและแปลงเป็นข้อความด้วย Tesseract
+
+    Args:
+        image (Image.Image): รูปภาพ
+
+    Returns:
+        str: ข้อความที่อ่านได้
+    """
+    # ให้ Tesseract ใช้หนึ่ง thread ต่อหน้า เพราะการขนานทำในระดับหน้าผ่าน process pool แล้ว
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    return pytesseract.image_to_string(preprocess_image(image), lang=OCR_LANG).strip()
+
+def ocr_encoded_image(file_data):
+    """
+    แปลงไฟล์รูปภาพ (PNG, JPEG) เป็นข้อความ ใช้เป็นงานใน process pool ได้
+
+    Args:
+        file_data (bytes): ข้อมูลไฟล์รูปภาพ
+
+    Returns:
+        str: ข้อความที่อ่านได้
+    """
+    return ocr_image(Image.open(io.BytesIO(file_data)))
+
+def ocr_raw_page(width, height, samples):
+    """
+    แปลงหน้าเอกสารที่ render เป็นภาพระดับสีเทาแล้วเป็นข้อความ ใช้เป็นงานใน process pool ได้
+
+    Args:
+        width (int): ความกว้างของภาพ
+        height (int): ความสูงของภาพ
+        samples (bytes): ข้อมูลพิกเซลแบบ 8 บิตต่อพิกเซล
+
+    Returns:
+        str: ข้อความที่อ่านได้
+    """
+    return ocr_image(Image.frombytes("L", (width, height), samples))
+
+def read_pdf_text_layer(file_data, max_pages=None, timeout=None):
+    """
+    อ่านข้อความที่มีอยู่ในไฟล์ PDF ทีละหน้า ใช้เป็นงานใน process pool ได้
+
+    Args:
+        file_data (bytes): ข้อมูลไฟล์ PDF
+        max_pages (int, optional): จำนวนหน้าสูงสุดที่อ่าน
+        timeout (float, optional): เวลาสูงสุดในการอ่านทั้งไฟล์ (วินาที)
+
+    Returns:
+        list: ข้อความของแต่ละหน้า หรือ None สำหรับหน้าที่เป็นภาพสแกนซึ่งต้อง OCR
+
+    Raises:
+        TimeoutError: ถ้าอ่านไฟล์นานเกินเวลาที่กำหนด
+    """
+    texts = []
+    deadline = time.monotonic() + timeout if timeout else None
+
+    with fitz.open(stream=file_data, filetype="pdf") as document:
+        for index, page in enumerate(document):
+            if max_pages and index >= max_pages:
+                print(f"PDF has more than {max_pages} pages, remaining pages are skipped")
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"PDF text extraction exceeded {timeout} seconds at page {index + 1}")
+
+            text = page.get_text().strip()
+            texts.append(text if len(text) >= OCR_MIN_TEXT_CHARS else None)
+
+    return texts
+
+def ocr_pdf_page(file_data, index):
+    """
+    render หน้า PDF เป็นภาพระดับสีเทาแล้วแปลงเป็นข้อความ ใช้เป็นงานใน process pool ได้
+
+    Args:
+        file_data (bytes): ข้อมูลไฟล์ PDF
+        index (int): ลำดับของหน้า (เริ่มจาก 0)
+
+    Returns:
+        str: ข้อความที่อ่านได้
+    """
+    with fitz.open(stream=file_data, filetype="pdf") as document:
+        pixmap = document[index].get_pixmap(dpi=OCR_RENDER_DPI, colorspace=fitz.csGRAY, alpha=False)
+        return ocr_raw_page(pixmap.width, pixmap.height, pixmap.samples)
+
+class OCRService:
+    """
+    คลาสสำหรับ OCR เอกสารที่สแกนและรูปถ่าย โดยกระจายการ OCR แต่ละหน้าไปยัง process pool
+    และเก็บผลลัพธ์ในแคชตาม hash ของหน้า
+    """
+    def __init__(self, cache_path=OCR_CACHE_PATH, cache_max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024):
+        self.cache = SQLiteCache(cache_path, max_bytes=cache_max_bytes) if cache_path else None
+
+    @staticmethod
+    def pdf_rasterizer_available():
+        """ตรวจสอบว่าติดตั้ง PyMuPDF สำหรับแปลงหน้า PDF เป็นรูปภาพแล้วหรือไม่"""
+        return fitz is not None
+
+    def _page_key(self, *parts):
+        """สร้างคีย์ของแคชจากข้อมูลของหน้าและค่ากำหนดของ OCR"""
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(f"{OCR_LANG}\0{PREPROCESS_VERSION}\0{OCR_MAX_SIDE}".encode("utf-8"))
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _cache_get(self, key):
+        if self.cache is None:
+            return None
+        value = self.cache.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def _cache_set(self, key, text):
+        if self.cache is not None:
+            self.cache.set(key, text.encode("utf-8"))
+
+    def ocr_image(self, file_data, executor=None):
+        """
+        OCR ไฟล์รูปภาพหนึ่งไฟล์
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์รูปภาพ
+            executor (Executor, optional): pool ที่ใช้ OCR ถ้าไม่ระบุจะทำใน process ปัจจุบัน
+
+        Returns:
+            str: ข้อความที่อ่านได้
+        """
+        key = self._page_key(file_data)
+        text = self._cache_get(key)
+        if text is not None:
+            return text
+
+        if executor is not None:
+            text = executor.submit(ocr_encoded_image, file_data).result()
+        else:
+            text = ocr_encoded_image(file_data)
+
+        self._cache_set(key, text)
+        return text
+
+    def ocr_pdf(self, file_data, executor=None, max_pages=None, timeout=None):
+        """
+        ดึงข้อความจาก PDF โดยใช้ข้อความในไฟล์ของหน้าที่มีอยู่แล้ว และ OCR หน้าที่เป็นภาพสแกนแบบขนาน
+        การอ่านและ render หน้า PDF ทั้งหมดทำใน pool ส่วน thread ที่เรียกเพียงรอผลและจัดการแคช
+
+        Args:
+            file_data (bytes): ข้อมูลไฟล์ PDF
+            executor (Executor, optional): pool ที่ใช้อ่านไฟล์และ OCR ถ้าไม่ระบุจะทำใน process ปัจจุบัน
+            max_pages (int, optional): จำนวนหน้าสูงสุดที่อ่าน
+            timeout (float, optional): เวลาสูงสุดในการอ่านทั้งไฟล์ (วินาที)
+
+        Returns:
+            str: ข้อความของทุกหน้าเรียงตามลำดับหน้า
+
+        Raises:
+            TimeoutError: ถ้าอ่านไฟล์นานเกินเวลาที่กำหนด
+        """
+        if fitz is None:
+            raise RuntimeError("PyMuPDF is required to OCR scanned PDF pages")
+
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def run(function, *args):
+            return executor.submit(function, *args) if executor is not None else function(*args)
+
+        def wait(result):
+            if executor is None:
+                return result
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            try:
+                return result.result(timeout=remaining)
+            except FuturesTimeoutError:
+                raise TimeoutError(f"PDF text extraction exceeded {timeout} seconds") from None
+
+        texts = wait(run(read_pdf_text_layer, file_data, max_pages, timeout))
+        if all(text is not None for text in texts):
+            return "\n".join(text for text in texts if text)
+
+        # หน้าที่ไม่มีข้อความในไฟล์ถือเป็นภาพสแกน จึง OCR เฉพาะหน้าเหล่านี้โดยใช้ผลจากแคชถ้ามี
+        file_digest = hashlib.blake2b(file_data, digest_size=32).hexdigest()
+        pending = deque()
+
+        def collect(index, key, result):
+            text = wait(result)
+            self._cache_set(key, text)
+            texts[index] = text
+
+        for index, text in enumerate(texts):
+            if text is not None:
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"PDF text extraction exceeded {timeout} seconds at page {index + 1}")
+
+            key = self._page_key(file_digest, index, OCR_RENDER_DPI)
+            cached = self._cache_get(key)
+            if cached is not None:
+                texts[index] = cached
+                continue
+
+            pending.append((index, key, run(ocr_pdf_page, file_data, index)))
+
+            # จำกัดจำนวนหน้าที่รอ OCR เพื่อไม่ให้หน่วยความจำของ pool โตตามจำนวนหน้า
+            while len(pending) >= OCR_MAX_PAGES_IN_FLIGHT:
+                collect(*pending.popleft())
+
+        while pending:
+            collect(*pending.popleft())
+
+        return "\n".join(text for text in texts if text)
@@ -0,0 +1,236 @@
+# grading_assistant/services/statistics_service.py
+import math
+import argparse
+from models.database import SubmissionModel, GradeModel, AssignmentModel, AssignmentStatisticsModel
+
+# จำนวนช่วงของ histogram (คิดเป็นร้อยละของคะแนนเต็ม)
+HISTOGRAM_BUCKETS = 10
+PERCENTILES = (("p25", 0.25), ("p50", 0.5), ("p75", 0.75), ("p90", 0.9))
+
+class StatisticsService:
+    """
+    คลาสสำหรับสถิติคะแนน สถิติของงานอ่านจากตาราง assignment_statistics ที่ trigger อัปเดตไว้ล่วงหน้า
+    กรณีอื่นให้ฐานข้อมูลคำนวณผ่าน RPC grade_statistics และคำนวณใน Python ถ้ายังไม่ได้ติดตั้ง RPC
+    """
+    def __init__(self):
+        self.submission_model = SubmissionModel()
+        self.grade_model = GradeModel()
+        self.assignment_model = AssignmentModel()
+        self.assignment_statistics_model = AssignmentStatisticsModel()
+
+    def get_grade_statistics(self, user_id, assignment_id=None, student_id=None):
+        """
+        ดึงสถิติคะแนนตามงานหรือตามนักเรียน
+
+        Args:
+            user_id (str): ID ของผู้ใช้
+            assignment_id (str, optional): ID ของงาน
+            student_id (str, optional): รหัสนักเรียน
+
+        Returns:
+            dict: จำนวนงานที่ส่ง ค่าสถิติของคะแนน เปอร์เซ็นไทล์ และ histogram
+        """
+        if assignment_id and not student_id:
+            statistics = self._get_precomputed_statistics(user_id, assignment_id)
+            if statistics is not None:
+                return statistics
+
+        try:
+            result = self.grade_model.client.rpc('grade_statistics', {
+                "p_user_id": user_id,
+                "p_assignment_id": assignment_id,
+                "p_student_id": student_id,
+                "p_buckets": HISTOGRAM_BUCKETS
+            }).execute()
+            if result.data:
+                return result.data
+        except Exception as e:
+            print(f"grade_statistics RPC is not available, computing in Python: {str(e)}")
+
+        return self._compute_statistics(user_id, assignment_id, student_id)
+
+    def _get_precomputed_statistics(self, user_id, assignment_id):
+        """
+        อ่านสถิติของงานจากแถวเดียวในตาราง assignment_statistics
+
+        Returns:
+            dict: สถิติของงาน หรือ None ถ้ายังไม่มีแถวหรือยังไม่ได้ติดตั้งตาราง
+        """
+        try:
+            result = self.assignment_statistics_model.get_by_assignment(assignment_id, user_id)
+        except Exception as e:
+            print(f"assignment_statistics is not available: {str(e)}")
+            return None
+
+        if not result.data:
+            return None
+        return statistics_from_row(result.data[0])
+
+    def rebuild(self, assignment_id=None):
+        """
+        สร้างสถิติที่คำนวณไว้ล่วงหน้าใหม่จากข้อมูลจริง ใช้แก้ไขเมื่อค่าคลาดเคลื่อน
+
+        Args:
+            assignment_id (str, optional): ID ของงาน ถ้าไม่ระบุจะสร้างใหม่ทุกงาน
+
+        Returns:
+            int: จำนวนงานที่สร้างสถิติใหม่
+        """
+        return self.assignment_statistics_model.rebuild(assignment_id).data
+
+    def _compute_statistics(self, user_id, assignment_id=None, student_id=None):
+        """คำนวณสถิติใน Python โดยดึงเฉพาะคอลัมน์ที่ใช้"""
+        query = self.submission_model.client.table("submissions").select("id, status, assignment_id").eq("user_id", user_id)
+        if assignment_id:
+            query = query.eq("assignment_id", assignment_id)
+        if student_id:
+            query = query.eq("student_id", student_id)
+        submissions = query.execute().data
+
+        graded = [s for s in submissions if s["status"] in ("graded", "approved")]
+        statistics = {
+            "total_submissions": len(submissions),
+            "graded_submissions": len(graded),
+            "approved_submissions": sum(1 for s in submissions if s["status"] == "approved")
+        }
+
+        scores = []
+        if graded:
+            assignment_of = {s["id"]: s["assignment_id"] for s in graded}
+            grades = self.grade_model.get_by("submission_id", list(assignment_of), columns="submission_id, score").data
+            total_scores = {
+                a["id"]: a["total_score"]
+                for a in self.assignment_model.get_by("id", set(assignment_of.values()), columns="id, total_score").data
+            }
+            scores = [(g["score"], total_scores.get(assignment_of[g["submission_id"]])) for g in grades]
+
+        statistics.update(summarize_scores(scores))
+        return statistics
+
+def summarize_scores(scores, buckets=HISTOGRAM_BUCKETS):
+    """
+    คำนวณค่าสถิติ เปอร์เซ็นไทล์ และ histogram ของคะแนน
+
+    Args:
+        scores (list): รายการ (คะแนน, คะแนนเต็ม)
+        buckets (int, optional): จำนวนช่วงของ histogram
+
+    Returns:
+        dict: ค่าสถิติของคะแนน
+    """
+    values = sorted(score for score, _ in scores)
+    count = len(values)
+    avg = sum(values) / count if count else 0
+
+    histogram = [0] * buckets
+    for score, total_score in scores:
+        if total_score:
+            bucket = min(max(int(score / total_score * buckets), 0), buckets - 1)
+            histogram[bucket] += 1
+
+    return {
+        "avg_score": avg,
+        "max_score": values[-1] if count else 0,
+        "min_score": values[0] if count else 0,
+        "stddev_score": math.sqrt(sum((v - avg) ** 2 for v in values) / count) if count else 0,
+        "percentiles": {name: _percentile(values, fraction) for name, fraction in PERCENTILES},
+        "percentiles_approximate": False,
+        "histogram": [
+            {
+                "from_percent": i * 100.0 / buckets,
+                "to_percent": (i + 1) * 100.0 / buckets,
+                "count": histogram[i]
+            }
+            for i in range(buckets)
+        ]
+    }
+
+def statistics_from_row(row):
+    """
+    แปลงแถวของ assignment_statistics เป็นสถิติรูปแบบเดียวกับ summarize_scores
+    ค่าเฉลี่ยและส่วนเบี่ยงเบนมาตรฐานคำนวณจากผลรวมและผลรวมกำลังสอง
+    ส่วนเปอร์เซ็นไทล์เป็นค่าประมาณจาก histogram จึงระบุ percentiles_approximate เป็น True
+
+    Args:
+        row (dict): แถวของตาราง assignment_statistics
+
+    Returns:
+        dict: สถิติของงาน
+    """
+    count = row["score_count"]
+    histogram = row["histogram"]
+    buckets = len(histogram)
+    total_score = float(row["total_score"] or 0)
+    min_score = float(row["score_min"]) if count and row["score_min"] is not None else 0
+    max_score = float(row["score_max"]) if count and row["score_max"] is not None else 0
+    avg = float(row["score_sum"]) / count if count else 0
+    variance = float(row["score_sum_sq"]) / count - avg * avg if count else 0
+
+    return {
+        "total_submissions": row["pending_submissions"] + row["graded_submissions"] + row["approved_submissions"],
+        "graded_submissions": row["graded_submissions"] + row["approved_submissions"],
+        "approved_submissions": row["approved_submissions"],
+        "avg_score": avg,
+        "max_score": max_score,
+        "min_score": min_score,
+        # ปัดค่าติดลบเล็กน้อยจากความคลาดเคลื่อนของทศนิยมเป็นศูนย์
+        "stddev_score": math.sqrt(max(variance, 0)),
+        "percentiles": {
+            name: _histogram_percentile(histogram, total_score, fraction, min_score, max_score)
+            for name, fraction in PERCENTILES
+        },
+        "percentiles_approximate": True,
+        "histogram": [
+            {
+                "from_percent": i * 100.0 / buckets,
+                "to_percent": (i + 1) * 100.0 / buckets,
+                "count": histogram[i]
+            }
+            for i in range(buckets)
+        ]
+    }
+
+def _histogram_percentile(histogram, total_score, fraction, min_score, max_score):
+    """ประมาณเปอร์เซ็นไทล์จาก histogram โดยถือว่าคะแนนกระจายสม่ำเสมอในแต่ละช่วง"""
+    count = sum(histogram)
+    if not count or total_score <= 0:
+        return 0
+
+    buckets = len(histogram)
+    target = (count - 1) * fraction
+    seen = 0
+    for i, bucket_count in enumerate(histogram):
+        if bucket_count and seen + bucket_count > target:
+            lower = max(total_score * i / buckets, min_score)
+            upper = min(total_score * (i + 1) / buckets, max_score)
+            position = (target - seen + 0.5) / bucket_count
+            return lower + (upper - lower) * position
+        seen += bucket_count
+    return max_score
+
+def _percentile(values, fraction):
+    """เปอร์เซ็นไทล์แบบ interpolation เชิงเส้น (เหมือน percentile_cont ของ Postgres)"""
+    if not values:
+        return 0
+    position = (len(values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def main():
+    parser = argparse.ArgumentParser(description="สร้างสถิติของงานที่คำนวณไว้ล่วงหน้าใหม่")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="สร้างตาราง assignment_statistics ใหม่จากคะแนนและงานที่ส่ง")
+    parser.add_argument("--assignment-id", default=None,
+                        help="สร้างใหม่เฉพาะงานที่ระบุ")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    rebuilt = StatisticsService().rebuild(args.assignment_id)
+    print(f"Rebuilt statistics for {rebuilt} assignment(s)")
+
+if __name__ == '__main__':
+    main()
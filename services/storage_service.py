@@ -5,9 +5,17 @@ import pathlib
 from werkzeug.utils import secure_filename
 from PyPDF2 import PdfReader
 from docx import Document
-import pytesseract
-from PIL import Image
+from services.ocr_service import ocr_encoded_image
+from dotenv import load_dotenv
 import io
+import time
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# ขีดจำกัดของการดึงข้อความจาก PDF หนึ่งไฟล์
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_EXTRACTION_TIMEOUT = float(os.getenv("PDF_EXTRACTION_TIMEOUT", "120"))
 
 class StorageService:
     """
@@ -45,9 +53,30 @@ class StorageService:
         if not file or not self.allowed_file(file.filename):
             return {"error": "ไฟล์ไม่ถูกต้องหรือนามสกุลไม่ได้รับอนุญาต"}
         
+        return self.upload_bytes(file.read(), file.filename, file.content_type, folder_path, user_id)
+    
+    def upload_bytes(self, file_data, filename, content_type, folder_path, user_id):
+        """
+        อัปโหลดข้อมูลไฟล์ที่อ่านไว้ในหน่วยความจำแล้วไปยัง Supabase Storage
+        
+        Args:
+            file_data (bytes): ข้อมูลไฟล์
+            filename (str): ชื่อไฟล์เดิม
+            content_type (str): ประเภทของไฟล์
+            folder_path (str): พาธของโฟลเดอร์
+            user_id (str): ID ของผู้ใช้
+            
+        Returns:
+            dict: ข้อมูลไฟล์ที่อัปโหลด
+        """
+        if not filename or not self.allowed_file(filename):
+            return {"error": "ไฟล์ไม่ถูกต้องหรือนามสกุลไม่ได้รับอนุญาต"}
+        
         # สร้างชื่อไฟล์ที่ปลอดภัย
-        filename = secure_filename(file.filename)
-        ext = filename.rsplit('.', 1)[1].lower()
+        # ใช้นามสกุลจากชื่อเดิม เพราะ secure_filename ตัดอักษรภาษาไทยออกและอาจเหลือแต่นามสกุล
+        original_name = filename
+        ext = original_name.rsplit('.', 1)[1].lower()
+        filename = secure_filename(original_name) or f"file.{ext}"
         
         # สร้างชื่อไฟล์ใหม่ด้วย UUID เพื่อป้องกันการซ้ำกัน
         new_filename = f"{uuid.uuid4()}.{ext}"
@@ -55,7 +84,7 @@ class StorageService:
         
         # อัปโหลดไฟล์ไปยัง Supabase Storage
         try:
-            self.supabase.storage.from_("files").upload(file_path, file.read())
+            self.supabase.storage.from_("files").upload(file_path, file_data)
             
             # ดึง URL ของไฟล์
             file_url = self.supabase.storage.from_("files").get_public_url(file_path)
@@ -63,10 +92,10 @@ class StorageService:
             return {
                 "path": file_path,
                 "name": filename,
-                "original_name": file.filename,
+                "original_name": original_name,
                 "url": file_url,
-                "size": file.content_length,
-                "type": file.content_type
+                "size": len(file_data),
+                "type": content_type
             }
         except Exception as e:
             return {"error": f"เกิดข้อผิดพลาดในการอัปโหลดไฟล์: {str(e)}"}
@@ -103,6 +132,25 @@ class StorageService:
         except Exception as e:
             return {"error": f"เกิดข้อผิดพลาดในการลบไฟล์: {str(e)}"}
     
+    def delete_files(self, file_paths):
+        """
+        ลบไฟล์หลายไฟล์จาก Supabase Storage ในการเรียกครั้งเดียว
+        
+        Args:
+            file_paths (list): รายการพาธของไฟล์
+            
+        Returns:
+            dict: สถานะการลบไฟล์
+        """
+        file_paths = [path for path in file_paths if path]
+        if not file_paths:
+            return {"success": True, "message": "ไม่มีไฟล์ที่ต้องลบ"}
+        try:
+            self.supabase.storage.from_("files").remove(file_paths)
+            return {"success": True, "message": f"ลบไฟล์ {len(file_paths)} ไฟล์สำเร็จ"}
+        except Exception as e:
+            return {"error": f"เกิดข้อผิดพลาดในการลบไฟล์: {str(e)}"}
+    
     def create_folder(self, folder_path):
         """
         สร้างโฟลเดอร์ใน Supabase Storage (ทำโดยการอัปโหลดไฟล์ว่างเปล่า)
@@ -132,30 +180,69 @@ class StorageService:
         Returns:
             str: ข้อความที่ดึงจากไฟล์
         """
-        text = ""
-        
         try:
-            if file_type.endswith('pdf'):
-                # ดึงข้อความจากไฟล์ PDF
-                reader = PdfReader(io.BytesIO(file_data))
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                    
-            elif file_type.endswith('docx'):
-                # ดึงข้อความจากไฟล์ Word
-                doc = Document(io.BytesIO(file_data))
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
-                    
-            elif file_type.endswith(('png', 'jpg', 'jpeg')):
-                # ดึงข้อความจากรูปภาพโดยใช้ OCR
-                image = Image.open(io.BytesIO(file_data))
-                text = pytesseract.image_to_string(image, lang='tha+eng')
-                
-            elif file_type.endswith('txt'):
-                # ดึงข้อความจากไฟล์ข้อความ
-                text = file_data.decode('utf-8')
-            
-            return text.strip()
+            return extract_text_from_bytes(file_data, file_type)
         except Exception as e:
-            return f"ไม่สามารถดึงข้อความจากไฟล์: {str(e)}"
\ No newline at end of file
+            return f"ไม่สามารถดึงข้อความจากไฟล์: {str(e)}"
+
+def extract_text_from_bytes(file_data, file_type):
+    """
+    ดึงข้อความจากข้อมูลไฟล์ ฟังก์ชันนี้อยู่ระดับโมดูลเพื่อให้ส่งไปทำงานใน process pool ได้
+    
+    Args:
+        file_data (bytes): ข้อมูลไฟล์
+        file_type (str): ประเภทของไฟล์
+        
+    Returns:
+        str: ข้อความที่ดึงจากไฟล์
+        
+    Raises:
+        Exception: ถ้าไม่สามารถอ่านไฟล์ได้
+    """
+    text = ""
+    
+    if file_type.endswith('pdf'):
+        # ดึงข้อความจากไฟล์ PDF ทีละหน้า แล้วรวมในครั้งเดียว
+        text = "\n".join(iter_pdf_pages(file_data))
+            
+    elif file_type.endswith('docx'):
+        # ดึงข้อความจากไฟล์ Word
+        doc = Document(io.BytesIO(file_data))
+        text = "\n".join(para.text for para in doc.paragraphs)
+            
+    elif file_type.endswith(('png', 'jpg', 'jpeg')):
+        # ดึงข้อความจากรูปภาพโดยใช้ OCR
+        text = ocr_encoded_image(file_data)
+        
+    elif file_type.endswith('txt'):
+        # ดึงข้อความจากไฟล์ข้อความ
+        text = file_data.decode('utf-8')
+    
+    return text.strip()
+
+def iter_pdf_pages(file_data, max_pages=PDF_MAX_PAGES, timeout=PDF_EXTRACTION_TIMEOUT):
+    """
+    ดึงข้อความจาก PDF ทีละหน้า โดยไม่เก็บข้อความของทั้งเอกสารไว้ในหน่วยความจำ
+    
+    Args:
+        file_data (bytes): ข้อมูลไฟล์ PDF
+        max_pages (int, optional): จำนวนหน้าสูงสุดที่อ่าน (0 = ไม่จำกัด)
+        timeout (float, optional): เวลาสูงสุดในการอ่านทั้งไฟล์ (วินาที, 0 = ไม่จำกัด)
+        
+    Yields:
+        str: ข้อความของแต่ละหน้า
+        
+    Raises:
+        TimeoutError: ถ้าอ่านไฟล์นานเกินเวลาที่กำหนด
+    """
+    reader = PdfReader(io.BytesIO(file_data))
+    deadline = time.monotonic() + timeout if timeout else None
+    
+    for index in range(len(reader.pages)):
+        if max_pages and index >= max_pages:
+            print(f"PDF has more than {max_pages} pages, remaining pages are skipped")
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"PDF text extraction exceeded {timeout} seconds at page {index + 1}")
+        
+        yield reader.pages[index].extract_text() or ""
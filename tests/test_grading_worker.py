@@ -0,0 +1,76 @@
+# grading_assistant/tests/test_grading_worker.py
+import os
+import time
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from services.job_queue import GradingJobQueue, GRADING_JOB_BACKOFF_SECONDS
+from services.grading_service import GradingService
+from services.grading_worker import GradingWorker
+
+class FakeModel:
+    """โมเดลในหน่วยความจำที่มีเมธอดเท่าที่ GradingService ใช้"""
+    def __init__(self, rows=()):
+        self.rows = {row['id']: dict(row) for row in rows}
+        self.created = []
+
+    def get_by_id(self, id, columns='*'):
+        return SimpleNamespace(data=[self.rows[id]] if id in self.rows else [])
+
+    def get_by_assignment(self, assignment_id, user_id=None):
+        return SimpleNamespace(data=[row for row in self.rows.values() if row.get('assignment_id') == assignment_id])
+
+    def create(self, data):
+        self.created.append(data)
+        return SimpleNamespace(data=[dict(data, id=f"row{len(self.created)}")])
+
+    def update(self, id, data):
+        self.rows[id].update(data)
+        return SimpleNamespace(data=[self.rows[id]])
+
+class GradingWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = GradingJobQueue(os.path.join(self.directory.name, "queue.db"))
+
+        self.grading_service = GradingService()
+        self.grading_service.submission_model = FakeModel([{
+            "id": "sub1", "user_id": "user1", "assignment_id": "asg1",
+            "status": "pending", "content_text": "คำตอบของนักเรียน"
+        }])
+        self.grading_service.assignment_model = FakeModel([{"id": "asg1", "total_score": 10}])
+        self.grading_service.solution_model = FakeModel([{
+            "id": "sol1", "assignment_id": "asg1", "content_text": "เฉลยของอาจารย์"
+        }])
+        self.grading_service.grade_model = FakeModel()
+        self.grading_service.llm_service.cache = None
+
+        self.worker = GradingWorker(queue=self.queue, grading_service=self.grading_service, lease_seconds=30)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_llm_error_requeues_job_with_backoff(self):
+        job = self.queue.enqueue("sub1", "user1", use_rag=False, assignment_id="asg1")
+        leased = self.queue.lease("worker1", 30)
+        self.assertEqual(leased['id'], job['id'])
+
+        response = mock.Mock(status_code=500, text="internal error")
+        started = time.time()
+        with mock.patch.object(self.grading_service.llm_service.http_client, "post", return_value=response):
+            self.worker.process_job(leased, "worker1")
+
+        retried = self.queue.get(job['id'])
+        self.assertEqual(retried['status'], 'queued')
+        self.assertEqual(retried['attempts'], 1)
+        self.assertTrue(retried['last_error'])
+        # backoff ของครั้งแรกคือ GRADING_JOB_BACKOFF_SECONDS โดยสุ่มเพิ่มลดไม่เกิน 20%
+        self.assertGreaterEqual(retried['available_at'], started + GRADING_JOB_BACKOFF_SECONDS * 0.8)
+
+        # ต้องไม่บันทึกคะแนนและงานที่ส่งยังรอตรวจอยู่
+        self.assertEqual(self.grading_service.grade_model.created, [])
+        self.assertEqual(self.grading_service.submission_model.rows["sub1"]['status'], 'pending')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,4 +3,4 @@
 โมดูลสำหรับฟังก์ชันช่วยเหลือต่างๆ
 """
 # เปิดใช้งานการ import ทั้งหมดจากโมดูลนี้
-__all__ = ['file_utils', 'security', 'helpers']
\ No newline at end of file
+__all__ = ['file_utils', 'security', 'helpers', 'cache', 'http_response']
\ No newline at end of file
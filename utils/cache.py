@@ -0,0 +1,206 @@
+# grading_assistant/utils/cache.py
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class LRUCache:
+    """
+    แคชในหน่วยความจำแบบ LRU ที่ใช้งานจากหลาย thread ได้
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        ดึงค่าจากแคช
+
+        Args:
+            key (str): คีย์ของข้อมูล
+
+        Returns:
+            object: ค่าที่เก็บไว้ หรือ None ถ้าไม่พบ
+        """
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return self.data[key]
+
+    def set(self, key, value):
+        """
+        เก็บค่าลงในแคช และลบรายการที่ไม่ได้ใช้นานที่สุดเมื่อเกินขนาด
+
+        Args:
+            key (str): คีย์ของข้อมูล
+            value (object): ค่าที่ต้องการเก็บ
+        """
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        """ลบค่าออกจากแคช"""
+        with self.lock:
+            self.data.pop(key, None)
+
+    def stats(self):
+        """
+        ดึงสถิติของแคช
+
+        Returns:
+            dict: จำนวน hit, miss และจำนวนรายการในแคช
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.data),
+                "max_entries": self.max_entries
+            }
+
+class SQLiteCache:
+    """
+    แคชบนดิสก์ที่เก็บข้อมูลแบบ BLOB ใน SQLite รองรับการหมดอายุ (TTL)
+    และการลบรายการที่ไม่ได้ใช้นานที่สุดเมื่อขนาดรวมเกินที่กำหนด
+    """
+    def __init__(self, db_path, max_bytes=256 * 1024 * 1024, ttl_seconds=None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        """เปิดการเชื่อมต่อ SQLite สำหรับหนึ่งการทำงาน"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """
+        ดึงค่าจากแคช
+
+        Args:
+            key (str): คีย์ของข้อมูล
+
+        Returns:
+            bytes: ค่าที่เก็บไว้ หรือ None ถ้าไม่พบหรือหมดอายุแล้ว
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+
+            if not row:
+                with self.lock:
+                    self.misses += 1
+                return None
+
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self.lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, value):
+        """
+        เก็บค่าลงในแคช
+
+        Args:
+            key (str): คีย์ของข้อมูล
+            value (bytes): ค่าที่ต้องการเก็บ
+        """
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), size, now, now)
+            )
+            self._evict(conn)
+
+    def delete(self, key):
+        """ลบค่าออกจากแคช"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, conn):
+        """ลบรายการที่หมดอายุ และรายการที่ไม่ได้ใช้นานที่สุดจนขนาดรวมไม่เกินที่กำหนด"""
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # ลบให้เหลือ 90% ของขนาดสูงสุด เพื่อไม่ต้องลบทุกครั้งที่เพิ่มข้อมูลใหม่
+        target = self.max_bytes * 0.9
+        conn.execute("BEGIN IMMEDIATE")
+        while total > target:
+            rows = conn.execute("SELECT key, size FROM cache ORDER BY accessed_at LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= target:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                total -= size
+        conn.execute("COMMIT")
+
+    def stats(self):
+        """
+        ดึงสถิติของแคช
+
+        Returns:
+            dict: จำนวน hit, miss จำนวนรายการ และขนาดรวมของแคช
+        """
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes
+            }
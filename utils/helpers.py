@@ -5,6 +5,7 @@ import csv
 import time
 import io
 from datetime import datetime
+from flask import jsonify
 
 def format_date(date_str, format_str="%Y-%m-%d %H:%M:%S"):
     """
@@ -80,6 +81,74 @@ def generate_csv(data, headers):
     except Exception:
         return io.StringIO()
 
+def format_sse(event, data):
+    """
+    แปลงข้อมูลเป็นข้อความในรูปแบบ Server-Sent Events
+    
+    Args:
+        event (str): ชื่อเหตุการณ์
+        data (dict): ข้อมูลที่ต้องการส่ง
+        
+    Returns:
+        str: ข้อความในรูปแบบ Server-Sent Events
+    """
+    return f"event: {event}\ndata: {to_json(data)}\n\n"
+
+def get_pagination_args(args, max_limit=200):
+    """
+    อ่านพารามิเตอร์การแบ่งหน้าแบบ keyset (limit และ after) จาก query string
+    
+    Args:
+        args (MultiDict): query string ของคำขอ
+        max_limit (int): จำนวนรายการสูงสุดต่อหน้า
+        
+    Returns:
+        tuple: (limit, after) โดย limit เป็น None ถ้าไม่ได้ระบุหรือไม่ถูกต้อง
+    """
+    try:
+        limit = int(args.get('limit', 0))
+    except ValueError:
+        limit = 0
+    
+    limit = min(limit, max_limit) if limit > 0 else None
+    return limit, args.get('after') or None
+
+def get_id_list(data, key, max_items=200):
+    """
+    อ่านรายการ ID จาก body ของคำขอ โดยต้องเป็น list ของข้อความที่ไม่ว่างและมีไม่เกินจำนวนที่กำหนด
+    
+    Args:
+        data (dict): body ของคำขอ
+        key (str): ชื่อฟิลด์ของรายการ ID
+        max_items (int): จำนวน ID สูงสุดต่อคำขอ
+        
+    Returns:
+        list: รายการ ID หรือ None ถ้าไม่ได้ระบุหรือไม่ถูกต้อง
+    """
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids or len(ids) > max_items:
+        return None
+    if not all(isinstance(id, str) and id for id in ids):
+        return None
+    return ids
+
+def paginated_response(data, limit):
+    """
+    สร้าง response ของรายการ โดยส่ง cursor ของหน้าถัดไปใน header X-Next-Cursor
+    เพื่อให้ body ยังเป็น array เหมือนเดิม
+    
+    Args:
+        data (list): รายการในหน้านี้
+        limit (int): จำนวนรายการต่อหน้า หรือ None ถ้าไม่แบ่งหน้า
+        
+    Returns:
+        Response: response ของ Flask
+    """
+    response = jsonify(data)
+    if limit and len(data) >= limit:
+        response.headers['X-Next-Cursor'] = str(data[-1]['id'])
+    return response
+
 def ensure_dir(directory):
     """
     สร้างไดเรกทอรีถ้ายังไม่มี
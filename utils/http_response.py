@@ -0,0 +1,94 @@
+# grading_assistant/utils/http_response.py
+import os
+import gzip
+import hashlib
+from flask import request
+from dotenv import load_dotenv
+
+try:
+    import brotli  # ใช้บีบอัดแบบ br ถ้าติดตั้งไว้
+except ImportError:
+    brotli = None
+
+# โหลดตัวแปรสภาพแวดล้อมจากไฟล์ .env
+load_dotenv()
+
+# บีบอัดเฉพาะ response ที่ใหญ่กว่าขนาดนี้ (ไบต์) เพราะ response เล็กบีบอัดแล้วแทบไม่ลดขนาด
+API_COMPRESS_MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+API_GZIP_LEVEL = int(os.getenv("API_GZIP_LEVEL", "6"))
+API_BROTLI_QUALITY = int(os.getenv("API_BROTLI_QUALITY", "5"))
+# แสดงขนาดก่อนและหลังบีบอัดของแต่ละ response เพื่อใช้ปรับค่ากำหนด
+API_LOG_RESPONSE_SIZES = os.getenv("API_LOG_RESPONSE_SIZES", "False") == "True"
+
+def init_app(app, url_prefix='/api/'):
+    """
+    ลงทะเบียนการใส่ ETag การตอบ 304 และการบีบอัด response แบบ JSON ของทุก API
+
+    Args:
+        app (Flask): Flask application
+        url_prefix (str): prefix ของ URL ที่ใช้กับ response
+    """
+    @app.after_request
+    def conditional_compressed_response(response):
+        if not request.path.startswith(url_prefix):
+            return response
+        return prepare_json_response(response)
+
+def prepare_json_response(response):
+    """
+    ใส่ weak ETag จาก hash ของเนื้อหา ตอบ 304 ถ้า If-None-Match ตรงกัน
+    และบีบอัดด้วย brotli หรือ gzip ตามที่ผู้ขอรองรับ
+
+    Args:
+        response (Response): response ของ Flask
+
+    Returns:
+        Response: response ที่ใส่ ETag และบีบอัดแล้ว
+    """
+    # ข้าม response แบบ stream (เช่น Server-Sent Events) และ response ที่ไม่ใช่ JSON
+    if (response.is_streamed or response.direct_passthrough or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    if request.method in ('GET', 'HEAD') and response.status_code == 200:
+        if not response.headers.get('ETag'):
+            response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest(), weak=True)
+        # ข้อมูลเป็นของผู้ใช้แต่ละคน จึงให้เบราว์เซอร์เก็บไว้ได้แต่ต้องตรวจสอบ ETag ทุกครั้ง
+        response.headers.setdefault('Cache-Control', 'private, no-cache')
+        # ใส่ Vary ก่อนตอบ 304 ด้วย เพื่อให้ cache แยก response ที่บีบอัดต่างกันเหมือน response 200
+        response.vary.add('Accept-Encoding')
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    return compress_response(response)
+
+def compress_response(response):
+    """
+    บีบอัด body ของ response ถ้าใหญ่กว่าขนาดที่กำหนด
+
+    Args:
+        response (Response): response ของ Flask
+
+    Returns:
+        Response: response ที่บีบอัดแล้ว หรือ response เดิม
+    """
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < API_COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding, compressed = 'br', brotli.compress(data, quality=API_BROTLI_QUALITY)
+    elif accepted['gzip']:
+        encoding, compressed = 'gzip', gzip.compress(data, compresslevel=API_GZIP_LEVEL)
+    else:
+        return response
+
+    if API_LOG_RESPONSE_SIZES:
+        print(f"{request.method} {request.path}: {len(data)} -> {len(compressed)} bytes ({encoding})")
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response